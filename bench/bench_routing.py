@@ -0,0 +1,123 @@
+"""Стоимость маршрутизации сообщения в зависимости от числа обработчиков состояний.
+
+Сравнивает два способа на одном и том же telebot.TeleBot без сети:
+
+    chain   — как было в main.py: на каждое состояние свой message_handler с лямбда-фильтром,
+              который ищет контекст пользователя и проверяет в нём ключ;
+    state   — как сейчас: один обработчик, который находит функцию по состоянию из контекста.
+
+Перед обработчиками состояний в обоих вариантах зарегистрированы команды, как в боте.
+Время — на одно сообщение, усреднённое по потоку сообщений от пользователей в случайных
+состояниях (и от пользователей вне диалога, которым нужен полный проход по фильтрам):
+
+    python bench/bench_routing.py --handlers 4 --handlers 16 --handlers 64 --handlers 256
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import telebot  # noqa: E402
+from telebot import types  # noqa: E402
+
+from replay import update_from_record  # noqa: E402
+
+DEFAULT_HANDLERS = (4, 16, 64, 256)
+COMMANDS = ("start", "mistakes", "add_word", "quiz", "stats")
+
+
+def make_bot(commands):
+    bot = telebot.TeleBot("123456:bench", threaded=False)
+    for command in commands:
+        bot.register_message_handler(lambda message: None, commands=[command])
+    return bot
+
+
+def chain_bot(states, contexts, handled):
+    """Обработчик с фильтром на каждое состояние, как прежние лямбды над user_context."""
+    bot = make_bot(COMMANDS)
+    for state in states:
+        bot.register_message_handler(
+            lambda message: handled.append(message),
+            func=lambda message, state=state: str(message.chat.id) in contexts and contexts[
+                str(message.chat.id)].get("mode") == state)
+    return bot
+
+
+def state_bot(states, contexts, handled):
+    """Один обработчик-диспетчер: состояние -> функция."""
+    handlers = {state: handled.append for state in states}
+
+    def route(message):
+        context = contexts.get(str(message.chat.id))
+        return handlers.get(context.get("mode")) if context else None
+
+    bot = make_bot(COMMANDS)
+    bot.register_message_handler(lambda message: route(message)(message),
+                                 func=lambda message: route(message) is not None)
+    return bot
+
+
+def make_messages(count, users, idle_ratio, rng):
+    messages = []
+    for update_id in range(count):
+        chat_id = rng.randrange(users) if rng.random() >= idle_ratio else users + rng.randrange(users)
+        update = update_from_record(update_id, {"k": "m", "c": chat_id, "x": "ответ"})
+        messages.append(types.Message.de_json(update["message"]))
+    return messages
+
+
+def measure(bot, messages, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        bot.process_new_messages(messages)
+        samples.append((time.perf_counter() - started) / len(messages))
+    return sorted(samples)[len(samples) // 2]
+
+
+def run(handler_count, args):
+    rng = random.Random(args.seed)
+    states = [f"state{index}" for index in range(handler_count)]
+    # Пользователи 0..users-1 в диалоге, остальные — без контекста
+    contexts = {str(user): {"mode": rng.choice(states)} for user in range(args.users)}
+    messages = make_messages(args.messages, args.users, args.idle_ratio, rng)
+    result = {"handlers": handler_count}
+    for name, factory in (("chain", chain_bot), ("state", state_bot)):
+        handled = []
+        bot = factory(states, contexts, handled)
+        result[f"{name}_us"] = measure(bot, messages, args.repeat) * 1e6
+        expected = sum(1 for message in messages if str(message.chat.id) in contexts) * args.repeat
+        if len(handled) != expected:
+            raise RuntimeError(f"{name}: обработано {len(handled)} сообщений вместо {expected}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--handlers", action="append", type=int,
+                        help=f"число обработчиков состояний (по умолчанию {', '.join(map(str, DEFAULT_HANDLERS))})")
+    parser.add_argument("--users", type=int, default=1000, help="пользователей в диалоге")
+    parser.add_argument("--idle-ratio", type=float, default=0.2, help="доля сообщений вне диалога")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5, help="повторов (берётся медиана)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = [run(count, args) for count in args.handlers or DEFAULT_HANDLERS]
+    print(f"{'обработчиков':>12} {'chain, мкс':>11} {'state, мкс':>11} {'ускорение':>10}")
+    for row in results:
+        print(f"{row['handlers']:>12} {row['chain_us']:>11.2f} {row['state_us']:>11.2f} "
+              f"{row['chain_us'] / row['state_us']:>9.1f}x")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Сравнение JSON и двоичных снимков (snapshot.py) на синтетических данных.
+
+Для каждой точки масштаба измеряет размер файла, время загрузки и пиковую память (RSS)
+для json.load, открытия снимка с чтением одного пользователя и полного декодирования
+снимка, а также время сохранения после изменения одного пользователя:
+
+    python bench/bench_snapshot.py --scale 1000x10x50 --scale 5000x10x50
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [BENCH_DIR, REPO_DIR]
+
+import snapshot  # noqa: E402
+from bench_storage import parse_scale  # noqa: E402
+from gen_dataset import generate  # noqa: E402
+
+DEFAULT_SCALES = ("1000x10x50", "5000x10x50")
+FILES = ("user_categories.json", "errors.json")
+
+# Каждый сценарий — отдельный процесс, чтобы пиковый RSS относился только к нему
+PROBE = r"""
+import json, resource, sys, time
+sys.path.insert(0, {repo!r})
+import snapshot
+path, scenario, user = sys.argv[1:4]
+
+def peak_rss():
+    # VmHWM сбрасывается при exec, а ru_maxrss может унаследовать пик родителя
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+started = time.perf_counter()
+if scenario == "json_load":
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    data.get(user)
+elif scenario == "json_save":
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    data[user] = {{"Новая": []}}
+    started = time.perf_counter()
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False, indent=4)
+else:
+    data = snapshot.load(path)
+    if scenario == "snapshot_user":
+        data.get(user)
+    elif scenario == "snapshot_full":
+        dict(data.items())
+    elif scenario == "snapshot_save":
+        data[user] = {{"Новая": []}}
+        started = time.perf_counter()
+        snapshot.save(path, data)
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "peak_rss_bytes": peak_rss()}}))
+"""
+SCENARIOS = (("json_load", "json"), ("snapshot_user", "snap"), ("snapshot_full", "snap"),
+             ("json_save", "json"), ("snapshot_save", "snap"))
+
+
+def run_probe(path, scenario, user):
+    completed = subprocess.run([sys.executable, "-c", PROBE.format(repo=REPO_DIR), path, scenario, user],
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Сценарий {scenario} завершился с ошибкой:\n{completed.stderr}")
+    return json.loads(completed.stdout)
+
+
+def measure_file(data_dir, name, user):
+    json_path = os.path.join(data_dir, name)
+    snap_path = snapshot.snapshot_path(json_path)
+    snapshot.convert_to_snapshot(json_path, snap_path)
+    row = {"file": name, "json_bytes": os.path.getsize(json_path), "snapshot_bytes": os.path.getsize(snap_path)}
+    for scenario, kind in SCENARIOS:
+        row[scenario] = run_probe(json_path if kind == "json" else snap_path, scenario, user)
+    return row
+
+
+def print_results(results):
+    print(f"{'масштаб':<14} {'файл':<22} {'JSON, МБ':>9} {'снимок, МБ':>11}  "
+          + "  ".join(f"{scenario:>22}" for scenario, _ in SCENARIOS))
+    for row in results:
+        cells = [f"{row[scenario]['seconds']:>8.3f} с {row[scenario]['peak_rss_bytes'] / 2 ** 20:>7.1f} МБ"
+                 for scenario, _ in SCENARIOS]
+        print(f"{row['scale']:<14} {row['file']:<22} {row['json_bytes'] / 2 ** 20:>9.1f} "
+              f"{row['snapshot_bytes'] / 2 ** 20:>11.1f}  " + "  ".join(f"{cell:>22}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", action="append", type=parse_scale,
+                        help=f"ПОЛЬЗОВАТЕЛИxКАТЕГОРИИxСЛОВА (по умолчанию {', '.join(DEFAULT_SCALES)})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = []
+    for users, categories, words in args.scale or [parse_scale(scale) for scale in DEFAULT_SCALES]:
+        data_dir = tempfile.mkdtemp(prefix="bot-snapshot-")
+        try:
+            stats = generate(data_dir, users, categories, words, seed=args.seed)
+            for name in FILES:
+                row = measure_file(data_dir, name, stats["last_user"])
+                row["scale"] = f"{users}x{categories}x{words}"
+                results.append(row)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
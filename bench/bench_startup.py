@@ -0,0 +1,95 @@
+"""Время холодного старта бота на синтетических данных (bench/gen_dataset.py).
+
+Для каждой точки масштаба и режима загрузки (STARTUP_MODE=eager|lazy) запускает main.py
+против bench/fake_telegram.py и измеряет, через сколько бот начинает polling и отвечает
+на /start пользователю из начала и из конца user_categories.json:
+
+    python bench/bench_startup.py --scale 1000x10x50 --scale 10000x10x50
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_storage import parse_scale  # noqa: E402
+from fake_telegram import FakeTelegramServer  # noqa: E402
+from gen_dataset import generate  # noqa: E402
+from load_test import start_bot  # noqa: E402
+
+DEFAULT_SCALES = ("100x10x50", "1000x10x50", "5000x10x50")
+MODES = ("eager", "lazy")
+
+
+def time_to_reply(server, chat_id, started, timeout):
+    since = server.mark(chat_id)
+    server.push_message(chat_id, "/start")
+    message, _ = server.wait_for(chat_id, since, timeout=timeout)
+    return message["time"] - started if message else None
+
+
+def measure(data_dir, stats, mode, timeout):
+    server = FakeTelegramServer().start()
+    started = time.monotonic()
+    process, log = start_bot(server, data_dir, {"STARTUP_MODE": mode, "PREBUILD_INDEXES": "1"})
+    try:
+        result = {"mode": mode, "polling_s": time.monotonic() - started}
+        for name in ("first_user", "last_user"):
+            seconds = time_to_reply(server, int(stats[name]), started, timeout)
+            result[f"{name}_reply_s"] = seconds
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        server.stop()
+    return result
+
+
+def print_results(results):
+    print(f"{'масштаб':<18} {'режим':<6} {'данные, МБ':>10} {'polling, с':>11} {'/start первого, с':>18} "
+          f"{'/start последнего, с':>21}")
+    for row in results:
+        replies = [f"{row[key]:.2f}" if row[key] is not None else "таймаут"
+                   for key in ("first_user_reply_s", "last_user_reply_s")]
+        print(f"{row['scale']:<18} {row['mode']:<6} {row['data_bytes'] / 2 ** 20:>10.1f} {row['polling_s']:>11.2f} "
+              f"{replies[0]:>18} {replies[1]:>21}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", action="append", type=parse_scale,
+                        help=f"ПОЛЬЗОВАТЕЛИxКАТЕГОРИИxСЛОВА (по умолчанию {', '.join(DEFAULT_SCALES)})")
+    parser.add_argument("--mode", action="append", choices=MODES, help="режим загрузки (по умолчанию оба)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="ожидание ответа бота, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = []
+    for users, categories, words in args.scale or [parse_scale(scale) for scale in DEFAULT_SCALES]:
+        data_dir = tempfile.mkdtemp(prefix="bot-startup-")
+        try:
+            stats = generate(data_dir, users, categories, words, seed=args.seed)
+            for mode in args.mode or MODES:
+                row = measure(data_dir, stats, mode, args.timeout)
+                row.update(scale=f"{users}x{categories}x{words}", data_bytes=stats["bytes"])
+                results.append(row)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Замеры хранения данных на синтетических наборах разного масштаба (bench/gen_dataset.py).
+
+Для каждой точки масштаба генерирует данные и в отдельном процессе измеряет время запуска
+(импорт main.py с загрузкой JSON), пиковый RSS, стоимость save_json для каждого файла,
+один тик планировщика и открытие /mistakes у пользователя с наибольшим числом ошибок:
+
+    python bench/bench_storage.py --scale 1000x10x50 --scale 10000x20x100 --json storage.json
+
+Точка масштаба записывается как ПОЛЬЗОВАТЕЛИxКАТЕГОРИИxСЛОВА.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from gen_dataset import generate  # noqa: E402
+
+DEFAULT_SCALES = ("100x10x50", "1000x10x50", "10000x10x50")
+
+# Выполняется в каталоге с данными: время и память считаются только для самого бота
+PROBE = r"""
+import json, resource, sys, time
+sys.path[:0] = [{repo!r}, {bench!r}]
+from telebot import apihelper
+from replay import make_stub_sender, update_from_record
+apihelper.CUSTOM_REQUEST_SENDER = make_stub_sender()
+
+def peak_rss():
+    # VmHWM сбрасывается при exec, а ru_maxrss может унаследовать пик родителя
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+started = time.perf_counter()
+import main
+result = {{"startup_s": time.perf_counter() - started}}
+main.bot.threaded = False
+
+def median_time(action, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        action()
+        samples.append(time.perf_counter() - started)
+    return sorted(samples)[len(samples) // 2]
+
+result["save_json_s"] = {{
+    name: median_time(lambda: main.save_json(name, data), {repeat})
+    for name, data in (("user_categories.json", main.user_categories), ("errors.json", main.errors),
+                       ("quiz_schedule.json", main.quiz_schedule))
+}}
+result["scheduler_tick_s"] = median_time(main.send_scheduled_quizzes, {repeat})
+if main.errors:
+    user_id = max(main.errors, key=lambda user: sum(len(words) for words in main.errors[user].values()))
+    update = main.telebot.types.Update.de_json(update_from_record(1, {{"k": "m", "c": int(user_id), "x": "/mistakes"}}))
+    result["mistakes_view_s"] = median_time(lambda: main.bot.process_new_updates([update]), {repeat})
+result["peak_rss_bytes"] = peak_rss()
+print(json.dumps(result))
+"""
+
+
+def parse_scale(text):
+    try:
+        users, categories, words = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается ПОЛЬЗОВАТЕЛИxКАТЕГОРИИxСЛОВА, получено {text!r}")
+    return users, categories, words
+
+
+def measure(data_dir, repeat):
+    # Данные читаются при импорте, чтобы время запуска включало загрузку (холодный старт — bench_startup.py)
+    env = dict(os.environ, BOT_TOKEN="123456:bench", STARTUP_MODE="eager")
+    env.pop("RECORD_UPDATES", None)
+    env.pop("METRICS_PORT", None)
+    probe = PROBE.format(repo=REPO_DIR, bench=BENCH_DIR, repeat=repeat)
+    completed = subprocess.run([sys.executable, "-c", probe], cwd=data_dir, env=env,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Замер завершился с ошибкой:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_scale(scale, args):
+    users, categories, words = scale
+    data_dir = tempfile.mkdtemp(prefix="bot-storage-")
+    try:
+        stats = generate(data_dir, users, categories, words, seed=args.seed)
+        result = measure(data_dir, args.repeat)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    result.update(scale=f"{users}x{categories}x{words}", words=stats["words"], errors=stats["errors"],
+                  data_bytes=stats["bytes"])
+    return result
+
+
+def print_results(results):
+    print(f"{'масштаб':<18} {'данные, МБ':>10} {'запуск, с':>10} {'RSS, МБ':>9} {'save cats, мс':>14} "
+          f"{'save errors, мс':>16} {'тик, мс':>9} {'/mistakes, мс':>14}")
+    for row in results:
+        saves = row["save_json_s"]
+        print(f"{row['scale']:<18} {row['data_bytes'] / 2 ** 20:>10.1f} {row['startup_s']:>10.2f} "
+              f"{row['peak_rss_bytes'] / 2 ** 20:>9.1f} {saves['user_categories.json'] * 1000:>14.1f} "
+              f"{saves['errors.json'] * 1000:>16.1f} {row['scheduler_tick_s'] * 1000:>9.2f} "
+              f"{row.get('mistakes_view_s', 0.0) * 1000:>14.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", action="append", type=parse_scale,
+                        help=f"точка масштаба (по умолчанию {', '.join(DEFAULT_SCALES)})")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов каждой операции (берётся медиана)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    scales = args.scale or [parse_scale(scale) for scale in DEFAULT_SCALES]
+    results = [run_scale(scale, args) for scale in scales]
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Локальная замена Telegram Bot API для нагрузочных тестов.
+
+Реализует getUpdates (long polling), sendMessage, editMessageText, deleteMessage,
+answerCallbackQuery и несколько служебных методов. Обновления добавляются через
+push_message()/push_callback(), а ответы бота ждут через wait_for().
+
+Бот подключается к серверу через переменную окружения TELEGRAM_API_URL.
+"""
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+
+class FakeTelegramServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.updates = []  # Очередь обновлений для getUpdates
+        self.outgoing = {}  # chat_id -> список сообщений бота
+        self.files = {}  # file_id -> содержимое для download_file
+        self.calls = {}  # Имя метода -> количество вызовов
+        self.condition = threading.Condition()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        # Обрывы соединений при остановке бота — не ошибка теста
+        self.httpd.handle_error = lambda request, client_address: None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="fake-telegram", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # ---------- Входящие обновления ----------
+    def _push(self, update):
+        with self.condition:
+            update["update_id"] = next(self._update_ids)
+            self.updates.append(update)
+            self.condition.notify_all()
+        return update["update_id"]
+
+    def push_message(self, chat_id, text=None, document=None):
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+        }
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if document is not None:
+            message["document"] = document
+        return self._push({"message": message})
+
+    def push_callback(self, chat_id, data, message_id=1):
+        return self._push({"callback_query": {
+            "id": str(next(self._callback_ids)),
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": "",
+            },
+        }})
+
+    # ---------- Исходящие сообщения ----------
+    def mark(self, chat_id):
+        """Позиция, начиная с которой wait_for() ищет новые сообщения чата."""
+        with self.condition:
+            return len(self.outgoing.get(chat_id, []))
+
+    def wait_for(self, chat_id, since, predicate=None, timeout=10.0):
+        """Ждёт сообщение бота в чате после позиции since, подходящее под predicate.
+
+        Возвращает (сообщение, позиция после него) или (None, since) по таймауту.
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                messages = self.outgoing.get(chat_id, [])
+                for position in range(since, len(messages)):
+                    if predicate is None or predicate(messages[position]):
+                        return messages[position], position + 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, since
+                self.condition.wait(remaining)
+
+    def _record(self, method, params):
+        chat_id = params.get("chat_id")
+        message = {
+            "method": method,
+            "time": time.monotonic(),
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "chat_id": int(chat_id) if chat_id is not None else None,
+            "text": params.get("text") or params.get("caption") or "",
+            "reply_markup": json.loads(params["reply_markup"]) if params.get("reply_markup") else None,
+        }
+        with self.condition:
+            if message["chat_id"] is not None:
+                self.outgoing.setdefault(message["chat_id"], []).append(message)
+            self.condition.notify_all()
+        return message
+
+    # ---------- Bot API ----------
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            # Подтверждённые обновления больше не нужны
+            if offset:
+                self.updates = [update for update in self.updates if update["update_id"] >= offset]
+            while not self.updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return self.updates[:limit]
+
+    def handle(self, method, params):
+        with self.condition:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            message = self._record(method, params)
+            return {
+                "message_id": message["message_id"],
+                "date": int(time.time()),
+                "chat": {"id": message["chat_id"], "type": "private"},
+                "from": BOT_USER,
+                "text": message["text"],
+            }
+        if method == "deleteMessage":
+            self._record(method, params)
+            return True
+        if method == "getFile":
+            return {"file_id": params["file_id"], "file_unique_id": params["file_id"],
+                    "file_path": params["file_id"]}
+        # answerCallbackQuery и прочие методы просто подтверждаются
+        return True
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _params(self):
+                parsed = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if body and self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    params.update({key: values[-1] for key, values in parse_qs(body.decode()).items()})
+                return parsed.path, params
+
+            def _reply(self, status, payload):
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _dispatch(self):
+                path, params = self._params()
+                parts = path.strip("/").split("/")
+                if len(parts) == 3 and parts[0] == "file":
+                    content = server.files.get(parts[2])
+                    if content is None:
+                        self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                    else:
+                        self._reply(200, content)
+                    return
+                if len(parts) != 2 or not parts[0].startswith("bot"):
+                    self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                    return
+                result = server.handle(parts[1], params)
+                self._reply(200, {"ok": True, "result": result})
+
+            do_GET = _dispatch
+            do_POST = _dispatch
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Локальный Bot API для ручной проверки бота")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    fake = FakeTelegramServer(port=args.port).start()
+    print(f"TELEGRAM_API_URL={fake.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,154 @@
+"""Генератор синтетических данных бота для проверки масштабирования.
+
+Создаёт user_categories.json, errors.json (число ошибок по закону Ципфа), quiz_schedule.json,
+categories_for_all_users.json и allowed_users.json в том же формате, что пишет save_json.
+Файлы пишутся потоково, по одному пользователю, поэтому память не растёт вместе с объёмом.
+При одинаковом --seed результат побайтно совпадает:
+
+    python bench/gen_dataset.py ./data --users 100000 --categories 50 --words 200 --seed 1
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONSONANTS = "бвгджзклмнпрстфхцчшщ"
+VOWELS = "аеиоуыэюя"
+MAX_ERROR_COUNT = 50  # Верхняя граница числа ошибок по одному слову
+
+
+def make_word(rng):
+    """Слово из 2–4 слогов в виде пары (неверное ударение, верное ударение)."""
+    syllables = [rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(2, 4))]
+    if rng.random() < 0.5:
+        syllables[-1] += rng.choice(CONSONANTS)
+    # Позиции гласных: второй символ каждого слога
+    stressed, wrong = rng.sample(range(len(syllables)), 2)
+
+    def with_stress(position):
+        return "".join(syllable[0] + syllable[1].upper() + syllable[2:] if index == position else syllable
+                       for index, syllable in enumerate(syllables))
+
+    return with_stress(wrong), with_stress(stressed)
+
+
+def make_category(rng, words):
+    """Список слов категории без повторов."""
+    seen = set()
+    result = []
+    while len(result) < words:
+        wrong, correct = make_word(rng)
+        if correct.lower() in seen:
+            continue
+        seen.add(correct.lower())
+        result.append({"question": f"{wrong}←{correct}", "correct": correct})
+    return result
+
+
+def category_name(rng, index):
+    return f"{rng.choice(['Ударения', 'Паронимы', 'Приставки', 'Суффиксы', 'Н и НН'])} №{index + 1}"
+
+
+def zipf_weights(exponent, limit=MAX_ERROR_COUNT):
+    """Накопленные веса для выбора числа ошибок k ∈ [1, limit] с вероятностью ~ 1 / k^s."""
+    cumulative = []
+    total = 0.0
+    for count in range(1, limit + 1):
+        total += 1 / count ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+class JsonObjectWriter:
+    """Потоковая запись словаря верхнего уровня в формате json.dump(..., indent=4)."""
+
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.empty = True
+
+    def add(self, key, value):
+        # Сериализуем пару как словарь из одного элемента и убираем внешние скобки
+        item = json.dumps({key: value}, ensure_ascii=False, indent=4)[2:-2]
+        self.file.write(("{\n" if self.empty else ",\n") + item)
+        self.empty = False
+
+    def close(self):
+        self.file.write("{}" if self.empty else "\n}")
+        self.file.close()
+
+
+def generate(output_dir, users=1000, categories=10, words=50, error_ratio=0.2, zipf_exponent=1.2,
+             schedule_ratio=0.3, shared_categories=5, shared_words=100, allowed=5, seed=1):
+    """Записывает набор данных в output_dir и возвращает краткую статистику."""
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    error_weights = zipf_weights(zipf_exponent)
+    counts = range(1, len(error_weights) + 1)
+    stats = {"users": users, "words": 0, "errors": 0, "scheduled": 0}
+
+    user_ids = rng.sample(range(100_000_000, 7_000_000_000), users)
+    schedule = {}
+    categories_writer = JsonObjectWriter(os.path.join(output_dir, "user_categories.json"))
+    errors_writer = JsonObjectWriter(os.path.join(output_dir, "errors.json"))
+    try:
+        for user_id in user_ids:
+            user_words = {category_name(rng, index): make_category(rng, words) for index in range(categories)}
+            user_errors = {}
+            for name, category_words in user_words.items():
+                mistaken = [word for word in category_words if rng.random() < error_ratio]
+                if mistaken:
+                    user_errors[name] = {
+                        word["question"]: rng.choices(counts, cum_weights=error_weights)[0] for word in mistaken
+                    }
+                    stats["errors"] += len(mistaken)
+            categories_writer.add(str(user_id), user_words)
+            if user_errors:
+                errors_writer.add(str(user_id), user_errors)
+            if rng.random() < schedule_ratio:
+                times = {f"{rng.randrange(7, 23):02d}:{rng.randrange(0, 60, 5):02d}" for _ in range(rng.randint(1, 3))}
+                schedule[str(user_id)] = sorted(times)
+            stats["words"] += categories * words
+    finally:
+        categories_writer.close()
+        errors_writer.close()
+    stats["scheduled"] = len(schedule)
+    # Первый и последний пользователь в файле — для замеров «раньше/позже прочитанных» данных
+    stats["first_user"], stats["last_user"] = (str(user_ids[0]), str(user_ids[-1])) if user_ids else (None, None)
+
+    shared = {category_name(rng, index): make_category(rng, shared_words) for index in range(shared_categories)}
+    for name, data in (("quiz_schedule.json", schedule), ("categories_for_all_users.json", shared),
+                       ("allowed_users.json", [str(user_id) for user_id in user_ids[:allowed]])):
+        with open(os.path.join(output_dir, name), "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False, indent=4)
+    shutil.copy(os.path.join(REPO_DIR, "allowed_symbols.json"), output_dir)
+
+    stats["bytes"] = sum(os.path.getsize(os.path.join(output_dir, name)) for name in os.listdir(output_dir))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("output", help="каталог для файлов данных")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--categories", type=int, default=10, help="категорий у пользователя")
+    parser.add_argument("--words", type=int, default=50, help="слов в категории")
+    parser.add_argument("--error-ratio", type=float, default=0.2, help="доля слов с ошибками")
+    parser.add_argument("--zipf", type=float, default=1.2, help="показатель распределения числа ошибок")
+    parser.add_argument("--schedule-ratio", type=float, default=0.3, help="доля пользователей с напоминаниями")
+    parser.add_argument("--shared-categories", type=int, default=5, help="категорий в общей колоде")
+    parser.add_argument("--shared-words", type=int, default=100, help="слов в категории общей колоды")
+    parser.add_argument("--allowed", type=int, default=5, help="пользователей в allowed_users.json")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    stats = generate(args.output, args.users, args.categories, args.words, args.error_ratio, args.zipf,
+                     args.schedule_ratio, args.shared_categories, args.shared_words, args.allowed, args.seed)
+    print(f"Пользователей: {stats['users']}, слов: {stats['words']}, ошибок: {stats['errors']}, "
+          f"с напоминаниями: {stats['scheduled']}, объём: {stats['bytes'] / 2 ** 20:.1f} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""Нагрузочный тест бота против локального Bot API (bench/fake_telegram.py).
+
+Запускает main.py отдельным процессом во временном каталоге с подготовленными данными
+и моделирует N одновременных пользователей: /start → категория → ответы на вопросы,
+просмотр /mistakes с листанием и массовое добавление слов через /add_word.
+Сеть не нужна, тест можно запускать в CI:
+
+    python bench/load_test.py --users 50 --rounds 3 --max-p99-ms 500
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegramServer  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_PATH = os.path.join(REPO_DIR, "main.py")
+FIRST_CHAT_ID = 100000
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(percent / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def correct_word(index):
+    return f"верно{index}"
+
+
+def wrong_word(index):
+    return f"неверно{index}"
+
+
+def prepare_workdir(users, categories, words):
+    """Создаёт каталог с файлами данных для бота."""
+    workdir = tempfile.mkdtemp(prefix="bot-load-")
+    shutil.copy(os.path.join(REPO_DIR, "allowed_symbols.json"), workdir)
+    user_categories = {}
+    for user in range(users):
+        user_categories[str(FIRST_CHAT_ID + user)] = {
+            f"Категория №{category + 1}": [
+                {"question": f"{wrong_word(word)}←{correct_word(word)}", "correct": correct_word(word)}
+                for word in range(category * words, (category + 1) * words)
+            ]
+            for category in range(categories)
+        }
+    shared = {"Общая": [{"question": f"{wrong_word(word)}←{correct_word(word)}", "correct": correct_word(word)}
+                        for word in range(words)]}
+    for name, data in (("user_categories.json", user_categories), ("errors.json", {}),
+                       ("categories_for_all_users.json", shared), ("allowed_users.json", []),
+                       ("quiz_schedule.json", {})):
+        with open(os.path.join(workdir, name), "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False)
+    return workdir
+
+
+def has_keyboard(kind):
+    return lambda message: bool(message["reply_markup"]) and kind in message["reply_markup"]
+
+
+def text_contains(*parts):
+    return lambda message: any(part in message["text"] for part in parts)
+
+
+def inline_buttons(message):
+    return [button for row in message["reply_markup"]["inline_keyboard"] for button in row]
+
+
+class SimulatedUser:
+    def __init__(self, server, chat_id, args, results):
+        self.server = server
+        self.chat_id = chat_id
+        self.args = args
+        self.results = results
+        self.random = random.Random(chat_id)
+        self.position = 0
+        self.added_words = 0
+
+    def step(self, name, send, predicate, since=None):
+        """Отправляет обновление и ждёт подходящий ответ бота, записывая задержку."""
+        start_position = self.server.mark(self.chat_id) if since is None else since
+        started = time.monotonic()
+        send()
+        message, self.position = self.server.wait_for(self.chat_id, start_position, predicate,
+                                                      timeout=self.args.timeout)
+        if message is None:
+            self.results.timeout(name)
+            return None
+        self.results.record(name, message["time"] - started)
+        return message
+
+    def text(self, name, text, predicate):
+        return self.step(name, lambda: self.server.push_message(self.chat_id, text), predicate)
+
+    def callback(self, name, data, message_id, predicate):
+        return self.step(name, lambda: self.server.push_callback(self.chat_id, data, message_id), predicate)
+
+    def quiz(self):
+        menu = self.text("start", "/start", has_keyboard("inline_keyboard"))
+        if not menu:
+            return
+        button = self.random.choice(inline_buttons(menu))
+        question = self.callback("choose_category", button["callback_data"], menu["message_id"],
+                                 has_keyboard("keyboard"))
+        for _ in range(self.args.answers):
+            if not question:
+                return
+            options = [button["text"] for row in question["reply_markup"]["keyboard"] for button in row]
+            answer = next((option for option in options if option.startswith("верно")), options[0])
+            if self.random.random() > self.args.accuracy:
+                answer = next((option for option in options if option != answer), answer)
+            question = self.text("answer", answer,
+                                 lambda message: has_keyboard("keyboard")(message)
+                                 or "завершена" in message["text"])
+            if question and not has_keyboard("keyboard")(question):
+                return
+
+    def mistakes(self):
+        menu = self.text("mistakes", "/mistakes", lambda message: has_keyboard("inline_keyboard")(message)
+                         or "нет ошибок" in message["text"])
+        if not menu or not menu["reply_markup"]:
+            return
+        button = self.random.choice(inline_buttons(menu))
+        page = self.callback("mistakes_category", button["callback_data"], menu["message_id"],
+                             text_contains("Ошибки категории"))
+        if not page:
+            return
+        next_buttons = [b for b in inline_buttons(page) if b["callback_data"].startswith("mistakes_cat_next:")]
+        if next_buttons:
+            self.callback("mistakes_page", next_buttons[0]["callback_data"], page["message_id"],
+                          lambda message: message["method"] == "editMessageText")
+        self.callback("mistakes_close", "mistakes_cat_close", page["message_id"],
+                      lambda message: message["method"] == "deleteMessage")
+
+    def bulk_add(self):
+        menu = self.text("add_word", "/add_word", has_keyboard("inline_keyboard"))
+        if not menu:
+            return
+        existing = [b for b in inline_buttons(menu) if b["callback_data"] != "add_word_category:new"]
+        if not existing or not self.callback("add_word_category", existing[0]["callback_data"],
+                                             menu["message_id"], text_contains("режим добавления")):
+            return
+        if not self.text("bulk_mode", "Массовое добавление", text_contains("режим массового добавления")):
+            return
+        pairs = []
+        for _ in range(self.args.bulk_words):
+            self.added_words += 1
+            index = f"{self.chat_id}x{self.added_words}"
+            pairs.append(f"{wrong_word(index)}\n{correct_word(index)}")
+        self.text("bulk_paste", "\n\n".join(pairs), text_contains("Добавлено", "дубликатов"))
+        self.text("bulk_done", "Готово", text_contains("завершено"))
+
+    def run(self):
+        for _ in range(self.args.rounds):
+            self.quiz()
+            self.mistakes()
+            if self.random.random() < self.args.bulk_ratio:
+                self.bulk_add()
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.timeouts = {}
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+
+    def timeout(self, name):
+        with self.lock:
+            self.timeouts[name] = self.timeouts.get(name, 0) + 1
+
+    def summary(self, elapsed):
+        rows = {}
+        everything = []
+        for name in sorted(self.latencies.keys() | self.timeouts.keys()):
+            values = sorted(self.latencies.get(name, []))
+            everything.extend(values)
+            rows[name] = self.row(values, self.timeouts.get(name, 0))
+        everything.sort()
+        total = self.row(everything, sum(self.timeouts.values()))
+        total["throughput"] = len(everything) / elapsed if elapsed else 0.0
+        return {"elapsed": elapsed, "total": total, "steps": rows}
+
+    @staticmethod
+    def row(values, timeouts):
+        return {
+            "count": len(values),
+            "timeouts": timeouts,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": (values[-1] if values else 0.0) * 1000,
+        }
+
+
+def print_summary(summary, args):
+    print(f"Пользователей: {args.users}, длительность: {summary['elapsed']:.1f} с, "
+          f"пропускная способность: {summary['total']['throughput']:.1f} ответов/с")
+    print(f"{'шаг':<20} {'кол-во':>7} {'таймауты':>9} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'max, мс':>9}")
+    for name, row in list(summary["steps"].items()) + [("ВСЕГО", summary["total"])]:
+        print(f"{name:<20} {row['count']:>7} {row['timeouts']:>9} {row['p50_ms']:>9.1f} "
+              f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}")
+
+
+def start_bot(server, workdir, extra_env=None):
+    env = dict(os.environ, BOT_TOKEN="123456:bench", TELEGRAM_API_URL=server.url, **(extra_env or {}))
+    log = open(os.path.join(workdir, "bot.log"), "w")
+    process = subprocess.Popen([sys.executable, MAIN_PATH], cwd=workdir, env=env, stdout=log, stderr=log)
+    deadline = time.monotonic() + 30
+    while not server.calls.get("getUpdates"):
+        if process.poll() is not None or time.monotonic() > deadline:
+            log.close()
+            with open(os.path.join(workdir, "bot.log"), encoding="utf-8", errors="replace") as file:
+                raise RuntimeError(f"Бот не запустился:\n{file.read()}")
+        time.sleep(0.05)
+    return process, log
+
+
+def run_load_test(args):
+    workdir = prepare_workdir(args.users, args.categories, args.words)
+    server = FakeTelegramServer().start()
+    extra_env = {"RECORD_UPDATES": os.path.abspath(args.record)} if args.record else None
+    process, log = start_bot(server, workdir, extra_env)
+    results = Results()
+    try:
+        users = [SimulatedUser(server, FIRST_CHAT_ID + index, args, results) for index in range(args.users)]
+        threads = [threading.Thread(target=user.run, daemon=True) for user in users]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        server.stop()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    summary = results.summary(elapsed)
+    summary["api_calls"] = dict(server.calls)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=20, help="одновременных пользователей")
+    parser.add_argument("--rounds", type=int, default=2, help="сценариев на пользователя")
+    parser.add_argument("--answers", type=int, default=10, help="ответов за одну викторину")
+    parser.add_argument("--accuracy", type=float, default=0.8, help="доля верных ответов")
+    parser.add_argument("--categories", type=int, default=3, help="категорий у пользователя")
+    parser.add_argument("--words", type=int, default=30, help="слов в категории")
+    parser.add_argument("--bulk-ratio", type=float, default=0.3, help="вероятность массового добавления")
+    parser.add_argument("--bulk-words", type=int, default=20, help="слов в одной вставке")
+    parser.add_argument("--timeout", type=float, default=10.0, help="ожидание ответа бота, с")
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    parser.add_argument("--max-p99-ms", type=float, help="завершиться с ошибкой, если p99 выше порога")
+    parser.add_argument("--record", help="записать входящие обновления в журнал для bench/replay.py")
+    parser.add_argument("--keep-workdir", action="store_true", help="не удалять каталог с данными и логом")
+    args = parser.parse_args()
+
+    summary = run_load_test(args)
+    print_summary(summary, args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(summary, file, ensure_ascii=False, indent=4)
+
+    failed = summary["total"]["timeouts"] > 0
+    if args.max_p99_ms is not None and summary["total"]["p99_ms"] > args.max_p99_ms:
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
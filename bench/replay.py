@@ -0,0 +1,287 @@
+"""Воспроизведение записанного потока обновлений для сравнения производительности веток.
+
+Журнал пишет сам бот, если задать RECORD_UPDATES=путь (см. README). Воспроизведение идёт
+в этом же процессе: main.py импортируется с заглушкой вместо Telegram API, обновления
+подаются в bot.process_new_updates с исходными интервалами (1x), ускоренно (Nx) или
+без пауз (max). Обновления одного чата обрабатываются по порядку, разных — параллельно.
+
+    python bench/replay.py updates.jsonl --data ./snapshot --speed 10 --json branch.json
+
+Идентификаторы чатов в журнале обезличены. Если запись шла с известной солью RECORD_SALT,
+передайте её через --salt: ключи пользователей в копии данных будут пересчитаны так же.
+Хэши текстов (RECORD_HASH_TEXT=1) с той же солью восстанавливаются по словам, категориям
+и номерам страниц из копии данных; остальные подаются боту как есть.
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_FILES = ("user_categories.json", "errors.json", "categories_for_all_users.json", "allowed_users.json",
+              "quiz_schedule.json", "allowed_symbols.json")
+
+
+class StubResponse:
+    status_code = 200
+
+    def __init__(self, result):
+        self.text = json.dumps({"ok": True, "result": result})
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def make_stub_sender():
+    """Заглушка для apihelper.CUSTOM_REQUEST_SENDER: отвечает как Bot API без сети."""
+    message_ids = itertools.count(1)
+
+    def sender(method, url, params=None, files=None, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        params = params or {}
+        if api_method in ("sendMessage", "editMessageText", "sendDocument"):
+            return StubResponse({
+                "message_id": next(message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            })
+        if api_method == "getMe":
+            return StubResponse({"id": 1, "is_bot": True, "first_name": "replay", "username": "replay_bot"})
+        if api_method == "getFile":
+            return StubResponse({"file_id": params.get("file_id"), "file_unique_id": "replay",
+                                 "file_path": params.get("file_id")})
+        return StubResponse(True)
+
+    return sender
+
+
+def unhash(text, known):
+    return known.get(text, text) if text.startswith("#") else text
+
+
+def restore_texts(record, known):
+    """Подставляет исходные тексты вместо хэшей: целиком, в аргументах команды и кнопки."""
+    if "x" in record:
+        text = record["x"]
+        if text.startswith("/"):
+            command, _, arguments = text.partition(" ")
+            record["x"] = f"{command} {unhash(arguments, known)}" if arguments else command
+        else:
+            record["x"] = unhash(text, known)
+    if "d" in record:
+        record["d"] = ":".join(unhash(part, known) for part in record["d"].split(":"))
+    return record
+
+
+def known_texts(main):
+    """{хэш: текст} для текстов, которые могли попасть в журнал: слова, ответы, категории и их хэши."""
+    texts = {str(number) for number in range(1000)}
+    sources = [main.load_json(main.SHARED_CATEGORIES_PATH, {})] + list(main.user_categories.values())
+    for categories in sources:
+        for category, words in categories.items():
+            texts.update((category, main.generate_category_hash(category)))
+            for word in words:
+                texts.update((word["question"], word["correct"], main.generate_id(word["question"])))
+    return {main.hash_text(text): text for text in texts}
+
+
+def update_from_record(update_id, record):
+    """Восстанавливает JSON обновления Telegram из компактной записи журнала."""
+    chat = {"id": record["c"], "type": "private"}
+    sender = {"id": record["c"], "is_bot": False, "first_name": "replay"}
+    if record["k"] == "c":
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": sender, "chat_instance": str(record["c"]), "data": record["d"],
+            "message": {"message_id": update_id, "date": 0, "chat": chat, "text": ""},
+        }}
+    message = {"message_id": update_id, "date": 0, "chat": chat, "from": sender}
+    if "x" in record:
+        message["text"] = record["x"]
+        if record["x"].startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(record["x"].split()[0])}]
+    if record.get("ct") == "document":
+        message["document"] = {"file_id": f"replay{update_id}", "file_unique_id": f"replay{update_id}",
+                               "file_name": f"replay{record.get('f', '')}", "file_size": record.get("fs")}
+    return {"update_id": update_id, "message": message}
+
+
+def remap_chat_ids(main):
+    """Переводит ключи пользователей в данных бота в обезличенные идентификаторы журнала."""
+    def anonymize(user_id):
+        try:
+            return main.anonymize_chat_id(int(user_id))
+        except ValueError:
+            return user_id
+
+    for data in (main.user_categories, main.errors, main.quiz_schedule):
+        items = list(data.items())
+        data.clear()
+        data.update((str(anonymize(user_id)), value) for user_id, value in items)
+    main.allowed_users[:] = [type(user_id)(anonymize(user_id)) for user_id in main.allowed_users]
+
+
+def load_bot(data_dir, salt=None):
+    """Импортирует main.py в каталоге с копией данных и заглушкой API."""
+    workdir = tempfile.mkdtemp(prefix="bot-replay-")
+    for name in DATA_FILES:
+        source = os.path.join(data_dir, name) if data_dir else None
+        if source and os.path.exists(source):
+            shutil.copy(source, workdir)
+    if not os.path.exists(os.path.join(workdir, "allowed_symbols.json")):
+        shutil.copy(os.path.join(REPO_DIR, "allowed_symbols.json"), workdir)
+    os.chdir(workdir)
+    os.environ.setdefault("BOT_TOKEN", "123456:replay")
+    os.environ.pop("RECORD_UPDATES", None)
+    if salt:
+        os.environ["RECORD_SALT"] = salt
+
+    from telebot import apihelper
+    apihelper.CUSTOM_REQUEST_SENDER = make_stub_sender()
+    sys.path.insert(0, REPO_DIR)
+    import main
+    # Обработчики вызываются в потоках воспроизведения, а не в пуле telebot
+    main.bot.threaded = False
+    if salt:
+        remap_chat_ids(main)
+    return main, workdir
+
+
+def replay(main, log_path, speed, workers, known=None):
+    from telebot import types
+
+    queues = [queue.Queue() for _ in range(workers)]
+    dispatch_lag = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def worker(tasks):
+        while True:
+            item = tasks.get()
+            if item is None:
+                return
+            due, update = item
+            lag = time.monotonic() - due
+            try:
+                main.bot.process_new_updates([update])
+            except Exception:
+                with lock:
+                    failures[0] += 1
+            with lock:
+                dispatch_lag.append(lag)
+
+    threads = [threading.Thread(target=worker, args=(tasks,), daemon=True) for tasks in queues]
+    for thread in threads:
+        thread.start()
+
+    started = time.monotonic()
+    first_time = None
+    count = 0
+    with open(log_path, encoding="utf-8") as log:
+        for update_id, line in enumerate(log, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if known:
+                restore_texts(record, known)
+            if first_time is None:
+                first_time = record["t"]
+            due = started
+            if speed:
+                due += (record["t"] - first_time) / speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            update = types.Update.de_json(update_from_record(update_id, record))
+            queues[record["c"] % workers].put((due, update))
+            count += 1
+
+    for tasks in queues:
+        tasks.put(None)
+    for thread in threads:
+        thread.join()
+    return count, time.monotonic() - started, sorted(dispatch_lag), failures[0]
+
+
+def collect_report(main, count, elapsed, dispatch_lag, failures):
+    def ms(seconds):
+        return round(seconds * 1000, 3)
+
+    handlers = {}
+    with main.metrics_lock:
+        for name, histogram in sorted(main.metrics.items()):
+            handlers[name] = {
+                "count": histogram.count,
+                "errors": histogram.errors,
+                "p50_ms": ms(histogram.percentile(50)),
+                "p95_ms": ms(histogram.percentile(95)),
+                "p99_ms": ms(histogram.percentile(99)),
+                "total_ms": ms(histogram.total),
+            }
+    lag_p99 = dispatch_lag[min(len(dispatch_lag) - 1, int(len(dispatch_lag) * 0.99))] if dispatch_lag else 0.0
+    return {
+        "updates": count,
+        "elapsed_s": round(elapsed, 3),
+        "throughput": round(count / elapsed, 1) if elapsed else 0.0,
+        "failures": failures,
+        "dispatch_lag_p99_ms": ms(lag_p99),
+        "metrics": handlers,
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"Обновлений: {report['updates']}, время: {report['elapsed_s']} с, "
+          f"{report['throughput']} обн./с, ошибок: {report['failures']}, "
+          f"задержка очереди p99: {report['dispatch_lag_p99_ms']} мс")
+    print(f"{'метрика':<45} {'вызовы':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}"
+          + (f" {'Δp99':>9}" if baseline else ""))
+    for name, row in report["metrics"].items():
+        line = f"{name[:45]:<45} {row['count']:>7} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+        if baseline:
+            base = baseline["metrics"].get(name)
+            line += f" {row['p99_ms'] - base['p99_ms']:>+9.2f}" if base else f" {'—':>9}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("log", help="журнал обновлений (JSONL), записанный с RECORD_UPDATES")
+    parser.add_argument("--data", help="каталог с файлами данных бота (копируется во временный)")
+    parser.add_argument("--speed", default="1", help="множитель скорости (1, 10, …) или max")
+    parser.add_argument("--workers", type=int, default=4, help="параллельных потоков обработки")
+    parser.add_argument("--salt", help="RECORD_SALT записи: пересчитать идентификаторы в данных")
+    parser.add_argument("--json", help="сохранить отчёт в JSON")
+    parser.add_argument("--compare", help="отчёт другой ветки (JSON) для сравнения p99")
+    args = parser.parse_args()
+
+    log_path = os.path.abspath(args.log)
+    data_dir = os.path.abspath(args.data) if args.data else None
+    speed = 0 if args.speed == "max" else float(args.speed)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    main_module, workdir = load_bot(data_dir, args.salt)
+    try:
+        known = known_texts(main_module) if args.salt else None
+        report = collect_report(main_module, *replay(main_module, log_path, speed, max(1, args.workers), known))
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report, baseline)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
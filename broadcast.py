@@ -0,0 +1,179 @@
+"""Рассылки с журналом на диске: продолжаются после перезапуска и не отправляют сообщение дважды.
+
+В начале рассылка фиксирует список получателей, затем отправляет его пачками через общий
+ограничитель скорости. Журнал — JSON Lines, по файлу на рассылку:
+
+    {"id", "kind", "started", "recipients": [...]}      заголовок, список получателей
+    {"s": N}                                            отправка N-му получателю началась
+    {"d": N, "ok": true|false}                          отправка N-му получателю завершена
+    {"elapsed": секунды}                                время отправки после очередной пачки
+    {"lost": [N, ...]}                                  отправки, прерванные сбоем
+    {"finished", "sent", "failed", "lost", "seconds", "rate"}
+
+Запись {"s"} попадает на диск (fsync) до отправки, поэтому после сбоя рассылка продолжается
+с получателей, которым отправка ещё не начиналась. Получатели с «s» без «d» могли получить
+сообщение до сбоя; им повторно не отправляется, они учитываются как lost — это только
+отправки, которые шли в момент сбоя (не больше числа потоков). Завершённые журналы
+переносятся в подкаталог ARCHIVE_DIR и при запуске не читаются.
+"""
+import concurrent.futures
+import json
+import os
+import threading
+import time
+import uuid
+
+
+class TokenBucket:
+    """Не больше rate операций в секунду, с запасом до burst подряд."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+ARCHIVE_DIR = "finished"
+
+
+class Broadcast:
+    def __init__(self, path, header):
+        self.path = path
+        self.id = header["id"]
+        self.kind = header["kind"]
+        self.recipients = header["recipients"]
+        self.started = set()  # Номера получателей, отправка которым уже начиналась
+        self.sent = 0
+        self.failed = 0
+        self.lost = 0
+        self.elapsed = 0.0  # Время отправки во всех запусках
+        self.finished = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create(cls, directory, kind, recipients):
+        os.makedirs(directory, exist_ok=True)
+        header = {"id": f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}", "kind": kind,
+                  "started": time.time(), "recipients": list(recipients)}
+        job = cls(os.path.join(directory, f"{kind}-{header['id']}.jsonl"), header)
+        job._append(header)
+        return job
+
+    @classmethod
+    def load(cls, path):
+        """Восстанавливает состояние рассылки по журналу."""
+        with open(path, encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        job = cls(path, json.loads(lines[0]))
+        done = set()
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # Запись оборвалась при сбое
+            if "s" in record:
+                job.started.add(record["s"])
+            elif "d" in record:
+                done.add(record["d"])
+                if record["ok"]:
+                    job.sent += 1
+                else:
+                    job.failed += 1
+            elif "claim" in record:  # Журнал прежнего формата: пачки до N-го получателя
+                job.started.update(range(record["claim"]))
+            elif "done" in record:
+                done.update(range(record["done"]))
+                job.sent, job.failed, job.elapsed = record["sent"], record["failed"], record["elapsed"]
+                job.lost = record.get("lost", job.lost)
+            elif "elapsed" in record:
+                job.elapsed = record["elapsed"]
+            elif "lost" in record and "finished" not in record:
+                done.update(record["lost"])
+                job.lost += len(record["lost"])
+            elif "finished" in record:
+                job.finished = record
+        interrupted = sorted(job.started - done)
+        if job.finished is None and interrupted:
+            # Отправки шли во время сбоя: этих получателей пропускаем
+            job.lost += len(interrupted)
+            job._append({"lost": interrupted})
+        return job
+
+    @property
+    def position(self):
+        """Сколько получателей уже взято в работу."""
+        return len(self.started)
+
+    def _append(self, record, sync=True):
+        with self.lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            file.flush()
+            if sync:
+                os.fsync(file.fileno())
+
+    def run(self, send, limiter, batch_size=100, workers=8):
+        """Отправляет оставшимся получателям. send(получатель) -> True, если сообщение отправлено."""
+        def deliver(index):
+            limiter.acquire()
+            self._append({"s": index})  # До отправки: после сбоя этому получателю не отправим повторно
+            try:
+                ok = bool(send(self.recipients[index]))
+            except Exception as e:
+                print(f"Рассылка {self.id}: ошибка отправки {self.recipients[index]}: {e}")
+                ok = False
+            # Потеря этой записи при сбое питания только добавит получателя к lost
+            self._append({"d": index, "ok": ok}, sync=False)
+            return ok
+
+        pending = [index for index in range(len(self.recipients)) if index not in self.started]
+        with concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix=f"broadcast:{self.kind}") as pool:
+            for start in range(0, len(pending), batch_size):
+                started = time.monotonic()
+                results = list(pool.map(deliver, pending[start:start + batch_size]))
+                self.sent += sum(results)
+                self.failed += len(results) - sum(results)
+                self.elapsed += time.monotonic() - started
+                self._append({"elapsed": self.elapsed}, sync=False)
+
+        self.finished = {"finished": time.time(), "sent": self.sent, "failed": self.failed, "lost": self.lost,
+                         "seconds": round(self.elapsed, 3),
+                         "rate": round(self.sent / self.elapsed, 2) if self.elapsed else 0.0}
+        self._append(self.finished)
+        self.archive()
+        return self.finished
+
+    def archive(self):
+        """Переносит завершённый журнал в ARCHIVE_DIR, чтобы unfinished() его больше не читал."""
+        directory = os.path.join(os.path.dirname(self.path), ARCHIVE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        os.replace(self.path, os.path.join(directory, os.path.basename(self.path)))
+
+
+def unfinished(directory):
+    """Рассылки, прерванные до завершения, в порядке начала."""
+    if not os.path.isdir(directory):
+        return []
+    jobs = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".jsonl"):
+            continue
+        job = Broadcast.load(os.path.join(directory, name))
+        if job.finished is None:
+            jobs.append(job)
+        else:
+            job.archive()  # Журнал завершённой рассылки из старой версии
+    return jobs
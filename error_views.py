@@ -0,0 +1,60 @@
+"""Ошибки пользователя в порядке показа для /mistakes и /clean_error.
+
+Категории с ошибками хранятся отсортированными по номеру «№ N» в названии, ошибки
+категории — по убыванию числа ошибок (при равенстве — по тексту вопроса). Оба списка
+отсортированы заранее и обновляются вставкой через bisect при каждом изменении счётчика,
+поэтому страница ошибок берётся срезом, без сортировки при каждом открытии.
+"""
+import bisect
+import re
+
+
+def category_sort_key(category):
+    """Категории с номером «№ N» — по номеру, остальные после них; при равенстве — по названию."""
+    match = re.search(r'№\s*(\d+)', category)
+    return (int(match.group(1)) if match else float('inf'), category)
+
+
+class UserErrors:
+    def __init__(self, categories):
+        """categories — ошибки пользователя из errors.json: {категория: {вопрос: ошибок}}."""
+        self.entries = {}  # Категория -> [(-ошибок, вопрос), ...] по возрастанию
+        for category, questions in categories.items():
+            entries = sorted((-count, question) for question, count in questions.items() if count > 0)
+            if entries:
+                self.entries[category] = entries
+        self.order = sorted(category_sort_key(category) for category in self.entries)
+
+    def categories(self):
+        return [category for _, category in self.order]
+
+    def count(self, category):
+        return len(self.entries.get(category, ()))
+
+    def page(self, category, start, stop):
+        """Ошибки категории с позиции start до stop: [(вопрос, ошибок), ...]."""
+        return [(question, -negative) for negative, question in self.entries.get(category, [])[start:stop]]
+
+    def set(self, category, question, old_count, new_count):
+        """Переставляет вопрос после изменения числа ошибок с old_count на new_count."""
+        entries = self.entries.get(category)
+        if entries is None:
+            if new_count <= 0:
+                return
+            entries = self.entries[category] = []
+            bisect.insort(self.order, category_sort_key(category))
+        if old_count > 0:
+            index = bisect.bisect_left(entries, (-old_count, question))
+            if index < len(entries) and entries[index] == (-old_count, question):
+                del entries[index]
+        if new_count > 0:
+            bisect.insort(entries, (-new_count, question))
+        if not entries:
+            self.drop(category)
+
+    def drop(self, category):
+        if self.entries.pop(category, None) is not None:
+            key = category_sort_key(category)
+            index = bisect.bisect_left(self.order, key)
+            if index < len(self.order) and self.order[index] == key:
+                del self.order[index]
@@ -0,0 +1,68 @@
+"""Самые трудные слова по ошибкам всех пользователей.
+
+Сводка {вопрос: [ошибок, пользователей]} обновляется при каждом изменении errors, а не
+пересчитывается по всему файлу. Порядок по числу ошибок держит макс-куча: при изменении
+счётчика в неё добавляется новая запись, а старая считается устаревшей и выбрасывается,
+когда оказывается наверху (как очередь повторения в srs.py). Поэтому первые K слов
+находятся за O(K log n).
+"""
+import heapq
+
+ERRORS, USERS = range(2)
+
+
+class ErrorLeaderboard:
+    def __init__(self):
+        self.totals = {}  # Вопрос -> [ошибок, пользователей с ошибками по нему]
+        self.heap = []  # (-ошибок, вопрос)
+
+    @classmethod
+    def from_errors(cls, errors):
+        """Сводка по errors.json: {пользователь: {категория: {вопрос: ошибок}}}."""
+        board = cls()
+        for categories in errors.values():
+            for questions in categories.values():
+                for question, count in questions.items():
+                    if count > 0:
+                        totals = board.totals.setdefault(question, [0, 0])
+                        totals[ERRORS] += count
+                        totals[USERS] += 1
+        board.heap = [(-totals[ERRORS], question) for question, totals in board.totals.items()]
+        heapq.heapify(board.heap)
+        return board
+
+    def update(self, question, errors_delta, users_delta):
+        """Учитывает изменение числа ошибок по вопросу у одного пользователя."""
+        if not errors_delta and not users_delta:
+            return
+        totals = self.totals.setdefault(question, [0, 0])
+        totals[ERRORS] += errors_delta
+        totals[USERS] += users_delta
+        if totals[ERRORS] <= 0 or totals[USERS] <= 0:
+            del self.totals[question]
+            return
+        if errors_delta:
+            heapq.heappush(self.heap, (-totals[ERRORS], question))
+            if len(self.heap) > 2 * len(self.totals) + 16:
+                self._compact()
+
+    def _compact(self):
+        self.heap = [(-totals[ERRORS], question) for question, totals in self.totals.items()]
+        heapq.heapify(self.heap)
+
+    def _stale(self, entry):
+        totals = self.totals.get(entry[1])
+        return totals is None or totals[ERRORS] != -entry[0]
+
+    def top(self, count):
+        """До count вопросов с наибольшим числом ошибок: [(вопрос, ошибок, пользователей), ...]."""
+        entries = []
+        seen = set()
+        while len(entries) < count and self.heap:
+            entry = heapq.heappop(self.heap)
+            if not self._stale(entry) and entry[1] not in seen:  # Одинаковые записи после +1 и −1
+                seen.add(entry[1])
+                entries.append(entry)
+        for entry in entries:
+            heapq.heappush(self.heap, entry)
+        return [(question, -negative, self.totals[question][USERS]) for negative, question in entries]
@@ -0,0 +1,92 @@
+"""Рейтинг лучших серий глобальной игры.
+
+Дерево Фенвика хранит, сколько игроков достигли каждой длины серии. Место игрока — число
+игроков с серией длиннее его плюс один, k-й по длине серии находится спуском по дереву;
+то и другое за O(log n) без сортировки. Игроки с одинаковой серией делят место.
+"""
+import heapq
+
+
+class FenwickTree:
+    """Счётчики по значениям 1..size с суммой на префиксе за O(log size)."""
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, index, delta):
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index):
+        """Сумма счётчиков 1..index."""
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, k):
+        """Наименьшее значение, на котором сумма префикса достигает k."""
+        index = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            if index + step <= self.size and self.tree[index + step] < k:
+                index += step
+                k -= self.tree[index]
+            step >>= 1
+        return index + 1
+
+
+class StreakLeaderboard:
+    def __init__(self, size=64):
+        self.tree = FenwickTree(size)
+        self.best = {}  # Игрок -> лучшая серия
+        self.players = {}  # Серия -> игроки с такой лучшей серией
+
+    def __len__(self):
+        return len(self.best)
+
+    def _grow(self, streak):
+        size = self.tree.size
+        while size < streak:
+            size *= 2
+        self.tree = FenwickTree(size)
+        for value, players in self.players.items():
+            self.tree.add(value, len(players))
+
+    def update(self, player, streak):
+        """Записывает серию игрока, если она лучше прежней."""
+        old = self.best.get(player, 0)
+        if streak <= old:
+            return
+        if streak > self.tree.size:
+            self._grow(streak)
+        if old:
+            self.players[old].discard(player)
+            if not self.players[old]:
+                del self.players[old]
+            self.tree.add(old, -1)
+        self.best[player] = streak
+        self.players.setdefault(streak, set()).add(player)
+        self.tree.add(streak, 1)
+
+    def rank(self, player):
+        """Место игрока (1 — лучший) или None, если он ещё не играл."""
+        streak = self.best.get(player)
+        if streak is None:
+            return None
+        return len(self.best) - self.tree.prefix(streak) + 1
+
+    def top(self, count):
+        """До count лучших игроков: [(место, игрок, серия), ...]."""
+        result = []
+        place = 1
+        while len(result) < count and place <= len(self.best):
+            # place-й с конца по длине серии — это (всего − place + 1)-й с начала
+            streak = self.tree.find(len(self.best) - place + 1)
+            players = self.players[streak]
+            result += [(place, player, streak) for player in heapq.nsmallest(count - len(result), players)]
+            place += len(players)
+        return result
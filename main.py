@@ -3,10 +3,30 @@ import schedule
 import time
 import threading
 import hashlib
+import hmac
 import os
+import sys
 import json
 import random
+import csv
+import io
+import tempfile
+import functools
+import contextlib
+import enum
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import telebot
+from telebot import apihelper
+import snapshot
+import shared_deck
+import srs
+import stats
+import hardest
+import leaderboard
+import error_views
+import reminder_planner
+import broadcast
+import sessions
 from dotenv import load_dotenv
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove, ReplyKeyboardMarkup, \
     KeyboardButton
@@ -20,8 +40,256 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN is not set!")
 
+# Адрес Bot API, например локальный сервер Bot API или bench/fake_telegram.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+if TELEGRAM_API_URL:
+    apihelper.API_URL = TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+    apihelper.FILE_URL = TELEGRAM_API_URL.rstrip("/") + "/file/bot{0}/{1}"
+
 bot = telebot.TeleBot(BOT_TOKEN)
 
+# Администраторы бота через запятую, например ADMIN_IDS=123456,654321
+ADMIN_IDS = {admin_id.strip() for admin_id in os.getenv("ADMIN_IDS", "").split(",") if admin_id.strip()}
+
+
+
+# ========== Метрики ==========
+class LatencyHistogram:
+    """Гистограмма задержек с логарифмическими корзинами в стиле HDR Histogram.
+
+    Каждая степень двойки (в микросекундах) делится на SUB_BUCKETS линейных корзин,
+    поэтому погрешность перцентилей не превышает 1/SUB_BUCKETS при постоянной памяти.
+    """
+    SUB_BUCKET_BITS = 3
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    MAX_EXPONENT = 40
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * ((self.MAX_EXPONENT + 1) * self.SUB_BUCKETS)
+
+    @classmethod
+    def bucket_index(cls, micros):
+        if micros < cls.SUB_BUCKETS:
+            return micros
+        exponent = micros.bit_length() - cls.SUB_BUCKET_BITS - 1
+        sub_bucket = (micros >> exponent) - cls.SUB_BUCKETS
+        return (exponent + 1) * cls.SUB_BUCKETS + sub_bucket
+
+    @classmethod
+    def bucket_upper_bound(cls, index):
+        """Верхняя граница корзины в микросекундах."""
+        if index < cls.SUB_BUCKETS:
+            return index + 1
+        exponent = index // cls.SUB_BUCKETS - 1
+        sub_bucket = index % cls.SUB_BUCKETS
+        return (cls.SUB_BUCKETS + sub_bucket + 1) << exponent
+
+    def record(self, seconds, error=False):
+        index = min(self.bucket_index(max(int(seconds * 1_000_000), 0)), len(self.buckets) - 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def percentile(self, percent):
+        """Значение перцентиля в секундах."""
+        if not self.count:
+            return 0.0
+        target = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return self.bucket_upper_bound(index) / 1_000_000
+        return self.bucket_upper_bound(len(self.buckets) - 1) / 1_000_000
+
+
+metrics = {}  # Имя метрики -> LatencyHistogram
+metrics_lock = threading.Lock()
+
+
+def record_metric(name, seconds, error=False):
+    with metrics_lock:
+        histogram = metrics.get(name)
+        if histogram is None:
+            histogram = metrics[name] = LatencyHistogram()
+        histogram.record(seconds, error)
+
+
+def timed(name):
+    """Декоратор: записывает число вызовов, ошибок и задержку функции в метрику name."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            failed = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                record_metric(name, time.perf_counter() - start, failed)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_handlers():
+    """Оборачивает все зарегистрированные обработчики бота (и обработчики состояний) в timed()."""
+    for handlers in (bot.message_handlers, bot.callback_query_handlers):
+        for handler in handlers:
+            function = handler["function"]
+            handler["function"] = timed(f"handler:{function.__name__}")(function)
+    for state, function in state_handlers.items():
+        state_handlers[state] = timed(f"handler:{function.__name__}")(function)
+
+
+# Все запросы к Telegram API проходят через apihelper._make_request
+_make_request = apihelper._make_request
+
+
+def _timed_make_request(token, method_name, *args, **kwargs):
+    start = time.perf_counter()
+    failed = False
+    try:
+        return _make_request(token, method_name, *args, **kwargs)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_metric(f"api:{method_name}", time.perf_counter() - start, failed)
+
+
+apihelper._make_request = _timed_make_request
+
+updates_total = 0
+# Кольцевой буфер посекундных счётчиков обновлений за последнюю минуту
+UPDATE_RATE_WINDOW = 60
+update_rate_counts = [0] * UPDATE_RATE_WINDOW
+update_rate_seconds = [0] * UPDATE_RATE_WINDOW
+scheduler_lag = 0.0  # Опоздание последнего тика планировщика относительно начала минуты, сек
+
+_process_new_updates = bot.process_new_updates
+
+
+def _counted_process_new_updates(updates):
+    global updates_total
+    with metrics_lock:
+        updates_total += len(updates)
+        second = int(time.time())
+        slot = second % UPDATE_RATE_WINDOW
+        if update_rate_seconds[slot] != second:
+            update_rate_seconds[slot] = second
+            update_rate_counts[slot] = 0
+        update_rate_counts[slot] += len(updates)
+    if RECORD_UPDATES:
+        record_updates(updates)
+    _process_new_updates(updates)
+
+
+bot.process_new_updates = _counted_process_new_updates
+
+
+def updates_per_second():
+    """Среднее число обновлений в секунду за последнюю минуту."""
+    now = int(time.time())
+    with metrics_lock:
+        recent = sum(count for second, count in zip(update_rate_seconds, update_rate_counts)
+                     if now - UPDATE_RATE_WINDOW < second <= now)
+    return recent / UPDATE_RATE_WINDOW
+
+
+def process_rss_bytes():
+    """Текущий размер резидентной памяти процесса."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss — пиковое значение (в КБ на Linux), лучше, чем ничего
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# ========== Запись входящих обновлений ==========
+# Журнал для bench/replay.py: JSONL, по строке на обновление, id чатов анонимизированы
+RECORD_UPDATES = os.getenv("RECORD_UPDATES")
+RECORD_HASH_TEXT = os.getenv("RECORD_HASH_TEXT") == "1"  # Хэшировать тексты (у команд и кнопок — аргументы)
+# Соль для анонимизации; постоянная соль сохраняет одинаковые id между перезапусками
+RECORD_SALT = (os.getenv("RECORD_SALT") or os.urandom(16).hex()).encode("utf-8")
+recorder_lock = threading.Lock()
+recorder_started = time.time()
+
+
+def anonymize_chat_id(chat_id):
+    digest = hmac.new(RECORD_SALT, str(chat_id).encode("utf-8"), hashlib.sha256).hexdigest()
+    return int(digest[:12], 16)
+
+
+def hash_text(text):
+    return "#" + hmac.new(RECORD_SALT, text.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+
+def anonymize_text(text):
+    """Текст сообщения; у команды остаётся открытым только слово команды."""
+    if not RECORD_HASH_TEXT:
+        return text
+    if text.startswith("/"):
+        command, _, arguments = text.partition(" ")
+        return f"{command} {hash_text(arguments)}" if arguments else command
+    return hash_text(text)
+
+
+def anonymize_callback_data(data):
+    """Данные кнопки; открытым остаётся только префикс до первого двоеточия, аргументы хэшируются по одному."""
+    if not RECORD_HASH_TEXT or ":" not in data:
+        return data
+    prefix, *arguments = data.split(":")
+    return ":".join([prefix] + [hash_text(argument) for argument in arguments])
+
+
+def update_record(update):
+    """Компактная запись обновления: время от начала записи, тип, чат и полезные данные."""
+    record = {"t": round(time.time() - recorder_started, 3)}
+    if update.message:
+        message = update.message
+        record.update({"k": "m", "c": anonymize_chat_id(message.chat.id), "ct": message.content_type})
+        if message.text is not None:
+            record["x"] = anonymize_text(message.text)
+        if message.document:
+            record["f"] = os.path.splitext(message.document.file_name or "")[1]
+            record["fs"] = message.document.file_size
+    elif update.callback_query and update.callback_query.message:
+        record.update({"k": "c", "c": anonymize_chat_id(update.callback_query.message.chat.id),
+                       "d": anonymize_callback_data(update.callback_query.data)})
+    else:
+        return None
+    return record
+
+
+def record_updates(updates):
+    lines = []
+    for update in updates:
+        record = update_record(update)
+        if record:
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+    if not lines:
+        return
+    try:
+        with recorder_lock, open(RECORD_UPDATES, "a", encoding="utf-8") as file:
+            file.writelines(lines)
+    except OSError as e:
+        print(f"Ошибка записи журнала обновлений: {e}")
+
+METRICS_PORT = os.getenv("METRICS_PORT")  # Если задан, на этом порту поднимается /metrics для Prometheus
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
 EDIT_WORD_PREFIX = "edit_word:"
 SEARCH_CHANGE_PREFIX = "search_word_change:"
 
@@ -31,18 +299,117 @@ def generate_id(question):
     return hashlib.md5(question.encode('utf-8')).hexdigest()[:8]
 
 
-def contains_invalid_symbols(text):
-    """Проверка текста на наличие запрещенных символов."""
+QUESTION_CACHE_SIZE = 65536  # Сколько разобранных вопросов держать в кэше
+KEYBOARD_CACHE_SIZE = 16384  # Сколько готовых клавиатур с вариантами ответа держать в кэше
+
+
+@functools.lru_cache(maxsize=QUESTION_CACHE_SIZE)
+def question_options(question):
+    """Варианты ответа (неверный, верный) из строки «неверный←верный» или None, если строка испорчена."""
+    return reminder_planner.parse_options(question)
+
+
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def answer_keyboard(first, second, one_row=True):
+    """Клавиатура с двумя вариантами, уже сериализованная в JSON (telebot передаёт строку как есть)."""
+    return reminder_planner.keyboard_json(first, second, one_row)
+
+
+def shuffled_answer_keyboard(options, one_row=True):
+    """Клавиатура для вариантов из question_options() в случайном порядке."""
+    first, second = options if random.random() < 0.5 else options[::-1]
+    return answer_keyboard(first, second, one_row)
+
+
+MAX_MESSAGE_LENGTH = 4096  # Ограничение Telegram на длину текста сообщения
+REPLY_SEPARATOR = "\n\n"
+
+
+def extend_within_limit(lines, more):
+    """Дописывает строки more в lines, пока текст помещается в одно сообщение; остаток — строкой «… и ещё N»."""
+    more = list(more)
+    length = sum(len(line) + 1 for line in lines)
+    for shown, line in enumerate(more):
+        length += len(line) + 1
+        if length > MAX_MESSAGE_LENGTH - 32:  # Запас под строку «… и ещё N»
+            lines.append(f"… и ещё {len(more) - shown}")
+            return lines
+        lines.append(line)
+    return lines
+
+_replies = threading.local()  # Буфер ответов текущего обновления (у каждого потока обработки свой)
+
+
+@contextlib.contextmanager
+def coalesced_replies(user_id):
+    """Внутри блока reply() не отправляет сообщения сразу, а копит их.
+
+    В конце блока накопленное уходит одним сообщением с последней клавиатурой:
+    «✅ Верно!» и следующий вопрос — один вызов API вместо двух.
+    """
+    previous = getattr(_replies, "buffer", None)
+    _replies.buffer = {"user_id": user_id, "texts": [], "markup": None}
+    try:
+        yield
+    finally:
+        try:
+            flush_replies()
+        finally:
+            _replies.buffer = previous
+
+
+def reply(user_id, text, reply_markup=None):
+    """Сообщение пользователю; внутри coalesced_replies() — в общий буфер."""
+    buffer = getattr(_replies, "buffer", None)
+    if buffer is None or buffer["user_id"] != user_id:
+        return bot.send_message(user_id, text, reply_markup=reply_markup)
+    buffer["texts"].append(text)
+    if reply_markup is not None:
+        buffer["markup"] = reply_markup
+
+
+def flush_replies():
+    """Отправляет накопленные ответы. Вызывать перед прямым bot.send_message внутри блока,
+    чтобы не нарушить порядок сообщений."""
+    buffer = getattr(_replies, "buffer", None)
+    if not buffer or not buffer["texts"]:
+        return None
+    texts, markup = buffer["texts"], buffer["markup"]
+    buffer["texts"], buffer["markup"] = [], None
+
+    # Длинный результат делим по границам сообщений; клавиатура — у последней части
+    parts = [texts[0]]
+    for text in texts[1:]:
+        if len(parts[-1]) + len(REPLY_SEPARATOR) + len(text) <= MAX_MESSAGE_LENGTH:
+            parts[-1] += REPLY_SEPARATOR + text
+        else:
+            parts.append(text)
+    for part in parts[:-1]:
+        bot.send_message(buffer["user_id"], part)
+    return bot.send_message(buffer["user_id"], parts[-1], reply_markup=markup)
+
+
+def load_allowed_symbols():
+    """Перечитывает allowed_symbols.json: файл можно поправить без перезапуска бота."""
     global allowed_symbols
-    # Загружаем список разрешенных символов из файла
     allowed_symbols = set(load_json("allowed_symbols.json", {}).get("allowed", ""))
     if not allowed_symbols:
         raise ValueError("Список разрешенных символов пуст или не найден в allowed_symbols.json")
+    return allowed_symbols
+
 
+def contains_invalid_symbols(text, symbols=None):
+    """Проверка текста на наличие запрещенных символов.
+
+    symbols — уже загруженный набор разрешённых символов (при проверке пачки слов),
+    иначе он читается из файла.
+    """
+    if symbols is None:
+        symbols = load_allowed_symbols()
     # Убираем переносы строк и пробелы для проверки
     cleaned_text = text.replace("\n", "").replace(" ", "")
     # Проверяем каждый символ текста на запрещенные символы
-    return any(char not in allowed_symbols for char in cleaned_text)
+    return any(char not in symbols for char in cleaned_text)
 
 
 def has_excessive_repetition(text, max_repeats=10):
@@ -55,6 +422,11 @@ def has_excessive_repetition(text, max_repeats=10):
     return False
 
 
+def is_admin(user_id):
+    """Проверка, что пользователь указан в ADMIN_IDS."""
+    return str(user_id) in ADMIN_IDS
+
+
 def generate_question_hash(data):
     """Создаёт короткий хэш для данных (не более 64 байт)"""
     return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]  # Хэш ограничен до 16 символов
@@ -80,17 +452,221 @@ def generate_category_hash(category_name):
 
 
 def save_json(filename, data):
-    with open(filename, "w", encoding="utf-8") as file:
-        json.dump(data, file, ensure_ascii=False, indent=4)
+    if isinstance(data, DeferredData):
+        data.wait_loaded()  # Не перезаписываем файл, пока он не дочитан
+        data = data.data
+    start = time.perf_counter()
+    if STATE_FORMAT == "snapshot" and filename in SNAPSHOT_FILES:
+        snapshot.save(snapshot.snapshot_path(filename), data)
+    else:
+        with open(filename, "w", encoding="utf-8") as file:
+            if filename in COMPACT_JSON_FILES:
+                json.dump(data, file, ensure_ascii=False, separators=(",", ":"))
+            else:
+                json.dump(data, file, ensure_ascii=False, indent=4)
+    record_metric(f"save_json:{filename}", time.perf_counter() - start)
+
+
+# Отложенная загрузка данных: бот начинает принимать обновления сразу, а большие файлы
+# дочитываются в фоне. Обработчик ждёт только тот файл, к которому обращается.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy")  # lazy — загрузка в фоне, eager — при импорте
+# json — файлы *.json; snapshot — большие файлы хранятся двоичными снимками *.snap (см. snapshot.py)
+STATE_FORMAT = os.getenv("STATE_FORMAT", "json")
+SNAPSHOT_FILES = ("user_categories.json", "errors.json", "srs.json", "user_stats.json")
+COMPACT_JSON_FILES = ("user_stats.json",)  # Пишутся без отступов: в них длинные списки чисел
+PREBUILD_INDEXES = os.getenv("PREBUILD_INDEXES", "1") == "1"  # Строить индексы дубликатов сразу после загрузки
+deferred_data = []  # Файлы, которые ещё могут загружаться
+
+
+class DeferredData:
+    """Данные JSON-файла, который дочитывается в фоновом потоке.
+
+    Обёртка над обычным dict или list в self.data: до конца загрузки методы ждут её,
+    а чтение ключа словаря — только появления этого ключа. После загрузки вызовы сразу
+    передаются self.data.
+    """
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.data = data
+        self.ready = False  # Файл прочитан без ошибок
+        self.loaded = threading.Event()
+        self.load_error = None
+        self.key_waiters = {}  # Ключ, которого ждут обработчики -> Event
+        self.waiters_lock = threading.Lock()
+
+    def start_loading(self, default):
+        deferred_data.append(self)
+        threading.Thread(target=self._load, args=(default,), name=f"load:{self.filename}", daemon=True).start()
+
+    def _load(self, default):
+        try:
+            if isinstance(self.data, dict):
+                self._load_pairs(default)
+            else:
+                self.data.extend(load_json(self.filename, default))
+            self.ready = True
+        except Exception as e:
+            # Пустые данные сохранять нельзя — иначе save_json затрёт файл
+            self.load_error = e
+        finally:
+            self.loaded.set()
+            with self.waiters_lock:
+                for event in self.key_waiters.values():
+                    event.set()  # Файл дочитан, а ключей в нём нет
+                self.key_waiters.clear()
+
+    def _load_pairs(self, default):
+        # Пары добавляются по мере разбора: обработчик пользователя, который уже прочитан, не ждёт остальных
+        if not os.path.exists(self.filename):
+            self.data.update(default or {})
+            return
+        with open(self.filename, "r", encoding="utf-8") as file:
+            text = file.read()
+        try:
+            for key, value in iter_json_object(text):
+                self.data[key] = value
+                if self.key_waiters:
+                    with self.waiters_lock:
+                        event = self.key_waiters.pop(key, None)
+                    if event:
+                        event.set()
+        except json.JSONDecodeError:
+            # Как и load_json, повреждённый файл читается как значение по умолчанию
+            self.data.clear()
+            self.data.update(default or {})
+
+    def finish(self):
+        """Данные уже прочитаны целиком (режим eager)."""
+        self.ready = True
+        self.loaded.set()
+
+    def wait_loaded(self):
+        self.loaded.wait()
+        if self.load_error is not None:
+            raise RuntimeError(f"Не удалось загрузить {self.filename}: {self.load_error}")
+
+    def wait_key(self, key):
+        """Ждёт, пока ключ прочитан или файл дочитан. Прочитанный ключ до конца загрузки не меняется."""
+        if self.ready or key in self.data:
+            return
+        with self.waiters_lock:
+            event = self.key_waiters.setdefault(key, threading.Event())
+        # Проверка после регистрации: ключ мог появиться до неё, тогда загрузчик его уже не сообщит
+        if key not in self.data and not self.loaded.is_set():
+            event.wait()
+        if key not in self.data:
+            self.wait_loaded()
+
+    def __iadd__(self, other):
+        self.wait_loaded()
+        self.data += other
+        return self
+
+    def __ior__(self, other):
+        self.wait_loaded()
+        self.data |= other
+        return self
+
+
+def _wait_before(name):
+    def method(self, *args, **kwargs):
+        if not self.ready:
+            self.wait_loaded()
+        return getattr(self.data, name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+def _wait_for_key(name):
+    def method(self, key, *args):
+        if not self.ready and isinstance(self.data, dict):
+            self.wait_key(key)
+        elif not self.ready:
+            self.wait_loaded()
+        return getattr(self.data, name)(key, *args)
+    method.__name__ = name
+    return method
+
+
+for _name in ("__setitem__", "__delitem__", "__iter__", "__len__", "__eq__", "__ne__", "__repr__", "__reversed__",
+              "__or__", "__add__", "keys", "values", "items", "pop", "popitem", "setdefault", "update", "clear",
+              "copy", "append", "extend", "insert", "remove", "index", "count", "sort", "reverse"):
+    setattr(DeferredData, _name, _wait_before(_name))
+for _name in ("__getitem__", "__contains__", "get"):
+    setattr(DeferredData, _name, _wait_for_key(_name))
+
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_json_object(text):
+    """Разбирает JSON-объект верхнего уровня по одной паре ключ-значение.
+
+    Каждое значение декодируется отдельным вызовом, поэтому между ними другие потоки
+    получают GIL, а уже прочитанные ключи доступны до конца разбора.
+    """
+    decoder = json.JSONDecoder()
+
+    def skip(position):
+        return _JSON_WHITESPACE.match(text, position).end()
+
+    def expect(char, position):
+        if text[position:position + 1] != char:
+            raise json.JSONDecodeError(f"Ожидался символ {char!r}", text, position)
+        return skip(position + 1)
+
+    position = expect("{", skip(0))
+    if text[position:position + 1] == "}":
+        return
+    while True:
+        key, position = decoder.raw_decode(text, position)
+        if not isinstance(key, str):
+            raise json.JSONDecodeError("Ключ должен быть строкой", text, position)
+        value, position = decoder.raw_decode(text, expect(":", skip(position)))
+        yield key, value
+        position = skip(position)
+        if text[position:position + 1] == "}":
+            return
+        position = expect(",", position)
+
+
+def load_json_deferred(filename, default):
+    """Как load_json, но в режиме lazy читает файл в фоне и сразу возвращает контейнер."""
+    if STATE_FORMAT == "snapshot" and filename in SNAPSHOT_FILES:
+        path = snapshot.snapshot_path(filename)
+        if not os.path.exists(path):
+            # Первый запуск в этом режиме: один раз переводим JSON в снимок
+            snapshot.save(path, load_json(filename, default))
+        # Снимок открывается мгновенно, пользователи декодируются при первом обращении
+        return snapshot.load(path)
+    container = DeferredData(filename, [] if isinstance(default, list) else {})
+    if STARTUP_MODE == "eager":
+        data = load_json(filename, default)
+        if isinstance(container.data, dict):
+            container.data.update(data)
+        else:
+            container.data.extend(data)
+        container.finish()
+    else:
+        container.start_loading(default)
+    return container
+
+
+def wait_for_data():
+    """Ждёт окончания фоновой загрузки всех файлов."""
+    for container in list(deferred_data):
+        container.wait_loaded()
 
 
 # Инициализация данных
-user_categories = load_json("user_categories.json", {})
-errors = load_json("errors.json", {})
+user_categories = load_json_deferred("user_categories.json", {})
+errors = load_json_deferred("errors.json", {})
 user_context = {}
 add_word_context = {}
-categories_for_all_users = load_json("categories_for_all_users.json", {})
-allowed_users = load_json("allowed_users.json", [])
+allowed_users = load_json_deferred("allowed_users.json", [])
+srs_cards = load_json_deferred("srs.json", {})  # Карточки интервального повторения (см. srs.py)
+user_stats = load_json_deferred("user_stats.json", {})  # Сводная статистика ответов (см. stats.py)
 # Загрузка разрешенных символов
 allowed_symbols = set(load_json("allowed_symbols.json", {}).get("allowed", ""))
 
@@ -102,6 +678,141 @@ def natural_sort_key(s):
     ]
 
 
+# Индекс для поиска дубликатов: user_id -> категория -> {нормализованный ключ: количество слов}
+word_index = {}
+
+
+def normalize_word_key(question):
+    """Нормализованный ключ пары (неверный, верный): без лишних пробелов и регистра."""
+    wrong, _, correct = question.partition("←")
+    return " ".join(wrong.split()).lower(), " ".join(correct.split()).lower()
+
+
+def get_word_index(user_id, category):
+    """Возвращает индекс ключей категории, при первом обращении строит его."""
+    user_index = word_index.setdefault(user_id, {})
+    if category not in user_index:
+        counts = {}
+        for word in user_categories.get(user_id, {}).get(category, []):
+            key = normalize_word_key(word["question"])
+            counts[key] = counts.get(key, 0) + 1
+        # setdefault: индекс мог построить фоновый поток
+        return user_index.setdefault(category, counts)
+    return user_index[category]
+
+
+def is_duplicate_word(user_id, category, question):
+    return normalize_word_key(question) in get_word_index(user_id, category)
+
+
+def index_add_word(user_id, category, question):
+    index = get_word_index(user_id, category)
+    key = normalize_word_key(question)
+    index[key] = index.get(key, 0) + 1
+
+
+def index_remove_word(user_id, category, question, count=1):
+    index = get_word_index(user_id, category)
+    key = normalize_word_key(question)
+    left = index.get(key, 0) - count
+    if left > 0:
+        index[key] = left
+    else:
+        index.pop(key, None)
+
+
+def drop_word_index(user_id, category):
+    """Сбрасывает индекс категории (при её удалении или пересоздании)."""
+    word_index.get(user_id, {}).pop(category, None)
+
+
+def build_word_indexes():
+    """Заранее строит индексы дубликатов для всех пользователей (в фоне после запуска)."""
+    for user_id in list(user_categories.keys()):
+        for category in list(user_categories.get(user_id, {})):
+            get_word_index(user_id, category)
+
+
+class State(enum.Enum):
+    """Состояние диалога: какой обработчик ждёт следующее текстовое сообщение пользователя.
+
+    Хранится в контексте под ключом "state" (user_context или add_word_context) и исчезает
+    вместе с ним, поэтому сброс контекста сбрасывает и состояние.
+    """
+    QUIZ_ANSWER = "quiz_answer"  # Ответ на вопрос викторины по категории
+    NEW_CATEGORY = "new_category"  # Название новой категории (/add_word)
+    ADD_WORD_MODE = "add_word_mode"  # Выбор обычного или массового добавления
+    ADD_WORD = "add_word"  # Одно слово
+    ADD_WORDS_BULK = "add_words_bulk"  # Массовое добавление
+    REMOVE_WORD_SEARCH = "remove_word_search"  # Поиск слова для удаления
+    REMOVE_WORD_CONFIRM = "remove_word_confirm"
+    REMOVE_CATEGORY_CONFIRM = "remove_category_confirm"
+    SCHEDULED_QUIZ_ANSWER = "scheduled_quiz_answer"  # Ответ на викторину по расписанию
+    QUIZ_TIME_INPUT = "quiz_time_input"  # Время для /quiz
+    GLOBAL_ANSWER = "global_answer"  # Ответ в глобальной игре
+    CHANGE_WORD_SEARCH = "change_word_search"  # Поиск слова для изменения (/change_word)
+    CHANGE_WORD_INPUT = "change_word_input"  # Новая пара слов для выбранного слова
+    CHANGE_LIST_SEARCH = "change_list_search"  # Поиск слова из списка изменения
+    EDIT_WORD_INPUT = "edit_word_input"  # Новая пара слов для слова из списка
+    REVIEW_ANSWER = "review_answer"  # Ответ в режиме повторения (/review)
+
+
+# Состояние -> обработчик текстового сообщения (заполняется декоратором state_handler)
+state_handlers = {}
+
+# Состояния, обработчики которых сами разбирают команды: None — любые, иначе — перечисленные.
+# В остальных состояниях команды уходят обычным обработчикам команд
+STATE_COMMANDS = {
+    State.QUIZ_ANSWER: None,  # Команда завершает викторину и выполняется
+    State.ADD_WORDS_BULK: {"/done"},
+}
+
+
+def state_handler(*states):
+    """Регистрирует функцию как обработчик сообщений в указанных состояниях."""
+    def decorator(function):
+        for state in states:
+            state_handlers[state] = function
+        return function
+
+    return decorator
+
+
+def conversation_state(user_id):
+    """Текущее состояние диалога пользователя или None."""
+    if user_id in saved_sessions and user_id not in user_context:
+        restore_session(user_id)
+    context = user_context.get(user_id)
+    if context and context.get("state"):
+        return context["state"]
+    add_context = add_word_context.get(user_id)
+    return add_context.get("state") if add_context else None
+
+
+def route_message(message):
+    """Обработчик для сообщения по состоянию диалога; None — сообщение не относится к диалогу."""
+    state = conversation_state(str(message.chat.id))
+    if state is None:
+        return None
+    text = message.text or ""
+    if text.startswith("/"):
+        if state not in STATE_COMMANDS:
+            return None
+        commands = STATE_COMMANDS[state]
+        if commands is not None and text.split(maxsplit=1)[0] not in commands:
+            return None
+    return state_handlers.get(state)
+
+
+# Зарегистрирован первым: сообщения в диалоге маршрутизируются одним поиском по состоянию,
+# а не перебором фильтров всех обработчиков
+@bot.message_handler(func=lambda message: route_message(message) is not None)
+def dispatch_state(message):
+    handler = route_message(message)
+    if handler:
+        handler(message)
+
+
 @bot.message_handler(commands=['start'])
 def start_message(message):
     user_id = str(message.chat.id)
@@ -140,21 +851,29 @@ def select_category(call):
     bot.answer_callback_query(call.id)
     user_id = str(call.message.chat.id)
     selected_category = call.data.split(":")[1]
-    # Копируем все вопросы выбранной категории и сбрасываем счётчик правильных ответов
-    questions = user_categories[user_id][selected_category][:]
+    # Копируем все вопросы выбранной категории и сбрасываем счётчик правильных ответов.
+    # Испорченные вопросы отбрасываем сразу, чтобы не разбирать их при каждой отправке
+    all_words = user_categories[user_id][selected_category]
+    questions = [q for q in all_words if question_options(q["question"])]
     for q in questions:
         q["correct_count"] = 0
     user_context[user_id] = {
         "mode": "quiz",
+        "state": State.QUIZ_ANSWER,
         "category": selected_category,
         "all_questions": questions,  # все вопросы категории
         "current_round_questions": questions[:] if questions else [],  # первый круг = все вопросы
         "round_number": 1,  # начинаем с 1-го круга
         "session_errors": {},  # фиксируем ошибки (qid: correct_answer)
+        "reviewed": set(),  # qid слов, ответ на которые уже учтён в карточках повторения
         "start_time": time.time()
     }
-    bot.send_message(user_id, f"Ты выбрал категорию: {selected_category}.\nНачинается 1 круг викторины.")
-    send_quiz(user_id)
+    text = f"Ты выбрал категорию: {selected_category}.\nНачинается 1 круг викторины."
+    if len(questions) < len(all_words):
+        text += f"\n⚠ Пропущено вопросов с ошибкой в записи: {len(all_words) - len(questions)}."
+    with coalesced_replies(user_id):
+        reply(user_id, text)
+        send_quiz(user_id)
 
 
 def send_quiz(user_id):
@@ -164,7 +883,7 @@ def send_quiz(user_id):
 
     # Проверяем, есть ли вообще вопросы в категории
     if not context.get("all_questions"):
-        bot.send_message(user_id, "⚠ Ошибка: в этой категории нет доступных вопросов.")
+        reply(user_id, "⚠ Ошибка: в этой категории нет доступных вопросов.")
         user_context.pop(user_id, None)
         return
 
@@ -180,13 +899,14 @@ def send_quiz(user_id):
             if len(error_answers) > 10:
                 context["final_error_list"] = error_answers
                 context["final_error_page"] = 0
-                bot.send_message(user_id, f"🎉 Викторина завершена!\nВремя: {elapsed_str}")
+                reply(user_id, f"🎉 Викторина завершена!\nВремя: {elapsed_str}")
+                flush_replies()  # Страница ошибок отправляется напрямую и должна идти после итога
                 send_final_error_page(user_id, 0)
             else:
                 numbered = "\n".join([f"{i + 1}. {word}" for i, word in enumerate(error_answers)])
-                bot.send_message(user_id, f"🎉 Викторина завершена!\nВремя: {elapsed_str}\nОшибки:\n{numbered}")
+                reply(user_id, f"🎉 Викторина завершена!\nВремя: {elapsed_str}\nОшибки:\n{numbered}")
         else:
-            bot.send_message(user_id, f"🎉 Викторина завершена!\nВремя: {elapsed_str}\nОшибок не было.")
+            reply(user_id, f"🎉 Викторина завершена!\nВремя: {elapsed_str}\nОшибок не было.")
         user_context.pop(user_id, None)
         return
 
@@ -202,9 +922,9 @@ def send_quiz(user_id):
         if new_round:
             random.shuffle(new_round)  # Перемешиваем новый круг
             context["current_round_questions"] = new_round
-            bot.send_message(user_id, f"🔄 Начинается {context['round_number']} круг викторины.")
+            reply(user_id, f"🔄 Начинается {context['round_number']} круг викторины.")
         else:
-            bot.send_message(user_id, "⚠ Ошибка: не осталось вопросов для следующего круга.")
+            reply(user_id, "⚠ Ошибка: не осталось вопросов для следующего круга.")
             user_context.pop(user_id, None)
             return
 
@@ -215,22 +935,13 @@ def send_quiz(user_id):
     if context["current_round_questions"]:
         question = context["current_round_questions"].pop(0)
         context["current"] = question
+        dirty_sessions.add(user_id)
 
-        try:
-            wrong_answer, correct_answer = question["question"].split("←")
-            options = [wrong_answer.strip(), correct_answer.strip()]
-            random.shuffle(options)  # 🔥 Перемешиваем порядок кнопок
-
-            markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-            for opt in options:
-                markup.add(KeyboardButton(opt))
-
-            bot.send_message(user_id, "Выберите ответ:", reply_markup=markup)
-        except Exception as e:
-            bot.send_message(user_id, f"⚠ Ошибка при загрузке вопроса: {str(e)}")
-            send_quiz(user_id)  # Пробуем отправить следующий вопрос, если этот вызвал ошибку
+        # Вопросы проверены при выборе категории; порядок кнопок случайный
+        markup = shuffled_answer_keyboard(question_options(question["question"]), one_row=False)
+        reply(user_id, "Выберите ответ:", reply_markup=markup)
     else:
-        bot.send_message(user_id, "⚠ Ошибка: не осталось вопросов.")
+        reply(user_id, "⚠ Ошибка: не осталось вопросов.")
         user_context.pop(user_id, None)
 
 
@@ -267,9 +978,7 @@ def paginate_final_errors(call):
     bot.answer_callback_query(call.id)
 
 
-@bot.message_handler(func=lambda message: str(message.chat.id) in user_context and
-                                          user_context[str(message.chat.id)].get("mode") == "quiz" and
-                                          user_context[str(message.chat.id)].get("current"))
+@state_handler(State.QUIZ_ANSWER)
 def handle_answer(message):
     user_id = str(message.chat.id)
     context = user_context.get(user_id)
@@ -283,34 +992,39 @@ def handle_answer(message):
         return
 
     question = context["current"]
+    if question is None:  # Следующий вопрос ещё не отправлен
+        return
     correct_answer = question["correct"].strip()
     qid = generate_id(question["question"])
     # Получаем выбранную категорию из контекста викторины
     category = context.get("category", "Без категории")
 
-    if user_answer == correct_answer:
-        bot.send_message(user_id, "✅ Верно!")
-        question["correct_count"] += 1
-    else:
-        bot.send_message(user_id, f"❌ Неверно! Правильный ответ: {correct_answer}.", reply_markup=ReplyKeyboardRemove())
-        question["correct_count"] = 0  # Сброс счетчика
-
-        # Добавляем ошибку в session_errors
-        context["session_errors"][qid] = correct_answer
-
-        # Сохраняем ошибку в errors.json с учётом категории
-        if user_id not in errors:
-            errors[user_id] = {}
-        if category not in errors[user_id]:
-            errors[user_id][category] = {}
-        if question["question"] in errors[user_id][category]:
-            errors[user_id][category][question["question"]] += 1
+    # Вердикт и следующий вопрос уходят одним сообщением
+    with coalesced_replies(user_id):
+        # Для интервального повторения считается только первый ответ на слово за сессию:
+        # повторы в следующих кругах не должны раз за разом сдвигать карточку
+        reviewed = context["reviewed"]
+        if qid not in reviewed:
+            reviewed.add(qid)
+            record_review(user_id, category, question["question"], user_answer == correct_answer)
+        record_stats(user_id, category, user_answer == correct_answer)
+        if user_answer == correct_answer:
+            reply(user_id, "✅ Верно!")
+            question["correct_count"] += 1
         else:
-            errors[user_id][category][question["question"]] = 1
-        save_json("errors.json", errors)
+            reply(user_id, f"❌ Неверно! Правильный ответ: {correct_answer}.", reply_markup=ReplyKeyboardRemove())
+            question["correct_count"] = 0  # Сброс счетчика
 
-    context["current"] = None
-    send_quiz(user_id)
+            # Добавляем ошибку в session_errors
+            context["session_errors"][qid] = correct_answer
+
+            # Сохраняем ошибку в errors.json с учётом категории
+            count = errors.get(user_id, {}).get(category, {}).get(question["question"], 0)
+            set_error_count(user_id, category, question["question"], count + 1)
+            save_json("errors.json", errors)
+
+        context["current"] = None
+        send_quiz(user_id)
 
 
 @bot.message_handler(commands=['mistakes'])
@@ -320,15 +1034,9 @@ def show_errors(message):
         bot.send_message(user_id, "У вас нет ошибок!")
         return
 
-    # Функция для извлечения числа из названия категории (если оно есть)
-    def sort_key(category):
-        match = re.search(r'№\s*(\d+)', category)
-        return int(match.group(1)) if match else float('inf')
-
-    sorted_categories = sorted(errors[user_id].keys(), key=sort_key)
-
+    # Категории уже отсортированы по номеру «№ N» в названии
     markup = InlineKeyboardMarkup()
-    for category in sorted_categories:
+    for category in get_error_view(user_id).categories():
         markup.add(InlineKeyboardButton(category, callback_data=f"mistakes_category:{category}"))
     bot.send_message(user_id, "Выберите категорию ошибок:", reply_markup=markup)
 
@@ -341,29 +1049,26 @@ def mistakes_category_handler(call):
     if user_id not in errors or selected_category not in errors[user_id]:
         bot.send_message(user_id, "Ошибки в этой категории не найдены.")
         return
-    # Сортируем ошибки выбранной категории по убыванию количества
-    category_errors = sorted(errors[user_id][selected_category].items(), key=lambda x: (-x[1], x[0]))
+    # Страницы берутся из списка ошибок, отсортированного по убыванию количества (см. error_views.py)
     user_context[user_id] = {
         "mistakes_action": "view_category_mistakes",
         "mistakes_category": selected_category,
-        "mistakes_list": category_errors,
-        "page": 0,
-        "total_pages": (len(category_errors) - 1) // 10 + 1
+        "page": 0
     }
     send_category_mistakes_page(user_id)
 
 
 def send_category_mistakes_page(user_id, page=0):
     context = user_context.get(user_id)
-    if not context or "mistakes_list" not in context:
+    if not context or "mistakes_category" not in context:
         bot.send_message(user_id, "Сессия просмотра ошибок устарела.")
         return
-    mistakes_list = context["mistakes_list"]
-    total_errors = len(mistakes_list)
-    total_pages = (total_errors - 1) // 10 + 1
+    view = get_error_view(user_id)
+    total_errors = view.count(context["mistakes_category"])
+    total_pages = max(total_errors - 1, 0) // 10 + 1
     start_idx = page * 10
     end_idx = start_idx + 10
-    current_errors = mistakes_list[start_idx:end_idx]
+    current_errors = view.page(context["mistakes_category"], start_idx, end_idx)
 
     message_text = f"Ошибки категории '{context['mistakes_category']}' (Всего: {total_errors})\nСтраница {page + 1} из {total_pages}\n\n"
     for i, (q, count) in enumerate(current_errors, start=start_idx + 1):
@@ -401,11 +1106,12 @@ def send_category_mistakes_page(user_id, page=0):
 @bot.callback_query_handler(func=lambda call: call.data == "mistakes_cat_close")
 def close_category_mistakes(call):
     user_id = str(call.message.chat.id)
+    # Контекст сбрасываем до удаления: следующая команда пользователя может прийти сразу после него
+    user_context.pop(user_id, None)
     try:
         bot.delete_message(user_id, call.message.message_id)
     except Exception as e:
         print(f"Ошибка при удалении сообщения: {e}")
-    user_context.pop(user_id, None)
     bot.answer_callback_query(call.id)
 
 
@@ -517,12 +1223,12 @@ def add_word(message):
         markup.add(InlineKeyboardButton(category, callback_data=f"add_word_category:{category_hash}"))
 
     markup.add(InlineKeyboardButton("Создать новую категорию", callback_data="add_word_category:new"))
-    msg = bot.send_message(user_id, "Выберите категорию или создайте новую:", reply_markup=markup)
-
-    user_context[user_id] = {
-        "category_hashes": {generate_category_hash(c): c for c in categories},
-        "message_id": msg.message_id
+    # Контекст сохраняем до отправки: нажатие кнопки может прийти раньше, чем завершится обработчик
+    context = user_context[user_id] = {
+        "category_hashes": {generate_category_hash(c): c for c in categories}
     }
+    msg = bot.send_message(user_id, "Выберите категорию или создайте новую:", reply_markup=markup)
+    context["message_id"] = msg.message_id
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("add_word_category:"))
@@ -536,7 +1242,7 @@ def add_word_category(call):
         bot.send_message(user_id, "Введите название новой категории:", reply_markup=ReplyKeyboardRemove())
         # Устанавливаем контекст для создания категории
         add_word_context[user_id] = {
-            "step": "new_category",
+            "state": State.NEW_CATEGORY,
             "category": None
         }
         return
@@ -548,37 +1254,33 @@ def add_word_category(call):
         bot.send_message(user_id, "Ошибка: категория не найдена.")
         return
 
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    markup.add(KeyboardButton("Обычное добавление"), KeyboardButton("Массовое добавление"))
-    bot.send_message(user_id, f"Выберите режим добавления в '{category_name}':", reply_markup=markup)
-
+    # Контекст сохраняем до отправки: ответ пользователя может прийти раньше, чем завершится обработчик
     add_word_context[user_id] = {
         "category": category_name,
-        "step": "choose_mode"
+        "state": State.ADD_WORD_MODE
     }
 
+    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    markup.add(KeyboardButton("Обычное добавление"), KeyboardButton("Массовое добавление"))
+    bot.send_message(user_id, f"Выберите режим добавления в '{category_name}':", reply_markup=markup)
+
 
-@bot.message_handler(
-    func=lambda message: str(message.chat.id) in add_word_context and add_word_context[str(message.chat.id)].get(
-        "step") == "choose_mode")
+@state_handler(State.ADD_WORD_MODE)
 def handle_choose_add_mode(message):
     user_id = str(message.chat.id)
     mode = message.text.strip()
 
     if mode == "Обычное добавление":
-        add_word_context[user_id]["step"] = "add_word"
+        add_word_context[user_id]["state"] = State.ADD_WORD
         bot.send_message(user_id,
                          f"Добавляем слово в категорию '{add_word_context[user_id]['category']}'. Введите слово в формате:\nНеверный вариант (первая строка)\nВерный вариант (вторая строка):")
     elif mode == "Массовое добавление":
-        add_word_context[user_id]["bulk_mode"] = True
-        add_word_context[user_id]["step"] = "add_words_bulk"
+        add_word_context[user_id]["state"] = State.ADD_WORDS_BULK
         bot.send_message(user_id,
-                         f"Вы вошли в режим массового добавления в категорию '{add_word_context[user_id]['category']}'.\nВводите слова в формате:\nНеверный вариант (первая строка)\nВерный вариант (вторая строка)\n\nКогда закончите, отправьте 'Готово' или команду /done.")
+                         f"Вы вошли в режим массового добавления в категорию '{add_word_context[user_id]['category']}'.\nВводите слова в формате:\nНеверный вариант (первая строка)\nВерный вариант (вторая строка)\n\nМожно также отправить файл .txt (в том же формате) или .csv (два столбца: неверный, верный вариант).\n\nКогда закончите, отправьте 'Готово' или команду /done.")
 
 
-@bot.message_handler(
-    func=lambda message: str(message.chat.id) in add_word_context and add_word_context[str(message.chat.id)].get(
-        "bulk_mode"))
+@state_handler(State.ADD_WORDS_BULK)
 def handle_bulk_word_addition(message):
     user_id = str(message.chat.id)
     text = message.text.strip()
@@ -596,52 +1298,207 @@ def handle_bulk_word_addition(message):
                          "❌ Вы уже в режиме массового добавления. Чтобы выйти, отправьте 'Готово' или команду /done.")
         return
 
-    # Разделяем вводимые слова по двойному переводу строки (каждая пара слов - отдельный блок)
-    words = text.split("\n\n")
+    # Слова разделены пустой строкой, как в файле .txt: проверяются так же, как при импорте
     category = add_word_context[user_id]["category"]
-    added_count = 0  # Счетчик добавленных слов
+    new_words, line_errors = check_word_records(iter_txt_records(text.split("\n")))
+    if line_errors:
+        bot.send_message(user_id, "❌ Не добавлены (формат: неверный вариант в первой строке, верный — во второй):\n"
+                         + format_line_errors(line_errors))
+
+    added_count, duplicates = commit_new_words(user_id, category, new_words)
+    if duplicates:
+        bot.send_message(user_id, f"🔁 Пропущено дубликатов: {duplicates}.")
+    if added_count > 0:
+        bot.send_message(user_id,
+                         f"✅ Добавлено {added_count} слов в категорию '{category}'. Продолжайте вводить или отправьте 'Готово'.")
 
-    for word_entry in words:
-        word_data = word_entry.strip().split("\n")  # Разделяем на строки
 
-        # Проверяем, что в вводе ровно 2 строки (неверный и верный вариант)
-        if len(word_data) != 2:
-            bot.send_message(user_id,
-                             "❌ Ошибка! Введите слово в формате:\nНеверный вариант (первая строка)\nВерный вариант (вторая строка).")
+def commit_new_words(user_id, category, new_words):
+    """Добавляет слова в категорию одной записью на диск и обновляет общие категории.
+
+    Дубликаты (уже существующие в категории или повторяющиеся в самом списке) и слова, вопрос
+    которых не в формате «неверный←верный» (см. word_format_error), пропускаются.
+    Возвращает количество добавленных слов и количество пропущенных дубликатов.
+    """
+    unique_words = []
+    invalid = 0
+    for word in new_words:
+        error = word_format_error(word)
+        if error:
+            print(f"Слово {word['question']!r} не сохранено в '{category}': {error}")
+            invalid += 1
+            continue
+        if is_duplicate_word(user_id, category, word["question"]):
+            continue
+        index_add_word(user_id, category, word["question"])
+        unique_words.append(word)
+    duplicates = len(new_words) - len(unique_words) - invalid
+    new_words = unique_words
+    if not new_words:
+        return 0, duplicates
+
+    user_categories[user_id][category].extend(new_words)
+    save_json("user_categories.json", user_categories)
+
+    # Если пользователь в списке разрешённых, обновляем общие категории
+    if user_id in allowed_users:
+        add_shared_words(category, new_words)
+
+    return len(new_words), duplicates
+
+
+MAX_IMPORT_FILE_SIZE = 2 * 1024 * 1024  # Максимальный размер файла для импорта (2 МБ)
+MAX_IMPORT_ERRORS_SHOWN = 20  # Сколько ошибок показывать в отчёте об импорте
+
+
+def validate_word_pair(wrong_word, correct_word, symbols=None):
+    """Проверяет пару слов и возвращает описание ошибки или None."""
+    if not wrong_word or not correct_word:
+        return "пустой вариант"
+    if "←" in wrong_word or "←" in correct_word:
+        return "недопустимый символ ←"
+    if contains_invalid_symbols(wrong_word + correct_word, symbols):
+        return "запрещённые символы"
+    if len(wrong_word) > 50 or len(correct_word) > 50:
+        return "вариант длиннее 50 символов"
+    if has_excessive_repetition(correct_word):
+        return "слишком много повторяющихся символов"
+    return None
+
+
+def word_format_error(word):
+    """Проверяет сохраняемое слово: вопрос разбирается как «неверный←верный», а correct — его верный вариант."""
+    options = question_options(word["question"])
+    if options is None:
+        return "вопрос не в формате «неверный←верный»"
+    if options[1] != word["correct"]:
+        return "верный вариант не совпадает с вопросом"
+    return None
+
+
+def check_word_records(records):
+    """Проверяет записи (номер строки, неверный, верный, ошибка разбора).
+
+    Возвращает слова для commit_new_words и список (номер строки, ошибка).
+    """
+    symbols = load_allowed_symbols()  # Один раз на всю пачку
+    new_words = []
+    line_errors = []
+    for line_no, wrong_word, correct_word, error in records:
+        if error is None:
+            error = validate_word_pair(wrong_word, correct_word, symbols)
+        if error:
+            line_errors.append((line_no, error))
             continue
+        new_words.append({"question": f"{wrong_word}←{correct_word}", "correct": correct_word})
+    return new_words, line_errors
+
+
+def format_line_errors(line_errors):
+    text = "\n".join(f"Строка {line_no}: {error}" for line_no, error in line_errors[:MAX_IMPORT_ERRORS_SHOWN])
+    if len(line_errors) > MAX_IMPORT_ERRORS_SHOWN:
+        text += f"\n… и ещё {len(line_errors) - MAX_IMPORT_ERRORS_SHOWN}"
+    return text
+
+
+def iter_txt_records(lines):
+    """Разбирает текст блоками по две строки, разделёнными пустой строкой.
+
+    Возвращает кортежи (номер строки, неверный, верный, ошибка).
+    """
+    block = []
+    block_start = 0
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if line:
+            if not block:
+                block_start = line_no
+            block.append(line)
+            continue
+        if block:
+            yield _txt_block_record(block_start, block)
+            block = []
+    if block:
+        yield _txt_block_record(block_start, block)
 
-        wrong_word, correct_word = word_data
 
-        new_word = {
-            "question": f"{wrong_word.strip()}←{correct_word.strip()}",
-            "correct": correct_word.strip()
-        }
+def _txt_block_record(line_no, block):
+    if len(block) != 2:
+        return line_no, None, None, "ожидалось ровно 2 строки (неверный и верный вариант)"
+    return line_no, block[0], block[1], None
 
-        user_categories[user_id][category].append(new_word)
-        added_count += 1
 
-    if added_count > 0:
-        save_json("user_categories.json", user_categories)
-        bot.send_message(user_id,
-                         f"✅ Добавлено {added_count} слов в категорию '{category}'. Продолжайте вводить или отправьте 'Готово'.")
+def iter_csv_records(lines):
+    """Разбирает CSV с двумя столбцами: неверный и верный вариант."""
+    lines = iter(lines)
+    first_line = next(lines, "")
+    delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+
+    def all_lines():
+        yield first_line
+        yield from lines
+
+    for line_no, row in enumerate(csv.reader(all_lines(), delimiter=delimiter), start=1):
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) != 2:
+            yield line_no, None, None, "ожидалось 2 столбца"
+            continue
+        yield line_no, row[0].strip(), row[1].strip(), None
+
+
+@bot.message_handler(
+    content_types=['document'],
+    func=lambda message: conversation_state(str(message.chat.id)) is State.ADD_WORDS_BULK)
+def handle_bulk_word_file(message):
+    """Импорт слов из файла .txt/.csv в режиме массового добавления."""
+    user_id = str(message.chat.id)
+    document = message.document
+    category = add_word_context[user_id]["category"]
+    file_name = document.file_name or ""
+    extension = os.path.splitext(file_name)[1].lower()
+
+    if extension not in (".txt", ".csv"):
+        bot.send_message(user_id, "❌ Поддерживаются только файлы .txt и .csv.")
+        return
+
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        bot.send_message(user_id, "❌ Файл слишком большой. Максимальный размер — 2 МБ.")
+        return
+
+    try:
+        file_info = bot.get_file(document.file_id)
+        data = bot.download_file(file_info.file_path)
+    except Exception as e:
+        bot.send_message(user_id, f"❌ Не удалось загрузить файл: {e}")
+        return
+
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", errors="replace")
+    records = iter_csv_records(lines) if extension == ".csv" else iter_txt_records(lines)
 
+    new_words, line_errors = check_word_records(records)
+    added_count, duplicates = commit_new_words(user_id, category, new_words)
 
-# Загрузка данных
-categories_for_all_users = load_json("categories_for_all_users.json", {})
-allowed_users = load_json("allowed_users.json", [])
+    report = (f"📥 Импорт из файла '{file_name}' в категорию '{category}':\n"
+              f"✅ Добавлено: {added_count}\n"
+              f"🔁 Дубликатов пропущено: {duplicates}\n"
+              f"❌ Ошибок: {len(line_errors)}")
+    if line_errors:
+        report += "\n\n" + format_line_errors(line_errors)
+    bot.send_message(user_id, report)
 
 
-@bot.message_handler(func=lambda message: str(message.chat.id) in add_word_context)
+@state_handler(State.NEW_CATEGORY, State.ADD_WORD)
 def handle_add_word_steps(message):
     user_id = str(message.chat.id)
-    step = add_word_context[user_id].get("step")
+    state = add_word_context[user_id].get("state")
 
     if message.text.strip() == "Отменить создание":
         bot.send_message(user_id, "Создание категории отменено.", reply_markup=ReplyKeyboardRemove())
         del add_word_context[user_id]
         return
 
-    if step == "new_category":
+    if state is State.NEW_CATEGORY:
         category_name = message.text.strip()
 
         # Проверяем наличие запрещенных символов
@@ -660,6 +1517,7 @@ def handle_add_word_steps(message):
 
         # Создаем новую категорию
         user_categories[user_id][category_name] = []
+        drop_word_index(user_id, category_name)
         save_json("user_categories.json", user_categories)
 
         add_word_context[user_id]["category"] = category_name
@@ -670,9 +1528,9 @@ def handle_add_word_steps(message):
             "Верный вариант (вторая строка):",
             parse_mode="HTML"
         )
-        add_word_context[user_id]["step"] = "add_word"
+        add_word_context[user_id]["state"] = State.ADD_WORD
 
-    elif step == "add_word":
+    elif state is State.ADD_WORD:
         # Проверяем наличие запрещённых символов
         if contains_invalid_symbols(message.text):
             bot.send_message(user_id, "Недопустимо! Сообщение содержит запрещённые символы.")
@@ -692,32 +1550,30 @@ def handle_add_word_steps(message):
             )
             return
 
-        wrong_word, correct_word = word_data
-
-        # Проверяем длину каждого слова
-        if len(wrong_word.strip()) > 50 or len(correct_word.strip()) > 50 or has_excessive_repetition(
-                correct_word.strip()):
-            bot.send_message(
-                user_id,
-                "Ошибка! Каждое слово (и неверный, и верный варианты) не должно превышать 50 символов."
-            )
-            return
+        wrong_word, correct_word = word_data[0].strip(), word_data[1].strip()
 
-        # Добавляем слово в категорию
         new_word = {
-            "question": f"{wrong_word.strip()}←{correct_word.strip()}",
-            "correct": correct_word.strip()
+            "question": f"{wrong_word}←{correct_word}",
+            "correct": correct_word
         }
 
+        # Проверяем слово так же, как при массовом добавлении и импорте
+        error = validate_word_pair(wrong_word, correct_word) or word_format_error(new_word)
+        if error:
+            bot.send_message(user_id, f"Ошибка! Слово не добавлено: {error}.")
+            return
+
+        if is_duplicate_word(user_id, category, new_word["question"]):
+            bot.send_message(user_id, f"🔁 Такое слово уже есть в категории '{category}'.")
+            return
+
         user_categories[user_id][category].append(new_word)
+        index_add_word(user_id, category, new_word["question"])
         save_json("user_categories.json", user_categories)
 
         # Если пользователь в списке разрешённых, обновляем общие категории
         if user_id in allowed_users:
-            if category not in categories_for_all_users:
-                categories_for_all_users[category] = []
-            categories_for_all_users[category].append(new_word)
-            save_json("categories_for_all_users.json", categories_for_all_users)
+            add_shared_words(category, [new_word])
 
         bot.send_message(
             user_id,
@@ -726,6 +1582,82 @@ def handle_add_word_steps(message):
         del add_word_context[user_id]
 
 
+def find_duplicate_words(words):
+    """Возвращает пары (индекс первого вхождения, индекс повтора) для дубликатов в списке слов."""
+    first_seen = {}
+    duplicates = []
+    for idx, word in enumerate(words):
+        key = normalize_word_key(word["question"])
+        if key in first_seen:
+            duplicates.append((first_seen[key], idx))
+        else:
+            first_seen[key] = idx
+    return duplicates
+
+
+@bot.message_handler(commands=['dedupe'])
+def dedupe_words(message):
+    """Отчёт о дубликатах слов во всех категориях пользователя."""
+    user_id = str(message.chat.id)
+    report = []
+    total = 0
+    for category in sorted(user_categories.get(user_id, {}).keys(), key=natural_sort_key):
+        duplicates = find_duplicate_words(user_categories[user_id][category])
+        if duplicates:
+            total += len(duplicates)
+            report.append(f"• {category}: {len(duplicates)}")
+
+    if not total:
+        bot.send_message(user_id, "Дубликатов не найдено.")
+        return
+
+    markup = InlineKeyboardMarkup()
+    markup.add(InlineKeyboardButton("Удалить дубликаты", callback_data="dedupe_apply"))
+    markup.add(InlineKeyboardButton("Отмена", callback_data="dedupe_cancel"))
+    bot.send_message(user_id, f"🔁 Найдено дубликатов: {total}\n" + "\n".join(report), reply_markup=markup)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "dedupe_apply")
+def dedupe_apply(call):
+    """Удаляет повторы слов, оставляя первое вхождение и перенося на него счётчики ошибок."""
+    bot.answer_callback_query(call.id)
+    user_id = str(call.message.chat.id)
+    removed = 0
+    for category, words in user_categories.get(user_id, {}).items():
+        duplicates = find_duplicate_words(words)
+        if not duplicates:
+            continue
+
+        category_errors = errors.get(user_id, {}).get(category, {})
+        for keep_idx, duplicate_idx in duplicates:
+            kept_question = words[keep_idx]["question"]
+            duplicate_question = words[duplicate_idx]["question"]
+            if duplicate_question != kept_question and duplicate_question in category_errors:
+                set_error_count(user_id, category, kept_question,
+                                category_errors.get(kept_question, 0) + category_errors[duplicate_question])
+                set_error_count(user_id, category, duplicate_question, 0)
+
+        duplicate_indexes = {duplicate_idx for _, duplicate_idx in duplicates}
+        user_categories[user_id][category] = [
+            word for idx, word in enumerate(words) if idx not in duplicate_indexes
+        ]
+        drop_word_index(user_id, category)
+        removed += len(duplicate_indexes)
+
+    if removed:
+        save_json("user_categories.json", user_categories)
+        save_json("errors.json", errors)
+    bot.edit_message_text(f"✅ Удалено дубликатов: {removed}.", chat_id=user_id,
+                          message_id=call.message.message_id)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "dedupe_cancel")
+def dedupe_cancel(call):
+    bot.answer_callback_query(call.id)
+    bot.edit_message_text("Удаление дубликатов отменено.", chat_id=str(call.message.chat.id),
+                          message_id=call.message.message_id)
+
+
 # Удаление категорий или слов
 @bot.message_handler(commands=['remove_word'])
 def remove_word(message):
@@ -786,6 +1718,7 @@ def confirm_remove_category(call):
         return
 
     user_context[user_id]["delete_category"] = category_name  # Сохраняем для подтверждения
+    user_context[user_id]["state"] = State.REMOVE_CATEGORY_CONFIRM
 
     markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.add(KeyboardButton("1"), KeyboardButton("0"))
@@ -946,13 +1879,12 @@ def ask_for_search_word(call):
 
     # Сохраняем выбранную категорию в контексте
     user_context[user_id]["category_hash"] = category_hash
-    user_context[user_id]["search_mode"] = True  # Включаем режим поиска
+    user_context[user_id]["state"] = State.REMOVE_WORD_SEARCH  # Включаем режим поиска
 
     bot.send_message(user_id, f"🔎 Введите часть слова, которое хотите удалить из категории '{category_name}':")
 
 
-@bot.message_handler(
-    func=lambda message: str(message.chat.id) in user_context and user_context[str(message.chat.id)].get("search_mode"))
+@state_handler(State.REMOVE_WORD_SEARCH)
 def search_word_to_remove(message):
     """Фильтруем слова в категории по введенному запросу."""
     user_id = str(message.chat.id)
@@ -982,7 +1914,7 @@ def search_word_to_remove(message):
     # Сохраняем отфильтрованный список слов в контексте
     user_context[user_id]["word_list"] = filtered_words
     user_context[user_id]["current_page"] = 0
-    user_context[user_id]["search_mode"] = False  # Отключаем режим поиска
+    user_context[user_id]["state"] = None  # Отключаем режим поиска
 
     send_word_list(user_id)  # Отправляем список найденных слов
 
@@ -1026,6 +1958,7 @@ def confirm_remove_word(call):
         "category": category_name,
         "word": word_to_delete
     }
+    user_context[user_id]["state"] = State.REMOVE_WORD_CONFIRM
 
     markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.add(KeyboardButton("1"), KeyboardButton("0"))
@@ -1037,10 +1970,7 @@ def confirm_remove_word(call):
     )
 
 
-@bot.message_handler(func=lambda message: (
-        str(message.chat.id) in user_context and
-        "delete_word" in user_context[str(message.chat.id)]
-))
+@state_handler(State.REMOVE_WORD_CONFIRM)
 def handle_word_deletion_confirmation(message):
     user_id = str(message.chat.id)
     confirmation = message.text.strip()
@@ -1058,10 +1988,13 @@ def handle_word_deletion_confirmation(message):
     if confirmation == "1":  # Подтверждение удаления
         if category in user_categories.get(user_id, {}):
             # Удаляем слово из категории
+            words_before = len(user_categories[user_id][category])
             user_categories[user_id][category] = [
                 word for word in user_categories[user_id][category]
                 if word != word_to_delete
             ]
+            index_remove_word(user_id, category, word_to_delete["question"],
+                              words_before - len(user_categories[user_id][category]))
             # Если категория стала пустой, удаляем её
             if not user_categories[user_id][category]:
                 del user_categories[user_id][category]
@@ -1069,10 +2002,7 @@ def handle_word_deletion_confirmation(message):
 
             # Удаляем связанные ошибки из файла errors.json
             if user_id in errors and category in errors[user_id]:
-                errors[user_id][category].pop(word_to_delete["question"], None)
-                # Если в категории ошибок больше не осталось, удаляем категорию
-                if not errors[user_id][category]:
-                    del errors[user_id][category]
+                set_error_count(user_id, category, word_to_delete["question"], 0)
                 save_json("errors.json", errors)
 
             bot.send_message(
@@ -1090,10 +2020,7 @@ def handle_word_deletion_confirmation(message):
         bot.send_message(user_id, "Некорректный ввод. Нажмите 1 для удаления или 0 для отмены.")
 
 
-@bot.message_handler(func=lambda message: (
-        str(message.chat.id) in user_context and
-        "delete_category" in user_context[str(message.chat.id)]
-))
+@state_handler(State.REMOVE_CATEGORY_CONFIRM)
 def handle_category_deletion_confirmation(message):
     user_id = str(message.chat.id)
     confirmation = message.text.strip()
@@ -1108,10 +2035,11 @@ def handle_category_deletion_confirmation(message):
             try:
                 # Удаляем категорию с ошибками из errors.json, если такая существует
                 if user_id in errors and category in errors[user_id]:
-                    del errors[user_id][category]
+                    drop_error_category(user_id, category)
                     save_json("errors.json", errors)
                 # Удаляем категорию из user_categories
                 del user_categories[user_id][category]
+                drop_word_index(user_id, category)
                 save_json("user_categories.json", user_categories)
                 bot.send_message(user_id, f"Категория '{category}' успешно удалена.",
                                  reply_markup=ReplyKeyboardRemove())
@@ -1128,92 +2056,10 @@ def handle_category_deletion_confirmation(message):
     user_context.pop(user_id, None)
 
 
-@bot.message_handler(func=lambda message: (
-        str(message.chat.id) in user_context and
-        "delete_word" in user_context[str(message.chat.id)]
-))
-def handle_deletion_confirmation(message):
-    user_id = str(message.chat.id)
-    context = user_context.get(user_id, {})
-    confirmation = message.text.strip()
-
-    if confirmation == "1":  # Подтверждение удаления
-        delete_info = context.get("delete_word")
-        if not delete_info:
-            bot.send_message(user_id, "Ошибка: информация для удаления отсутствует.",
-                             reply_markup=ReplyKeyboardRemove())
-            user_context.pop(user_id, None)  # Удаляем контекст
-            return
-
-        category = delete_info["category"]
-        question_id = delete_info["question_id"]
-        word_to_delete = delete_info["word"]
-
-        # Проверяем существование категории
-        if category not in user_categories.get(user_id, {}):
-            bot.send_message(user_id, f"Категория '{category}' не найдена или уже удалена.",
-                             reply_markup=ReplyKeyboardRemove())
-            user_context.pop(user_id, None)  # Удаляем контекст
-            return
-
-        # Удаляем слово из категории
-        user_categories[user_id][category] = [
-            word for word in user_categories[user_id][category]
-            if generate_id(word["question"]) != question_id
-        ]
-        save_json("user_categories.json", user_categories)
-
-        # Подтверждение удаления
-        bot.send_message(
-            user_id,
-            f"Слово '{word_to_delete['question'].replace('←', '/')}' успешно удалено из категории '{category}'.",
-            reply_markup=ReplyKeyboardRemove()
-        )
-
-        # Удаляем контекст
-        user_context.pop(user_id, None)
-
-    elif confirmation == "0":  # Отмена удаления
-        bot.send_message(user_id, "Удаление отменено.", reply_markup=ReplyKeyboardRemove())
-        user_context.pop(user_id, None)
-    else:  # Некорректный ввод
-        bot.send_message(user_id, "Некорректный ввод. Нажмите 1 для удаления или 0 для отмены.")
-
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("remove_category:"))
-def remove_category(call):
-    bot.answer_callback_query(call.id)
-    user_id = str(call.message.chat.id)
-    category = call.data.split(":")[1]
-
-    # Проверяем, существует ли категория
-    if category in user_categories.get(user_id, {}):
-        # Удаляем связанные ошибки, даже если категория пустая
-        if user_id in errors:
-            category_questions = {
-                word["question"]
-                for word in user_categories[user_id].get(category, [])
-            }
-            errors[user_id] = {
-                question: count
-                for question, count in errors[user_id].items()
-                if question not in category_questions
-            }
-            save_json("errors.json", errors)
-
-        # Удаляем категорию
-        del user_categories[user_id][category]
-        save_json("user_categories.json", user_categories)
-        bot.send_message(user_id, f"Категория '{category}' успешно удалена.")
-    else:
-        bot.send_message(user_id, f"Категория '{category}' не найдена.")
-
-
 @bot.message_handler(commands=['remove_word'])
 def remove_word(message):
     """Выбор действия для удаления (категория или слово)."""
     user_id = str(message.chat.id)
-
     if user_id not in user_categories or not user_categories[user_id]:
         bot.send_message(user_id, "У вас нет категорий или слов для удаления.")
         return
@@ -1221,18 +2067,446 @@ def remove_word(message):
     markup = InlineKeyboardMarkup()
     markup.add(InlineKeyboardButton("Удалить категорию", callback_data="remove_category_menu"))
     markup.add(InlineKeyboardButton("Удалить слово", callback_data="remove_word_menu"))
-
     bot.send_message(user_id, "Выберите действие для удаления:", reply_markup=markup)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_word:"))
-def delete_word(call):
+@bot.callback_query_handler(func=lambda call: call.data == "remove_category_menu")
+def show_categories_for_removal(call):
     bot.answer_callback_query(call.id)
     user_id = str(call.message.chat.id)
-    # Callback содержит данные в формате "delete_word:category:question_id"
-    _, category, question_id = call.data.split(":", 2)
-    words = user_categories[user_id].get(category, [])
-    # Ищем удаляемый вопрос по хэшу
+    categories = sorted(user_categories.get(user_id, {}).keys(), key=natural_sort_key)
+
+    if not categories:
+        bot.send_message(user_id, "У вас нет категорий для удаления.")
+        return
+
+    markup = InlineKeyboardMarkup()
+    category_hash_map = {}
+    for category in categories:
+        category_hash = generate_category_hash(category)
+        category_hash_map[category_hash] = category
+        markup.add(InlineKeyboardButton(category, callback_data=f"confirm_remove_category:{category_hash}"))
+
+    user_context[user_id] = {
+        "category_hash_map": category_hash_map,
+        "message_id": call.message.message_id
+    }
+
+    bot.edit_message_text(
+        chat_id=user_id,
+        message_id=call.message.message_id,
+        text="Выберите категорию для удаления:",
+        reply_markup=markup
+    )
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("confirm_remove_category:"))
+def confirm_remove_category(call):
+    """Запрашиваем подтверждение удаления категории."""
+    bot.answer_callback_query(call.id)
+    user_id = str(call.message.chat.id)
+    category_hash = call.data.split(":")[1]
+
+    category_hash_map = user_context.get(user_id, {}).get("category_hash_map", {})
+    category_name = category_hash_map.get(category_hash)
+
+    if not category_name:
+        bot.send_message(user_id, "Ошибка: категория не найдена.")
+        return
+
+    user_context[user_id]["delete_category"] = category_name  # Сохраняем для подтверждения
+    user_context[user_id]["state"] = State.REMOVE_CATEGORY_CONFIRM
+
+    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    markup.add(KeyboardButton("1"), KeyboardButton("0"))
+
+    bot.send_message(
+        user_id,
+        f"Вы уверены, что хотите удалить категорию '{category_name}'?\n"
+        "Нажмите 1 для удаления или 0 для отмены.",
+        reply_markup=markup
+    )
+
+
+WORDS_PER_PAGE = 10  # Количество слов на одной странице
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "remove_word_menu")
+def show_categories_to_choose_word(call):
+    bot.answer_callback_query(call.id)
+    user_id = str(call.message.chat.id)
+
+    # Сортировка категорий с естественным порядком
+    categories = sorted(
+        user_categories.get(user_id, {}).keys(),
+        key=natural_sort_key
+    )
+
+    if not categories:
+        bot.send_message(user_id, "У вас нет категорий для удаления слов.")
+        return
+
+    markup = InlineKeyboardMarkup()
+    category_hash_map = {}
+
+    for category in categories:
+        category_hash = generate_category_hash(category)
+        category_hash_map[category_hash] = category
+        markup.add(InlineKeyboardButton(
+            category,
+            callback_data=f"search_word_to_remove:{category_hash}"
+        ))
+
+    user_context[user_id] = {
+        "category_hash_map": category_hash_map,
+        "action": "remove_word"
+    }
+
+    bot.edit_message_text(
+        chat_id=user_id,
+        message_id=call.message.message_id,
+        text="Выберите категорию для удаления слова:",
+        reply_markup=markup
+    )
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("choose_word_to_remove:"))
+def show_words_for_removal(call):
+    """Показываем слова в выбранной категории с постраничной навигацией."""
+    bot.answer_callback_query(call.id)
+    user_id = str(call.message.chat.id)
+    category_hash = call.data.split(":")[1]
+
+    # Проверяем, есть ли кеш категорий
+    if user_id not in user_context or "category_hash_map" not in user_context[user_id]:
+        bot.send_message(user_id, "Ошибка: данные устарели, попробуйте снова.")
+        return
+
+    category_name = user_context[user_id]["category_hash_map"].get(category_hash)
+    if not category_name or category_name not in user_categories.get(user_id, {}):
+        bot.send_message(user_id, "Ошибка: категория не найдена.")
+        return
+
+    words = user_categories[user_id][category_name]
+    if not words:
+        bot.send_message(user_id, f"В категории '{category_name}' нет слов для удаления.")
+        return
+
+    # Сохраняем кеш слов и текущую страницу
+    user_context[user_id]["word_list"] = words
+    user_context[user_id]["current_page"] = 0
+    user_context[user_id]["category_hash"] = category_hash
+
+    send_word_list(user_id)
+
+
+def send_word_list(user_id):
+    """Отправляет список найденных слов с кнопками навигации."""
+    if user_id not in user_context or "word_list" not in user_context[user_id]:
+        bot.send_message(user_id, "Ошибка: кеш данных устарел, попробуйте снова.")
+        return
+
+    words = user_context[user_id]["word_list"]
+    category_hash = user_context[user_id]["category_hash"]
+    page = user_context[user_id]["current_page"]
+
+    total_pages = (len(words) - 1) // WORDS_PER_PAGE + 1  # Количество страниц
+    start = page * WORDS_PER_PAGE
+    end = start + WORDS_PER_PAGE
+
+    markup = InlineKeyboardMarkup()
+    word_hash_map = {}
+
+    for word in words[start:end]:  # Показываем только слова на текущей странице
+        question_text = word["question"].replace("←", " / ")
+        question_hash = generate_id(word["question"])
+        word_hash_map[question_hash] = word["question"]
+        markup.add(
+            InlineKeyboardButton(question_text, callback_data=f"confirm_remove_word:{category_hash}:{question_hash}"))
+
+    # Кнопки "⏪ Назад" и "⏩ Далее"
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton("⏪ Назад", callback_data="prev_page"))
+    if end < len(words):
+        nav_buttons.append(InlineKeyboardButton("⏩ Далее", callback_data="next_page"))
+
+    if nav_buttons:
+        markup.row(*nav_buttons)  # Добавляем кнопки в одну строку
+
+    user_context[user_id]["word_hash_map"] = word_hash_map  # Сохраняем кеш хэшей слов
+    bot.send_message(user_id, f"📖 Страница {page + 1} из {total_pages}\nВыберите слово для удаления:",
+                     reply_markup=markup)
+
+
+@bot.callback_query_handler(func=lambda call: call.data in ["prev_page", "next_page"])
+def paginate_words(call):
+    """Переключает страницы списка слов."""
+    bot.answer_callback_query(call.id)
+    user_id = str(call.message.chat.id)
+
+    if user_id not in user_context or "current_page" not in user_context[user_id]:
+        bot.send_message(user_id, "Ошибка: кеш данных устарел, попробуйте снова.")
+        return
+
+    if call.data == "prev_page":
+        user_context[user_id]["current_page"] -= 1
+    elif call.data == "next_page":
+        user_context[user_id]["current_page"] += 1
+
+    send_word_list(user_id)  # Отправляем обновленный список слов
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("search_word_to_remove:"))
+def ask_for_search_word(call):
+    """Запрашиваем у пользователя слово для поиска в категории перед удалением."""
+    bot.answer_callback_query(call.id)
+    user_id = str(call.message.chat.id)
+    category_hash = call.data.split(":")[1]
+
+    # Проверяем, есть ли кеш категорий
+    if user_id not in user_context or "category_hash_map" not in user_context[user_id]:
+        bot.send_message(user_id, "Ошибка: данные устарели, попробуйте снова.")
+        return
+
+    category_name = user_context[user_id]["category_hash_map"].get(category_hash)
+    if not category_name or category_name not in user_categories.get(user_id, {}):
+        bot.send_message(user_id, "Ошибка: категория не найдена.")
+        return
+
+    # Сохраняем выбранную категорию в контексте
+    user_context[user_id]["category_hash"] = category_hash
+    user_context[user_id]["state"] = State.REMOVE_WORD_SEARCH  # Включаем режим поиска
+
+    bot.send_message(user_id, f"🔎 Введите часть слова, которое хотите удалить из категории '{category_name}':")
+
+
+@state_handler(State.REMOVE_WORD_SEARCH)
+def search_word_to_remove(message):
+    """Фильтруем слова в категории по введенному запросу."""
+    user_id = str(message.chat.id)
+    search_query = message.text.strip().lower()
+
+    # Проверяем, есть ли сохраненный хэш категории
+    category_hash = user_context[user_id].get("category_hash")
+    if not category_hash or "category_hash_map" not in user_context[user_id]:
+        bot.send_message(user_id, "Ошибка: данные устарели, попробуйте снова.")
+        return
+
+    category_name = user_context[user_id]["category_hash_map"].get(category_hash)
+    if not category_name or category_name not in user_categories.get(user_id, {}):
+        bot.send_message(user_id, "Ошибка: категория не найдена.")
+        return
+
+    words = user_categories[user_id][category_name]
+
+    # Фильтруем слова по вхождению текста
+    filtered_words = [word for word in words if search_query in word["question"].lower()]
+
+    if not filtered_words:
+        bot.send_message(user_id,
+                         f"❌ В категории '{category_name}' не найдено слов, содержащих '{search_query}'. Попробуйте снова.")
+        return
+
+    # Сохраняем отфильтрованный список слов в контексте
+    user_context[user_id]["word_list"] = filtered_words
+    user_context[user_id]["current_page"] = 0
+    user_context[user_id]["state"] = None  # Отключаем режим поиска
+
+    send_word_list(user_id)  # Отправляем список найденных слов
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("confirm_remove_word:"))
+def confirm_remove_word(call):
+    """Подтверждение удаления слова."""
+    bot.answer_callback_query(call.id)
+    user_id = str(call.message.chat.id)
+    _, category_hash, question_hash = call.data.split(":")
+
+    # Проверяем, есть ли сохраненный контекст
+    if user_id not in user_context or "category_hash_map" not in user_context[user_id]:
+        bot.send_message(user_id, "⚠ Данные устарели.")
+        return show_categories_to_choose_word(call)  # Возвращаем пользователя к выбору категории
+
+    category_name = user_context[user_id]["category_hash_map"].get(category_hash)
+    if not category_name:
+        bot.send_message(user_id, "Ошибка: категория не найдена. Выберите заново.")
+        return show_categories_to_choose_word(call)
+
+    word_hash_map = user_context[user_id].get("word_hash_map", {})
+    question_text = word_hash_map.get(question_hash)
+
+    if not question_text:
+        bot.send_message(user_id, "Ошибка: слово не найдено. Попробуйте снова.")
+        return show_categories_to_choose_word(call)
+
+    # Получаем список слов из категории
+    words = user_categories.get(user_id, {}).get(category_name, [])
+
+    # Ищем нужное слово
+    word_to_delete = next((word for word in words if word["question"] == question_text), None)
+
+    if not word_to_delete:
+        bot.send_message(user_id, "Слово не найдено или уже удалено.")
+        return show_categories_to_choose_word(call)
+
+    # Сохраняем данные для подтверждения
+    user_context[user_id]["delete_word"] = {
+        "category": category_name,
+        "word": word_to_delete
+    }
+    user_context[user_id]["state"] = State.REMOVE_WORD_CONFIRM
+
+    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    markup.add(KeyboardButton("1"), KeyboardButton("0"))
+
+    bot.send_message(
+        user_id,
+        f"Вы уверены, что хотите удалить слово '{question_text.replace('←', '/')}'? Нажмите 1 для удаления или 0 для отмены.",
+        reply_markup=markup
+    )
+
+
+@state_handler(State.REMOVE_WORD_CONFIRM)
+def handle_word_deletion_confirmation(message):
+    user_id = str(message.chat.id)
+    confirmation = message.text.strip()
+
+    # Получаем данные о слове для удаления
+    delete_info = user_context.get(user_id, {}).get("delete_word")
+    if not delete_info:
+        bot.send_message(user_id, "Ошибка: информация для удаления отсутствует.", reply_markup=ReplyKeyboardRemove())
+        user_context.pop(user_id, None)
+        return
+
+    category = delete_info["category"]
+    word_to_delete = delete_info["word"]
+
+    if confirmation == "1":  # Подтверждение удаления
+        if category in user_categories.get(user_id, {}):
+            # Удаляем слово из категории
+            words_before = len(user_categories[user_id][category])
+            user_categories[user_id][category] = [
+                word for word in user_categories[user_id][category]
+                if word != word_to_delete
+            ]
+            index_remove_word(user_id, category, word_to_delete["question"],
+                              words_before - len(user_categories[user_id][category]))
+            # Если категория стала пустой, удаляем её
+            if not user_categories[user_id][category]:
+                del user_categories[user_id][category]
+            save_json("user_categories.json", user_categories)
+
+            # Удаляем связанные ошибки из файла errors.json
+            if user_id in errors and category in errors[user_id]:
+                set_error_count(user_id, category, word_to_delete["question"], 0)
+                save_json("errors.json", errors)
+
+            bot.send_message(
+                user_id,
+                f"✅ Слово '{word_to_delete['question'].replace('←', '/')}' удалено из категории '{category}'.",
+                reply_markup=ReplyKeyboardRemove()
+            )
+        else:
+            bot.send_message(user_id, f"Ошибка: категория '{category}' не найдена.", reply_markup=ReplyKeyboardRemove())
+        user_context.pop(user_id, None)
+    elif confirmation == "0":  # Отмена удаления
+        bot.send_message(user_id, "Удаление отменено.", reply_markup=ReplyKeyboardRemove())
+        user_context.pop(user_id, None)
+    else:
+        bot.send_message(user_id, "Некорректный ввод. Нажмите 1 для удаления или 0 для отмены.")
+
+
+@state_handler(State.REMOVE_CATEGORY_CONFIRM)
+def handle_category_deletion_confirmation(message):
+    user_id = str(message.chat.id)
+    confirmation = message.text.strip()
+    category = user_context[user_id].get("delete_category")
+
+    if not category:
+        bot.send_message(user_id, "Ошибка: информация для удаления отсутствует.", reply_markup=ReplyKeyboardRemove())
+        return
+
+    if confirmation == "1":  # Подтверждение удаления
+        if category in user_categories.get(user_id, {}):
+            try:
+                # Удаляем категорию с ошибками из errors.json, если такая существует
+                if user_id in errors and category in errors[user_id]:
+                    drop_error_category(user_id, category)
+                    save_json("errors.json", errors)
+                # Удаляем категорию из user_categories
+                del user_categories[user_id][category]
+                drop_word_index(user_id, category)
+                save_json("user_categories.json", user_categories)
+                bot.send_message(user_id, f"Категория '{category}' успешно удалена.",
+                                 reply_markup=ReplyKeyboardRemove())
+            except Exception as e:
+                bot.send_message(user_id, f"Ошибка при удалении категории: {e}", reply_markup=ReplyKeyboardRemove())
+        else:
+            bot.send_message(user_id, f"Категория '{category}' не найдена или уже удалена.",
+                             reply_markup=ReplyKeyboardRemove())
+    elif confirmation == "0":  # Отмена удаления
+        bot.send_message(user_id, "Удаление отменено.", reply_markup=ReplyKeyboardRemove())
+    else:  # Некорректный ввод
+        bot.send_message(user_id, "Некорректный ввод. Нажмите 1 для удаления или 0 для отмены.")
+
+    user_context.pop(user_id, None)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("remove_category:"))
+def remove_category(call):
+    bot.answer_callback_query(call.id)
+    user_id = str(call.message.chat.id)
+    category = call.data.split(":")[1]
+
+    # Проверяем, существует ли категория
+    if category in user_categories.get(user_id, {}):
+        # Удаляем связанные ошибки, даже если категория пустая
+        if user_id in errors:
+            category_questions = {
+                word["question"]
+                for word in user_categories[user_id].get(category, [])
+            }
+            errors[user_id] = {
+                question: count
+                for question, count in errors[user_id].items()
+                if question not in category_questions
+            }
+            save_json("errors.json", errors)
+
+        # Удаляем категорию
+        del user_categories[user_id][category]
+        drop_word_index(user_id, category)
+        save_json("user_categories.json", user_categories)
+        bot.send_message(user_id, f"Категория '{category}' успешно удалена.")
+    else:
+        bot.send_message(user_id, f"Категория '{category}' не найдена.")
+
+
+@bot.message_handler(commands=['remove_word'])
+def remove_word(message):
+    """Выбор действия для удаления (категория или слово)."""
+    user_id = str(message.chat.id)
+
+    if user_id not in user_categories or not user_categories[user_id]:
+        bot.send_message(user_id, "У вас нет категорий или слов для удаления.")
+        return
+
+    markup = InlineKeyboardMarkup()
+    markup.add(InlineKeyboardButton("Удалить категорию", callback_data="remove_category_menu"))
+    markup.add(InlineKeyboardButton("Удалить слово", callback_data="remove_word_menu"))
+
+    bot.send_message(user_id, "Выберите действие для удаления:", reply_markup=markup)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_word:"))
+def delete_word(call):
+    bot.answer_callback_query(call.id)
+    user_id = str(call.message.chat.id)
+    # Callback содержит данные в формате "delete_word:category:question_id"
+    _, category, question_id = call.data.split(":", 2)
+    words = user_categories[user_id].get(category, [])
+    # Ищем удаляемый вопрос по хэшу
     word_to_delete = next((word for word in words if generate_id(word["question"]) == question_id), None)
     if not word_to_delete:
         bot.send_message(user_id, "Слово не найдено.")
@@ -1240,92 +2514,534 @@ def delete_word(call):
     # Удаляем слово из категории
     updated_words = [word for word in words if word != word_to_delete]
     user_categories[user_id][category] = updated_words
+    index_remove_word(user_id, category, word_to_delete["question"], len(words) - len(updated_words))
     save_json("user_categories.json", user_categories)
     # Удаляем связанные ошибки с учетом категории
     if user_id in errors and category in errors[user_id]:
-        errors[user_id][category].pop(word_to_delete["question"], None)
-        if not errors[user_id][category]:
-            del errors[user_id][category]
+        set_error_count(user_id, category, word_to_delete["question"], 0)
         save_json("errors.json", errors)
     bot.send_message(user_id, f"Слово '{word_to_delete['question']}' удалено из категории '{category}'.")
 
 
-# Напоминание-викторина
-def send_daily_quiz():
-    for user_id in user_categories:
-        categories = user_categories[user_id]
-        if not categories:
-            continue  # У пользователя нет категорий
-
-        # Выбираем случайную категорию и случайное слово
-        category_name = random.choice(list(categories.keys()))
-        words = categories[category_name]
-        if not words:
-            continue  # Категория пуста
-
-        question_data = random.choice(words)
-        question, correct_answer = question_data["question"].split("←")
-        options = [question.split("←")[0], correct_answer]
-        random.shuffle(options)
-
-        # Создаем клавиатуру с вариантами ответа
-        markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-        markup.add(KeyboardButton(options[0]), KeyboardButton(options[1]))
+# Все изменения числа ошибок идут через set_error_count и drop_error_category, которые заодно
+# обновляют производные структуры: сводку ошибок всех пользователей для /hardest (см. hardest.py)
+# и отсортированные списки ошибок пользователя для /mistakes и /clean_error (см. error_views.py).
+# Те и другие строятся по errors один раз, при первом обращении
+hardest_words = None
+user_error_views = {}  # Пользователь -> error_views.UserErrors
+errors_lock = threading.Lock()
+HARDEST_DEFAULT = 10
+HARDEST_MAX = 50
+
+
+def get_hardest_words():
+    global hardest_words
+    with errors_lock:
+        if hardest_words is None:
+            hardest_words = hardest.ErrorLeaderboard.from_errors(errors)
+        return hardest_words
+
+
+def get_error_view(user_id):
+    with errors_lock:
+        view = user_error_views.get(user_id)
+        if view is None:
+            view = user_error_views[user_id] = error_views.UserErrors(errors.get(user_id, {}))
+        return view
+
+
+def set_error_count(user_id, category, question_text, count):
+    """Задаёт число ошибок по слову (0 — слово убирается из ошибок, пустая категория тоже)."""
+    with errors_lock:
+        category_errors = errors.get(user_id, {}).get(category, {})
+        old_count = category_errors.get(question_text, 0)
+        if count > 0:
+            errors.setdefault(user_id, {}).setdefault(category, {})[question_text] = count
+        elif question_text in category_errors:
+            del category_errors[question_text]
+            if not category_errors:
+                del errors[user_id][category]
+        if hardest_words is not None:
+            hardest_words.update(question_text, count - old_count, (count > 0) - (old_count > 0))
+        view = user_error_views.get(user_id)
+        if view is not None:
+            view.set(category, question_text, old_count, count)
+
+
+def drop_error_category(user_id, category):
+    """Удаляет все ошибки пользователя в категории."""
+    with errors_lock:
+        category_errors = errors[user_id].pop(category, {})
+        if hardest_words is not None:
+            for question_text, count in category_errors.items():
+                if count > 0:
+                    hardest_words.update(question_text, -count, -1)
+        view = user_error_views.get(user_id)
+        if view is not None:
+            view.drop(category)
+
+
+def update_error_count(user_id, category, question_text, correct):
+    """Верный ответ уменьшает число ошибок по слову (на нуле слово убирается из ошибок), неверный — увеличивает."""
+    current_count = errors.get(user_id, {}).get(category, {}).get(question_text, 0)
+    new_count = current_count - 1 if correct else current_count + 1
+    set_error_count(user_id, category, question_text, max(new_count, 0))
+    invalidate_reminder_plan(user_id)
+    save_json("errors.json", errors)
+
+
+def rename_error(user_id, category, old_question, new_question):
+    """Переносит ошибки по слову на его новый текст после изменения слова. Возвращает True, если ошибки были."""
+    category_errors = errors.get(user_id, {}).get(category, {})
+    count = category_errors.get(old_question, 0)
+    if not count or old_question == new_question:
+        return False
+    merged = category_errors.get(new_question, 0) + count  # Новый текст мог уже встречаться в ошибках
+    set_error_count(user_id, category, old_question, 0)
+    set_error_count(user_id, category, new_question, merged)
+    invalidate_reminder_plan(user_id)
+    return True
+
+
+# ========== Интервальное повторение (см. srs.py) ==========
+srs_lock = threading.Lock()
+srs_changed = threading.Event()  # Карточки изменились после записи srs.json
+due_queues = {}  # Пользователь -> srs.DueQueue; строится при первом обращении
+
+
+def get_due_queue(user_id):
+    """Очередь повторения пользователя. Вызывать под srs_lock."""
+    queue = due_queues.get(user_id)
+    if queue is None:
+        cards = srs_cards.get(user_id)
+        if cards is None:
+            # Карточек ещё нет: слова с ошибками сразу становятся карточками, которые пора повторить
+            cards = {category: {question: srs.new_card(0) for question in questions}
+                     for category, questions in errors.get(user_id, {}).items() if questions}
+        queue = due_queues[user_id] = srs.DueQueue(cards)
+    return queue
+
+
+def record_review(user_id, category, question_text, correct):
+    """Пересчитывает карточку слова после ответа (карточка создаётся при первом ответе).
+
+    На диск карточки запишет поток сохранения сессий (см. checkpoint_srs).
+    """
+    now = time.time()
+    with srs_lock:
+        queue = get_due_queue(user_id)
+        questions = queue.cards.setdefault(category, {})
+        card = questions.get(question_text)
+        new = card is None
+        if new:
+            card = questions[question_text] = srs.new_card(now)
+        srs.review(card, srs.QUALITY_CORRECT if correct else srs.QUALITY_WRONG, now)
+        queue.push(category, question_text, new=new)
+        invalidate_reminder_plan(user_id)
+        srs_cards[user_id] = queue.cards
+    srs_changed.set()
+
+
+def checkpoint_srs():
+    if not srs_changed.is_set():
+        return
+    srs_changed.clear()
+    with srs_lock:
+        save_json("srs.json", srs_cards)
+
+
+def next_review_card(user_id, now, due_only=True):
+    """Самая срочная карточка: (время повторения, категория, вопрос, варианты ответа) или None.
+
+    С due_only=False возвращает ближайшую карточку, даже если её время ещё не наступило.
+    Карточки удалённых и испорченных слов попутно выбрасываются.
+    """
+    with srs_lock:
+        queue = get_due_queue(user_id)
+        while True:
+            entry = queue.next_due(now) if due_only else queue.peek()
+            if entry is None:
+                return None
+            due, category, question_text = entry
+            options = question_options(question_text)
+            if (options and category in user_categories.get(user_id, {})
+                    and normalize_word_key(question_text) in get_word_index(user_id, category)):
+                return due, category, question_text, options
+            queue.discard(category, question_text)
+
+
+def ask_scheduled_quiz(user_id, quiz):
+    """Ждём ответ на викторину по расписанию; после ответа диалог продолжится с прежнего состояния."""
+    context = user_context.setdefault(user_id, {})
+    if context.get("state") is not State.SCHEDULED_QUIZ_ANSWER:
+        context["resume_state"] = context.get("state")
+    context["current_quiz"] = quiz
+    context["state"] = State.SCHEDULED_QUIZ_ANSWER
+
+
+# Напоминание-викторина всем пользователям: рассылка с журналом в BROADCAST_DIR
+BROADCAST_DIR = "broadcasts"
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # Сообщений в секунду (лимит Telegram — около 30)
+BROADCAST_BATCH_SIZE = 100  # Получателей в одной записи журнала
+BROADCAST_WORKERS = 8
+BROADCAST_RETRIES = 3  # Повторов при ответе 429 Too Many Requests
+
+broadcast_limiter = broadcast.TokenBucket(BROADCAST_RATE)
+broadcast_lock = threading.Lock()  # Рассылки идут по одной
+
+
+def send_with_retry(user_id, text, reply_markup=None):
+    """bot.send_message с ожиданием retry_after, если Telegram ответил 429."""
+    for attempt in range(BROADCAST_RETRIES + 1):
+        try:
+            return bot.send_message(user_id, text, reply_markup=reply_markup)
+        except apihelper.ApiTelegramException as e:
+            if e.error_code != 429 or attempt == BROADCAST_RETRIES:
+                raise
+            time.sleep(e.result_json.get("parameters", {}).get("retry_after", 1))
+
+
+def send_daily_quiz_to(user_id):
+    """Напоминание-викторина одному пользователю. False, если спросить нечего."""
+    categories = user_categories.get(user_id)
+    if not categories:
+        return False  # У пользователя нет категорий
+
+    # Выбираем случайную категорию и случайное слово
+    category_name = random.choice(list(categories.keys()))
+    words = categories[category_name]
+    if not words:
+        return False  # Категория пуста
+
+    question_data = random.choice(words)
+    options = question_options(question_data["question"])
+    if not options:
+        return False  # Испорченная запись
+
+    send_with_retry(user_id, reminder_planner.REMINDER_TEXT.format(category=category_name),
+                    reply_markup=shuffled_answer_keyboard(options))
+
+    # Сохраняем текущий вопрос в контексте пользователя
+    ask_scheduled_quiz(user_id, {
+        "category": category_name,
+        "correct": options[1],
+        "question": question_data["question"],
+    })
+    return True
+
+
+BROADCAST_SENDERS = {"daily_quiz": send_daily_quiz_to}  # Вид рассылки -> отправка одному получателю
+
+
+def run_broadcast(job):
+    """Доводит рассылку до конца и сообщает администраторам время и скорость. Вызывать под broadcast_lock."""
+    summary = job.run(BROADCAST_SENDERS[job.kind], broadcast_limiter, BROADCAST_BATCH_SIZE, BROADCAST_WORKERS)
+    record_metric(f"broadcast:{job.kind}", summary["seconds"])
+    text = (f"📣 Рассылка {job.kind} завершена за {summary['seconds']:.1f} с ({summary['rate']:.1f} сообщений/с).\n"
+            f"Отправлено: {summary['sent']}, не отправлено: {summary['failed']}")
+    if summary["lost"]:
+        text += f", прервано сбоем: {summary['lost']}"
+    for admin_id in ADMIN_IDS:
+        try:
+            bot.send_message(admin_id, text)
+        except Exception as e:
+            print(f"Не удалось отправить отчёт о рассылке {admin_id}: {e}")
+    return summary
+
+
+@timed("scheduler:send_daily_quiz")
+def broadcast_daily_quiz():
+    """Вызывать под broadcast_lock."""
+    # Список получателей фиксируется в журнале: после перезапуска рассылка продолжится по нему
+    recipients = [user_id for user_id, categories in list(user_categories.items()) if categories]
+    return run_broadcast(broadcast.Broadcast.create(BROADCAST_DIR, "daily_quiz", recipients))
+
+
+def send_daily_quiz():
+    with broadcast_lock:
+        return broadcast_daily_quiz()
+
+
+def send_daily_quiz_and_release():
+    """Рассылка по /broadcast_quiz: broadcast_lock уже взят обработчиком команды."""
+    try:
+        broadcast_daily_quiz()
+    finally:
+        broadcast_lock.release()
+
+
+def resume_broadcasts():
+    """Продолжает рассылки, прерванные перезапуском бота."""
+    with broadcast_lock:
+        for job in broadcast.unfinished(BROADCAST_DIR):
+            if job.kind in BROADCAST_SENDERS:
+                print(f"Продолжаем рассылку {job.id}: {job.position} из {len(job.recipients)}")
+                run_broadcast(job)
+
+
+@bot.message_handler(commands=['broadcast_quiz'])
+def broadcast_quiz_command(message):
+    """Запуск напоминания-викторины для всех пользователей (только для администраторов)."""
+    user_id = str(message.chat.id)
+    if not is_admin(user_id):
+        bot.send_message(user_id, "Команда доступна только администраторам.")
+        return
+    # Блокировку берёт сам обработчик: две команды подряд не запустят две рассылки
+    if not broadcast_lock.acquire(blocking=False):
+        bot.send_message(user_id, "Рассылка уже идёт, дождитесь отчёта.")
+        return
+    try:
+        threading.Thread(target=send_daily_quiz_and_release, name="broadcast", daemon=True).start()
+    except Exception:
+        broadcast_lock.release()
+        raise
+    bot.send_message(user_id, "📣 Рассылка запущена, отчёт придёт по завершении.")
+
+
+# Проверка ответа на викторину
+@state_handler(State.SCHEDULED_QUIZ_ANSWER)
+def handle_quiz_answer(message):
+    user_id = str(message.chat.id)
+    user_answer = message.text.strip()
+    quiz_data = user_context[user_id]["current_quiz"]
+    correct_answer = quiz_data["correct"]
+    question_text = quiz_data["question"]
+    category = quiz_data["category"]
+
+    if user_answer == correct_answer:
+        bot.send_message(user_id, "✅ Верно!")
+    else:
+        bot.send_message(user_id, f"❌ Неверно! Правильный ответ: {correct_answer}.")
+    update_error_count(user_id, category, question_text, user_answer == correct_answer)
+    record_review(user_id, category, question_text, user_answer == correct_answer)
+    record_stats(user_id, category, user_answer == correct_answer)
+    # Удаляем текущую викторину из контекста и возвращаемся к прерванному диалогу
+    context = user_context[user_id]
+    del context["current_quiz"]
+    context["state"] = context.pop("resume_state", None)
+
+
+# Команда /review: повторение карточек, время которых наступило
+@bot.message_handler(commands=['review'])
+def start_review(message):
+    user_id = str(message.chat.id)
+    user_context[user_id] = {
+        "mode": "review",
+        "state": State.REVIEW_ANSWER,
+        "current": None,  # (категория, вопрос, верный ответ)
+        "reviewed": 0,
+        "correct": 0
+    }
+    with coalesced_replies(user_id):
+        send_review_card(user_id)
+
+
+def send_review_card(user_id):
+    context = user_context.get(user_id)
+    if not context or context.get("mode") != "review":
+        return
+
+    now = time.time()
+    card = next_review_card(user_id, now)
+    if card is None:
+        user_context.pop(user_id, None)
+        if context["reviewed"]:
+            text = f"🎉 Повторение завершено!\nКарточек: {context['reviewed']}, верно: {context['correct']}."
+        else:
+            text = "Сейчас нечего повторять."
+        upcoming = next_review_card(user_id, now, due_only=False)
+        if upcoming:
+            text += f"\nСледующее повторение: {time.strftime('%d.%m %H:%M', time.localtime(upcoming[0]))}"
+        reply(user_id, text, reply_markup=ReplyKeyboardRemove())
+        return
+
+    _, category, question_text, options = card
+    context["current"] = (category, question_text, options[1])
+    reply(user_id, f"Категория: {category}\nВыберите ответ:", reply_markup=shuffled_answer_keyboard(options))
+
+
+@state_handler(State.REVIEW_ANSWER)
+def handle_review_answer(message):
+    user_id = str(message.chat.id)
+    context = user_context[user_id]
+    if context["current"] is None:  # Следующая карточка ещё не отправлена
+        return
+    category, question_text, correct_answer = context["current"]
+    correct = message.text.strip() == correct_answer
+    context["current"] = None
+    context["reviewed"] += 1
+
+    # Вердикт и следующая карточка уходят одним сообщением
+    with coalesced_replies(user_id):
+        if correct:
+            context["correct"] += 1
+            reply(user_id, "✅ Верно!")
+        else:
+            reply(user_id, f"❌ Неверно! Правильный ответ: {correct_answer}.", reply_markup=ReplyKeyboardRemove())
+        update_error_count(user_id, category, question_text, correct)
+        record_review(user_id, category, question_text, correct)
+        record_stats(user_id, category, correct)
+        send_review_card(user_id)
+
+
+
+# ========== Статистика пользователя ==========
+stats_lock = threading.Lock()
+stats_changed = threading.Event()  # Статистика изменилась после записи user_stats.json
+
+
+streak_leaderboard = None  # Рейтинг лучших серий глобальной игры (см. leaderboard.py)
+TOP_DEFAULT = 10
+
 
-        bot.send_message(
-            user_id,
-            f"🕰️ Время викторины!\nКатегория: {category_name}\nВыберите правильный ответ:",
-            reply_markup=markup
-        )
+def get_streak_leaderboard():
+    """Рейтинг строится по user_stats один раз, дальше обновляется при новых рекордах."""
+    global streak_leaderboard
+    with stats_lock:
+        if streak_leaderboard is None:
+            board = leaderboard.StreakLeaderboard()
+            for user_id, user in user_stats.items():
+                if user[stats.BEST_STREAK]:
+                    board.update(user_id, user[stats.BEST_STREAK])
+            streak_leaderboard = board
+        return streak_leaderboard
 
-        # Сохраняем текущий вопрос в контексте пользователя
-        if user_id not in user_context:
-            user_context[user_id] = {}
-        user_context[user_id]["current_quiz"] = {
-            "correct": correct_answer,
-            "question": question,
-        }
+
+def record_stats(user_id, category, correct):
+    """Учитывает ответ в сводке пользователя; на диск её запишет поток сохранения сессий."""
+    now = time.time()
+    with stats_lock:
+        user = user_stats.get(user_id)
+        if user is None:
+            user = stats.new_stats(now)
+        stats.record_answer(user, category, correct, now)
+        user_stats[user_id] = user
+    stats_changed.set()
+
+
+def record_final_streak(user_id, streak):
+    """Учитывает итоговую серию глобальной игры; вызывается один раз, когда игра закончилась."""
+    if not streak:
+        return
+    with stats_lock:
+        user = user_stats.get(user_id)
+        if user is None:
+            user = stats.new_stats(time.time())
+        if not stats.record_streak(user, streak):
+            return
+        if streak_leaderboard is not None:
+            streak_leaderboard.update(user_id, streak)
+        user_stats[user_id] = user
+    stats_changed.set()
 
 
-# Проверка ответа на викторину
-@bot.message_handler(
-    func=lambda message: str(message.chat.id) in user_context and "current_quiz" in user_context[str(message.chat.id)]
-)
-def handle_quiz_answer(message):
+def checkpoint_stats():
+    if not stats_changed.is_set():
+        return
+    stats_changed.clear()
+    with stats_lock:
+        save_json("user_stats.json", user_stats)
+
+
+def percent(part, total):
+    return f"{part * 100 // total}%" if total else "—"
+
+
+@bot.message_handler(commands=['stats_me'])
+def show_my_stats(message):
+    """Точность, ответы за последние дни и прогресс по категориям."""
     user_id = str(message.chat.id)
-    user_answer = message.text.strip()
-    quiz_data = user_context[user_id]["current_quiz"]
-    correct_answer = quiz_data["correct"]
-    question_text = quiz_data["question"]
-    category = quiz_data["category"]
+    user = user_stats.get(user_id)
+    if not user or not user[stats.ANSWERS]:
+        bot.send_message(user_id, "Статистики пока нет: ответьте на несколько вопросов викторины.")
+        return
 
-    if user_answer == correct_answer:
-        bot.send_message(user_id, "✅ Верно!")
-        # Уменьшаем количество ошибок: если становится 0 или меньше – удаляем слово из ошибок
-        current_count = errors.get(user_id, {}).get(category, {}).get(question_text, 0)
-        new_count = current_count - 1
-        if new_count <= 0:
-            if user_id in errors and category in errors[user_id]:
-                errors[user_id][category].pop(question_text, None)
-                if not errors[user_id][category]:
-                    del errors[user_id][category]
-        else:
-            errors.setdefault(user_id, {}).setdefault(category, {})[question_text] = new_count
+    now = time.time()
+    days = stats.recent(user, now)
+    week_answers = sum(answers for answers, _ in days[-7:])
+    week_correct = sum(correct for _, correct in days[-7:])
+    month_answers = sum(answers for answers, _ in days)
+    month_correct = sum(correct for _, correct in days)
+    active_days = sum(1 for answers, _ in days if answers)
+
+    lines = [
+        "📊 Ваша статистика",
+        f"Всего ответов: {user[stats.ANSWERS]}, верных: {user[stats.CORRECT]} "
+        f"({percent(user[stats.CORRECT], user[stats.ANSWERS])})",
+        f"Сегодня: ответов {days[-1][0]}, верных {percent(days[-1][1], days[-1][0])}",
+        f"За 7 дней: ответов {week_answers}, верных {percent(week_correct, week_answers)}",
+        f"За {stats.WINDOW} дней: ответов {month_answers}, верных {percent(month_correct, month_answers)}, "
+        f"дней с ответами: {active_days}",
+        f"Лучшая серия в глобальной игре: {user[stats.BEST_STREAK]}",
+    ]
+    if user[stats.BEST_STREAK]:
+        board = get_streak_leaderboard()
+        with stats_lock:
+            place, players = board.rank(user_id), len(board)
+        if place:
+            lines[-1] += f" (место {place} из {players})"
+    categories = user[stats.CATEGORIES]
+    if categories:
+        lines.append("\nПо категориям:")
+        ordered = sorted(categories.items(), key=lambda item: natural_sort_key(item[0]))
+        extend_within_limit(lines, (f"• {category}: ответов {answers}, верных {percent(correct, answers)}"
+                                    for category, (answers, correct) in ordered))
+
+    bot.send_message(user_id, "\n".join(lines))
+
+
+@bot.message_handler(commands=['top'])
+def show_top(message):
+    """Лучшие серии глобальной игры и место пользователя."""
+    user_id = str(message.chat.id)
+    board = get_streak_leaderboard()
+    with stats_lock:
+        top = board.top(TOP_DEFAULT)
+        place, players = board.rank(user_id), len(board)
+        best = board.best.get(user_id)
+    if not top:
+        bot.send_message(user_id, "Рейтинг пока пуст: сыграйте в глобальную игру (/start_global).")
+        return
+
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    lines = ["🏆 Лучшие серии в глобальной игре:"]
+    for rank, player, streak in top:
+        # Чужие id не показываем целиком
+        name = "вы" if player == user_id else f"игрок •••{player[-3:]}"
+        lines.append(f"{medals.get(rank, f'{rank}.')} {name} — {streak}")
+    if place:
+        lines.append(f"\nВаше место: {place} из {players} (лучшая серия: {best})")
     else:
-        bot.send_message(user_id, f"❌ Неверно! Правильный ответ: {correct_answer}.")
-        # При неверном ответе увеличиваем количество ошибок на 1
-        current_count = errors.get(user_id, {}).get(category, {}).get(question_text, 0)
-        new_count = current_count + 1
-        errors.setdefault(user_id, {}).setdefault(category, {})[question_text] = new_count
+        lines.append(f"\nВы ещё не в рейтинге. Игроков: {players}")
+    bot.send_message(user_id, "\n".join(lines))
 
-    save_json("errors.json", errors)
-    # Удаляем текущую викторину из контекста
-    del user_context[user_id]["current_quiz"]
 
+@bot.message_handler(commands=['hardest'])
+def show_hardest_words(message):
+    """/hardest [число]: слова, в которых чаще всего ошибаются все пользователи."""
+    user_id = str(message.chat.id)
+    args = message.text.split()[1:]
+    try:
+        count = int(args[0]) if args else HARDEST_DEFAULT
+    except ValueError:
+        bot.send_message(user_id, "Использование: /hardest [число слов]")
+        return
+    count = min(max(count, 1), HARDEST_MAX)
+
+    board = get_hardest_words()
+    with errors_lock:
+        top = board.top(count)
+    if not top:
+        bot.send_message(user_id, "Ошибок пока нет.")
+        return
+    lines = extend_within_limit(["🔥 Самые трудные слова:"], (
+        f"{place}. {question.replace('←', '/')} — ошибок: {error_count}, пользователей: {users}"
+        for place, (question, error_count, users) in enumerate(top, 1)))
+    bot.send_message(user_id, "\n".join(lines))
 
 
 # Словарь для хранения времени отправки викторины для каждого пользователя
-quiz_schedule = load_json("quiz_schedule.json", {})
+quiz_schedule = load_json_deferred("quiz_schedule.json", {})
 
 
 # Команда /quiz для настройки времени викторины
@@ -1354,13 +3070,13 @@ def set_quiz_time(message):
         )
 
     # Устанавливаем контекст для обработки времени
-    user_context[user_id] = {"mode": "set_quiz_time"}
+    user_context[user_id] = {"mode": "set_quiz_time", "state": State.QUIZ_TIME_INPUT}
 
 
 import re
 
 
-@bot.message_handler(func=lambda message: user_context.get(str(message.chat.id), {}).get("mode") == "set_quiz_time")
+@state_handler(State.QUIZ_TIME_INPUT)
 def handle_quiz_time_input(message):
     user_id = str(message.chat.id)
     time_input = message.text.strip()
@@ -1380,6 +3096,7 @@ def handle_quiz_time_input(message):
     if time_input in quiz_schedule.get(user_id, []):
         quiz_schedule[user_id].remove(time_input)
         save_json("quiz_schedule.json", quiz_schedule)
+        update_reminder_slot(user_id, time_input, added=False)
         bot.send_message(user_id, f"Время {time_input} удалено из расписания.")
         user_context.pop(user_id, None)
         return
@@ -1387,61 +3104,135 @@ def handle_quiz_time_input(message):
     # Добавление нового времени
     quiz_schedule.setdefault(user_id, []).append(time_input)
     save_json("quiz_schedule.json", quiz_schedule)
+    update_reminder_slot(user_id, time_input, added=True)
 
     bot.send_message(user_id, f"Время {time_input} добавлено в расписание.")
     user_context.pop(user_id, None)  # Убираем режим настройки
 
 
+# ========== Заранее подготовленные напоминания (см. reminder_planner.py) ==========
+PLAN_AHEAD_MINUTES = 10  # За сколько минут до слота готовить напоминания
+PLAN_CANDIDATES = 3  # Запасные карточки на случай, если слово успеют удалить
+
+reminder_slots = None  # "ЧЧ:ММ" -> пользователи с напоминанием в это время; строится при первом обращении
+reminder_slots_lock = threading.Lock()
+reminder_plans = {}  # "ЧЧ:ММ" -> {пользователь: (версия, [план, ...])}
+reminder_versions = {}  # Пользователь -> версия; план с другой версией устарел
+
+
+def get_reminder_slots():
+    global reminder_slots
+    with reminder_slots_lock:
+        if reminder_slots is None:
+            slots = {}
+            for user_id, times in list(quiz_schedule.items()):
+                for slot in times:
+                    slots.setdefault(slot, set()).add(user_id)
+            reminder_slots = slots
+        return reminder_slots
+
+
+def update_reminder_slot(user_id, slot, added):
+    """Отражает в индексе слотов добавление или удаление времени в quiz_schedule."""
+    slots = get_reminder_slots()
+    with reminder_slots_lock:
+        if added:
+            slots.setdefault(slot, set()).add(user_id)
+        elif slot in slots:
+            slots[slot].discard(user_id)
+            if not slots[slot]:
+                del slots[slot]
+
+
+def invalidate_reminder_plan(user_id):
+    """Ответы и изменения ошибок меняют очередь повторения — готовые планы пользователя устаревают."""
+    reminder_versions[user_id] = reminder_versions.get(user_id, 0) + 1
+
+
+def store_reminder_plans(slot, results):
+    plans = reminder_plans.setdefault(slot, {})
+    for user_id, version, user_plans in results:
+        plans[user_id] = (version, user_plans)
+
+
+def plan_reminders(slot):
+    """Готовит напоминания для пользователей слота slot ("ЧЧ:ММ")."""
+    batch = []
+    for user_id in list(get_reminder_slots().get(slot, ())):
+        version = reminder_versions.get(user_id, 0)  # До выбора карточек: ответ после этого сделает план устаревшим
+        with srs_lock:
+            entries = get_due_queue(user_id).upcoming(PLAN_CANDIDATES)
+        if entries:
+            batch.append((user_id, version, random.getrandbits(32), [entry[1:] for entry in entries]))
+    store_reminder_plans(slot, reminder_planner.plan_batch(batch))
+
+
+def take_reminder_plan(user_id, slot_plans):
+    """Готовый план пользователя, если он не устарел и слово ещё существует, иначе None."""
+    version, plans = slot_plans.get(user_id, (None, ()))
+    if version != reminder_versions.get(user_id, 0):
+        return None
+    for plan in plans:
+        category = plan["category"]
+        if (category in user_categories.get(user_id, {})
+                and normalize_word_key(plan["question"]) in get_word_index(user_id, category)):
+            return plan
+    return None
+
+
+@timed("scheduler:send_scheduled_quizzes")
 def send_scheduled_quizzes():
-    current_time = time.strftime("%H:%M")
-    for user_id, times in quiz_schedule.items():
-        if current_time in times:
-            # Получаем ошибки для пользователя из errors.json
-            user_errors = errors.get(user_id, {})
-            words_list = []
-            for category, qdict in user_errors.items():
-                for question, count in qdict.items():
-                    words_list.append((category, question, count))
-            if not words_list:
+    global scheduler_lag
+    now = time.time()
+    scheduler_lag = now - now // 60 * 60  # Напоминания назначены на начало минуты ЧЧ:ММ
+    current_time = time.strftime("%H:%M", time.localtime(now))
+    slot_plans = reminder_plans.pop(current_time, {})
+    for user_id in list(get_reminder_slots().get(current_time, ())):
+        plan = take_reminder_plan(user_id, slot_plans)
+        if plan is None:
+            # Плана нет или он устарел: самая срочная карточка из очереди повторения
+            # (если срок ни у одной не наступил — ближайшая)
+            card = next_review_card(user_id, now, due_only=False)
+            if card is None:
                 continue
+            _, category_name, question_text, options = card
+            plan = {
+                "category": category_name,
+                "question": question_text,
+                "correct": options[1],
+                "text": reminder_planner.REMINDER_TEXT.format(category=category_name),
+                "keyboard": shuffled_answer_keyboard(options),
+            }
 
-            # Выбор слова с учётом веса (больше ошибок – выше шанс)
-            chosen = random.choices(words_list, weights=[item[2] for item in words_list])[0]
-            category_name, question_text, _ = chosen
-
+        # Если ранее было отправлено сообщение викторины, удаляем его, чтобы убрать старую клавиатуру
+        if user_id in user_context and "last_quiz_msg_id" in user_context[user_id]:
             try:
-                wrong, correct = question_text.split("←")
+                bot.delete_message(user_id, user_context[user_id]["last_quiz_msg_id"])
             except Exception:
-                continue
+                pass
 
-            options = [wrong.strip(), correct.strip()]
-            random.shuffle(options)
-            markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-            markup.add(KeyboardButton(options[0]), KeyboardButton(options[1]))
+        # Отправляем новое сообщение викторины с нужной клавиатурой
+        msg = bot.send_message(user_id, plan["text"], reply_markup=plan["keyboard"])
 
-            # Если ранее было отправлено сообщение викторины, удаляем его, чтобы убрать старую клавиатуру
-            if user_id in user_context and "last_quiz_msg_id" in user_context[user_id]:
-                try:
-                    bot.delete_message(user_id, user_context[user_id]["last_quiz_msg_id"])
-                except Exception:
-                    pass
+        # Сохраняем id нового сообщения для последующего удаления
+        user_context.setdefault(user_id, {})["last_quiz_msg_id"] = msg.message_id
 
-            # Отправляем новое сообщение викторины с нужной клавиатурой
-            msg = bot.send_message(
-                user_id,
-                f"🕰️ Время викторины!\nКатегория: {category_name}\nВыберите правильный ответ:",
-                reply_markup=markup
-            )
+        # Сохраняем данные текущей викторины в контексте пользователя
+        ask_scheduled_quiz(user_id, {
+            "correct": plan["correct"],
+            "question": plan["question"],
+            "category": plan["category"]
+        })
 
-            # Сохраняем id нового сообщения для последующего удаления
-            user_context.setdefault(user_id, {})["last_quiz_msg_id"] = msg.message_id
+    # Слот через PLAN_AHEAD_MINUTES минут готовим сейчас, пока до него есть время
+    plan_reminders(time.strftime("%H:%M", time.localtime(now + PLAN_AHEAD_MINUTES * 60)))
 
-            # Сохраняем данные текущей викторины в контексте пользователя
-            user_context[user_id]["current_quiz"] = {
-                "correct": correct.strip(),
-                "question": question_text,
-                "category": category_name
-            }
+
+def plan_upcoming_reminders():
+    """При запуске готовит напоминания для слотов, которые наступят раньше, чем их подготовит планировщик."""
+    now = time.time()
+    for minutes in range(1, PLAN_AHEAD_MINUTES + 1):
+        plan_reminders(time.strftime("%H:%M", time.localtime(now + minutes * 60)))
 
 
 # Планировщик для отправки викторин утром и вечером
@@ -1453,8 +3244,6 @@ def schedule_quiz():
         time.sleep(1)
 
 
-# Запускаем планировщик в отдельном потоке
-threading.Thread(target=schedule_quiz, daemon=True).start()
 
 
 def generate_callback_data(data):
@@ -1462,57 +3251,96 @@ def generate_callback_data(data):
     return hashlib.md5(data.encode('utf-8')).hexdigest()[:8]
 
 
+# Процессы бота держат в памяти только отображение скомпилированной колоды; JSON с общими
+# категориями читается целиком лишь при добавлении слов и при пересборке колоды
+SHARED_CATEGORIES_PATH = "categories_for_all_users.json"
+SHARED_DECK_PATH = "categories_for_all_users.deck"  # Скомпилированная общая колода (см. shared_deck.py)
+shared_deck_lock = threading.Lock()
+opened_shared_deck = None  # Последняя отображённая версия колоды
+
+
+def compile_shared_deck(categories):
+    """Пересобирает файл общей колоды. Вызывать под shared_deck_lock."""
+    shared_deck.compile_deck(SHARED_DECK_PATH, {
+        category: [question for question in questions if question_options(question["question"])]
+        for category, questions in categories.items()
+    })
+
+
+def add_shared_words(category, new_words):
+    """Дописывает слова в общие категории и пересобирает колоду."""
+    with shared_deck_lock:
+        categories = load_json(SHARED_CATEGORIES_PATH, {})
+        categories.setdefault(category, []).extend(new_words)
+        save_json(SHARED_CATEGORIES_PATH, categories)
+        compile_shared_deck(categories)
+
+
+def current_shared_deck():
+    """Общая колода, отображённая в память; собирается, если файла нет или он старше JSON.
+
+    Отображение переоткрывается, только если файл подменили (в том числе другим процессом).
+    """
+    global opened_shared_deck
+    with shared_deck_lock:
+        if not os.path.exists(SHARED_DECK_PATH) or (
+                os.path.exists(SHARED_CATEGORIES_PATH)
+                and os.path.getmtime(SHARED_CATEGORIES_PATH) > os.path.getmtime(SHARED_DECK_PATH)):
+            compile_shared_deck(load_json(SHARED_CATEGORIES_PATH, {}))
+        stat = os.stat(SHARED_DECK_PATH)
+        if opened_shared_deck is None or opened_shared_deck.version != (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            opened_shared_deck = shared_deck.SharedDeck(SHARED_DECK_PATH)
+        return opened_shared_deck
+
+
 @bot.message_handler(commands=['start_global'])
 def start_global(message):
     user_id = str(message.chat.id)
-    questions = []
+    deck = current_shared_deck()
 
-    # Сбор всех вопросов из categories_for_all_users.json
-    for category, question_list in categories_for_all_users.items():
-        questions.extend(question_list)
-
-    if not questions:
+    if not len(deck):
         bot.send_message(user_id, "Нет доступных вопросов для игры.")
         return
 
-    # Перемешиваем вопросы
-    random.shuffle(questions)
-
-    # Сохраняем контекст игры
+    # Сохраняем контекст игры; сессия держит свою версию колоды, даже если файл пересоберут.
+    # Порядок вопросов — случайная перестановка, которую задают seed и позиция
     user_context[user_id] = {
         "mode": "global_game",
-        "questions": questions,
+        "state": State.GLOBAL_ANSWER,
+        "deck": deck,
+        "seed": random.getrandbits(64),
+        "position": 0,
         "current": None
     }
 
-    bot.send_message(user_id, "Глобальная игра началась! Отвечайте на вопросы.")
-    send_global_question(user_id)
+    with coalesced_replies(user_id):
+        reply(user_id, "Глобальная игра началась! Отвечайте на вопросы.")
+        send_global_question(user_id)
 
 
 def send_global_question(user_id):
     context = user_context.get(user_id)
 
-    if not context or not context["questions"]:
-        bot.send_message(user_id, "Вы ответили на все доступные вопросы!")
+    if not context or context["position"] >= len(context["deck"]):
+        reply(user_id, "Вы ответили на все доступные вопросы!")
+        if context:
+            record_final_streak(user_id, context["position"])  # Колода пройдена без ошибок
         user_context.pop(user_id, None)
         return
 
     # Извлекаем вопрос
-    question = context["questions"].pop(0)
+    deck = context["deck"]
+    question = deck[shared_deck.permute(context["position"], len(deck), context["seed"])]
+    context["position"] += 1
     context["current"] = question
+    dirty_sessions.add(user_id)
 
-    # Формируем кнопки с вариантами ответа
-    btn1, btn2 = question["question"].split("←")
-    options = [btn1, btn2]
-    random.shuffle(options)
-
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    markup.add(KeyboardButton(options[0]), KeyboardButton(options[1]))
-
-    bot.send_message(user_id, "Выберите ответ:", reply_markup=markup)
+    # Кнопки с вариантами ответа; испорченные записи в колоду не попадают
+    markup = shuffled_answer_keyboard(question_options(question["question"]))
+    reply(user_id, "Выберите ответ:", reply_markup=markup)
 
 
-@bot.message_handler(func=lambda message: user_context.get(str(message.chat.id), {}).get("mode") == "global_game")
+@state_handler(State.GLOBAL_ANSWER)
 def handle_global_answer(message):
     user_id = str(message.chat.id)
     user_answer = message.text.strip()
@@ -1521,15 +3349,151 @@ def handle_global_answer(message):
     # Проверяем текущий вопрос
     current_question = context["current"]
     correct_answer = current_question["correct"].strip()
+    record_stats(user_id, None, user_answer == correct_answer)
 
     if user_answer == correct_answer:
-        bot.send_message(user_id, "✅ Верно!")
-        send_global_question(user_id)
+        # Вердикт и следующий вопрос уходят одним сообщением
+        with coalesced_replies(user_id):
+            reply(user_id, "✅ Верно!")
+            send_global_question(user_id)
     else:
-        bot.send_message(user_id, f"❌ Неверно! Правильный ответ: {correct_answer}.", reply_markup=ReplyKeyboardRemove())
+        # Игра идёт до первой ошибки, поэтому серия — число вопросов до этого
+        record_final_streak(user_id, context["position"] - 1)
+        bot.send_message(user_id, f"❌ Неверно! Правильный ответ: {correct_answer}.\n"
+                                  f"Серия: {context['position'] - 1}. Рейтинг: /top", reply_markup=ReplyKeyboardRemove())
         user_context.pop(user_id, None)  # Завершаем игру после неверного ответа
 
 
+# ========== Сохранение сессий ==========
+# Викторины и глобальные игры переживают перезапуск: фоновый поток раз в несколько секунд
+# кодирует изменившиеся сессии (см. sessions.py) и записывает файл, а обработчик ответа
+# только отмечает пользователя. Сохранённая сессия восстанавливается при следующем сообщении.
+SESSIONS_PATH = "sessions.bin"
+SESSION_CHECKPOINT_INTERVAL = 5  # Секунд между записями файла сессий
+PERSISTED_MODES = ("quiz", "global_game")
+
+saved_sessions = sessions.load(SESSIONS_PATH)  # Сессии прошлого запуска, ещё не восстановленные
+session_records = {}  # Пользователь -> запись его сессии в файле
+dirty_sessions = set()  # Пользователи, чьи сессии изменились после записи
+
+
+def encode_session(context):
+    """Запись сессии для файла или None, если сессию не сохраняем."""
+    if not context:
+        return None
+    if context.get("mode") == "quiz":
+        questions = context["all_questions"]
+        in_round = {id(question) for question in list(context["current_round_questions"])}
+        current = context.get("current")
+        session_errors = context["session_errors"]
+        flags = [min(question.get("correct_count", 0), sessions.CORRECT_MASK)
+                 | (sessions.IN_ROUND if id(question) in in_round else 0)
+                 | (sessions.SESSION_ERROR if generate_id(question["question"]) in session_errors else 0)
+                 | (sessions.CURRENT if question is current else 0)
+                 for question in questions]
+        return sessions.encode_quiz(context["category"], context["round_number"], context["start_time"],
+                                    sessions.fingerprint(questions), flags)
+    if context.get("mode") == "global_game":
+        return sessions.encode_global(context["seed"], context["position"], context["current"] is not None,
+                                      context["deck"].version)
+    return None
+
+
+def restore_session(user_id):
+    """Восстанавливает сессию прошлого запуска, если категория или колода с тех пор не менялись."""
+    record = saved_sessions.pop(user_id, None)
+    if record is None:
+        return
+    dirty_sessions.add(user_id)  # Уберём запись из файла, если сессию не восстановить
+    data = sessions.decode(record)
+
+    if data["kind"] == sessions.GLOBAL_GAME:
+        deck = current_shared_deck()
+        if deck.version != data["deck_version"] or not data["has_current"]:
+            return
+        user_context[user_id] = {
+            "mode": "global_game",
+            "state": State.GLOBAL_ANSWER,
+            "deck": deck,
+            "seed": data["seed"],
+            "position": data["position"],
+            "current": deck[shared_deck.permute(data["position"] - 1, len(deck), data["seed"])]
+        }
+        return
+
+    category = data["category"]
+    questions = [q for q in user_categories.get(user_id, {}).get(category, []) if question_options(q["question"])]
+    flags = data["flags"]
+    if len(questions) != len(flags) or sessions.fingerprint(questions) != data["checksum"]:
+        return
+    current = None
+    reviewed = set()
+    for question, flag in zip(questions, flags):
+        question["correct_count"] = flag & sessions.CORRECT_MASK
+        if flag & sessions.CURRENT:
+            current = question
+        # В первом круге слово уже отвечено, если оно выбыло из круга (кроме заданного сейчас)
+        # или по нему были ответы; со второго круга отвечены все слова
+        if (data["round_number"] > 1 or flag & (sessions.CORRECT_MASK | sessions.SESSION_ERROR)
+                or not flag & (sessions.IN_ROUND | sessions.CURRENT)):
+            reviewed.add(generate_id(question["question"]))
+    if current is None:
+        return  # Сбой между ответом и следующим вопросом: продолжать не с чего
+    user_context[user_id] = {
+        "mode": "quiz",
+        "state": State.QUIZ_ANSWER,
+        "category": category,
+        "all_questions": questions,
+        "current_round_questions": [q for q, flag in zip(questions, flags) if flag & sessions.IN_ROUND],
+        "round_number": data["round_number"],
+        "session_errors": {generate_id(q["question"]): q["correct"].strip()
+                           for q, flag in zip(questions, flags) if flag & sessions.SESSION_ERROR},
+        "reviewed": reviewed,
+        "start_time": data["start_time"],
+        "current": current
+    }
+
+
+def checkpoint_sessions():
+    """Записывает файл сессий, если с прошлой записи что-то изменилось."""
+    changed = False
+    while dirty_sessions:
+        user_id = dirty_sessions.pop()
+        record = encode_session(user_context.get(user_id))
+        if record is not None:
+            session_records[user_id] = record
+            saved_sessions.pop(user_id, None)  # Пользователь начал новую сессию, не восстановив старую
+        else:
+            session_records.pop(user_id, None)
+        changed = True
+    # Завершённые сессии
+    for user_id in list(session_records):
+        if user_context.get(user_id, {}).get("mode") not in PERSISTED_MODES:
+            del session_records[user_id]
+            changed = True
+    if changed:
+        start = time.perf_counter()
+        sessions.save(SESSIONS_PATH, {**saved_sessions, **session_records})
+        record_metric("save_sessions", time.perf_counter() - start)
+
+
+def session_checkpointer():
+    while True:
+        time.sleep(SESSION_CHECKPOINT_INTERVAL)
+        try:
+            checkpoint_sessions()
+        except Exception as e:
+            print(f"Ошибка сохранения сессий: {e}")
+        try:
+            checkpoint_stats()
+        except Exception as e:
+            print(f"Ошибка сохранения статистики: {e}")
+        try:
+            checkpoint_srs()
+        except Exception as e:
+            print(f"Ошибка сохранения карточек повторения: {e}")
+
+
 ERRORS_PER_PAGE = 10  # Количество ошибок на одной странице
 
 
@@ -1540,15 +3504,9 @@ def clean_error(message):
         bot.send_message(user_id, "У вас нет ошибок для очистки!")
         return
 
-    # Сортировка категорий по числовому префиксу "№", если он присутствует
-    def sort_key(category):
-        match = re.search(r'№\s*(\d+)', category)
-        return int(match.group(1)) if match else float('inf')
-
-    sorted_categories = sorted(errors[user_id].keys(), key=sort_key)
-
+    # Категории уже отсортированы по номеру «№ N» в названии
     markup = InlineKeyboardMarkup()
-    for category in sorted_categories:
+    for category in get_error_view(user_id).categories():
         markup.add(InlineKeyboardButton(category, callback_data=f"clean_cat:{category}"))
     bot.send_message(user_id, "Выберите категорию ошибок для очистки:", reply_markup=markup)
 
@@ -1580,7 +3538,7 @@ def clean_all_handler(call):
     user_id = str(call.message.chat.id)
     category = call.data.split(":", 1)[1]
     if user_id in errors and category in errors[user_id]:
-        del errors[user_id][category]
+        drop_error_category(user_id, category)
         save_json("errors.json", errors)
         bot.edit_message_text(f"Все ошибки из категории '{category}' удалены.",
                               chat_id=user_id, message_id=call.message.message_id)
@@ -1596,22 +3554,53 @@ def clean_select_handler(call):
     if user_id not in errors or category not in errors[user_id]:
         bot.send_message(user_id, "Ошибки в выбранной категории не найдены.")
         return
+    show_clean_select_page(user_id, call.message.message_id, category, 0)
+
+
+def show_clean_select_page(user_id, message_id, category, page):
+    """Страница ошибок категории кнопками для удаления по одной."""
+    view = get_error_view(user_id)
+    total = view.count(category)
+    total_pages = max(total - 1, 0) // ERRORS_PER_PAGE + 1
+    page = min(page, total_pages - 1)  # После удаления последней ошибки на странице
+    start = page * ERRORS_PER_PAGE
 
     markup = InlineKeyboardMarkup()
-    for question, count in errors[user_id][category].items():
+    for question, count in view.page(category, start, start + ERRORS_PER_PAGE):
         # Если в вопросе есть "←", берем правую часть (правильный вариант)
         correct_part = question.split("←")[1] if "←" in question else question
         btn_text = f"{correct_part} ({count})"
         qhash = generate_id(question)
-        markup.add(InlineKeyboardButton(btn_text, callback_data=f"clean_one:{category}:{qhash}"))
+        markup.add(InlineKeyboardButton(btn_text, callback_data=f"clean_one:{category}:{qhash}:{page}"))
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton("⏪ Назад", callback_data=f"clean_page:{page - 1}:{category}"))
+    if start + ERRORS_PER_PAGE < total:
+        nav_buttons.append(InlineKeyboardButton("⏩ Далее", callback_data=f"clean_page:{page + 1}:{category}"))
+    if nav_buttons:
+        markup.row(*nav_buttons)
     markup.add(InlineKeyboardButton("Готово", callback_data="clean_select_done"))
+
+    text = f"Выберите ошибки для удаления в категории '{category}':"
+    if total_pages > 1:
+        text += f"\nСтраница {page + 1} из {total_pages}"
     try:
-        bot.edit_message_text(f"Выберите ошибки для удаления в категории '{category}':",
-                              chat_id=user_id, message_id=call.message.message_id, reply_markup=markup)
+        bot.edit_message_text(text, chat_id=user_id, message_id=message_id, reply_markup=markup)
     except Exception as e:
         bot.send_message(user_id, f"Ошибка при обновлении сообщения: {e}")
 
 
+@bot.callback_query_handler(func=lambda call: call.data.startswith("clean_page:"))
+def clean_page_handler(call):
+    bot.answer_callback_query(call.id)
+    user_id = str(call.message.chat.id)
+    _, page, category = call.data.split(":", 2)
+    if user_id not in errors or category not in errors[user_id]:
+        bot.send_message(user_id, "Ошибки в выбранной категории не найдены.")
+        return
+    show_clean_select_page(user_id, call.message.message_id, category, int(page))
+
+
 @bot.callback_query_handler(func=lambda call: call.data.startswith("clean_one:"))
 def clean_one_handler(call):
     bot.answer_callback_query(call.id)
@@ -1622,37 +3611,26 @@ def clean_one_handler(call):
         return
     category = parts[1]
     qhash = parts[2]
+    page = int(parts[3]) if len(parts) > 3 and parts[3].isdigit() else 0
     if user_id not in errors or category not in errors[user_id]:
         bot.answer_callback_query(call.id, "Ошибки не найдены.")
         return
 
-    error_found = None
-    for question in list(errors[user_id][category].keys()):
-        if generate_id(question) == qhash:
-            error_found = question
-            break
+    # Кнопка была на странице page; если список с тех пор сдвинулся, ищем по всей категории
+    view = get_error_view(user_id)
+    start = page * ERRORS_PER_PAGE
+    candidates = [question for question, _ in view.page(category, start, start + ERRORS_PER_PAGE)]
+    error_found = next((question for question in candidates if generate_id(question) == qhash), None)
+    if error_found is None:
+        error_found = next((question for question in list(errors[user_id][category])
+                            if generate_id(question) == qhash), None)
 
     if error_found:
-        del errors[user_id][category][error_found]
-        # Если в категории не осталось ошибок, удаляем категорию
-        if not errors[user_id][category]:
-            del errors[user_id][category]
+        set_error_count(user_id, category, error_found, 0)  # Пустая категория ошибок удаляется
         save_json("errors.json", errors)
         bot.answer_callback_query(call.id, "Ошибка удалена.")
         # Обновляем клавиатуру с оставшимися ошибками
-        markup = InlineKeyboardMarkup()
-        if user_id in errors and category in errors[user_id]:
-            for question, count in errors[user_id][category].items():
-                correct_part = question.split("←")[1] if "←" in question else question
-                btn_text = f"{correct_part} ({count})"
-                qh = generate_id(question)
-                markup.add(InlineKeyboardButton(btn_text, callback_data=f"clean_one:{category}:{qh}"))
-        markup.add(InlineKeyboardButton("Готово", callback_data="clean_select_done"))
-        try:
-            bot.edit_message_text(f"Выберите ошибки для удаления в категории '{category}':",
-                                  chat_id=user_id, message_id=call.message.message_id, reply_markup=markup)
-        except Exception as e:
-            bot.send_message(user_id, f"Ошибка при обновлении сообщения: {e}")
+        show_clean_select_page(user_id, call.message.message_id, category, page)
     else:
         bot.answer_callback_query(call.id, "Ошибка не найдена.")
 
@@ -1677,136 +3655,6 @@ def clean_cancel_handler(call):
     bot.answer_callback_query(call.id)
 
 
-def send_error_list(user_id):
-    """Отправляет список ошибок с пагинацией."""
-    if user_id not in user_context or "error_list" not in user_context[user_id]:
-        bot.send_message(user_id, "Ошибка: список ошибок устарел, попробуйте снова.")
-        return
-
-    errors_list = user_context[user_id]["error_list"]
-    page = user_context[user_id]["current_page"]
-
-    total_pages = (len(errors_list) - 1) // ERRORS_PER_PAGE + 1  # Количество страниц
-    start = page * ERRORS_PER_PAGE
-    end = start + ERRORS_PER_PAGE
-
-    markup = InlineKeyboardMarkup()
-    error_map = {}
-
-    for error, count in errors_list[start:end]:
-        error_text = error.replace("←", "/")  # Заменяем ← на /
-        error_hash = generate_hash(error)  # Генерируем хэш вместо полного текста
-        error_map[error_hash] = error
-        markup.add(InlineKeyboardButton(f"{error_text} ({count})", callback_data=f"clean_error:{error_hash}"))
-
-    # Кнопки "⏪ Назад" и "⏩ Далее"
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton("⏪ Назад", callback_data="prev_error_page"))
-    if end < len(errors_list):
-        nav_buttons.append(InlineKeyboardButton("⏩ Далее", callback_data="next_error_page"))
-
-    if nav_buttons:
-        markup.row(*nav_buttons)  # Добавляем кнопки в одну строку
-
-    user_context[user_id]["error_map"] = error_map  # Сохраняем ошибки в контексте
-    bot.send_message(user_id, f"📋 Ошибки (страница {page + 1} из {total_pages}):", reply_markup=markup)
-
-
-@bot.callback_query_handler(func=lambda call: call.data in ["prev_error_page", "next_error_page"])
-def paginate_errors(call):
-    """Переключает страницы списка ошибок."""
-    bot.answer_callback_query(call.id)
-    user_id = str(call.message.chat.id)
-
-    if user_id not in user_context or "current_page" not in user_context[user_id]:
-        bot.send_message(user_id, "Ошибка: кеш данных устарел, попробуйте снова.")
-        return
-
-    if call.data == "prev_error_page":
-        user_context[user_id]["current_page"] -= 1
-    elif call.data == "next_error_page":
-        user_context[user_id]["current_page"] += 1
-
-    send_error_list(user_id)  # Отправляем обновленный список ошибок
-
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("clean_error:"))
-def handle_clean_error(call):
-    bot.answer_callback_query(call.id)
-    user_id = str(call.message.chat.id)
-
-    # Извлекаем хэш ошибки
-    error_hash = call.data.split(":", 1)[1]
-    error_map = user_context.get(user_id, {}).get("error_map", {})
-    error_key = error_map.get(error_hash)
-
-    # Проверяем, существует ли ошибка
-    if not error_key or error_key not in errors.get(user_id, {}):
-        bot.send_message(user_id, "Ошибка не найдена или уже удалена.")
-        return
-
-    count = errors[user_id][error_key]
-    bot.send_message(
-        user_id,
-        f"Вы выбрали ошибку: {error_key} (количество: {count}).\n"
-        "Введите:\n"
-        "- `0` для полного удаления ошибки;\n"
-        "- `число` на которое нужно изменить (например, 2).\n"
-        "Отправьте новое значение:".replace('←', '/'),
-        parse_mode="Markdown"
-    )
-    user_context[user_id]["clean_error"] = error_key  # Сохраняем текущую ошибку
-
-
-def generate_hash(data):
-    """Генерирует короткий хэш для данных"""
-    return hashlib.md5(data.encode('utf-8')).hexdigest()[:8]
-
-
-@bot.message_handler(
-    func=lambda message: str(message.chat.id) in user_context and "clean_error" in user_context[str(message.chat.id)])
-def handle_clean_error_input(message):
-    user_id = str(message.chat.id)
-    context = user_context[user_id]
-
-    # Получаем текущую ошибку, которую пользователь хочет изменить
-    error_key = context.get("clean_error")
-    if not error_key:
-        bot.send_message(user_id, "Контекст ошибки не найден. Попробуйте заново выбрать ошибку с помощью /clean_error.")
-        return
-
-    try:
-        # Парсим пользовательский ввод
-        input_value = int(message.text.strip())
-        if input_value < 0:
-            raise ValueError("Отрицательное значение не допускается!")
-
-        elif input_value == 0:
-            # Удаляем ошибку полностью
-            del errors[user_id][error_key]
-            bot.send_message(user_id, f"Ошибка '{error_key}' полностью удалена.".replace('←', '/'))
-        else:
-            # Уменьшаем количество ошибок
-            current_count = errors[user_id].get(error_key, 0)
-            new_count = input_value
-            if new_count >= current_count:
-                bot.send_message(user_id, f"Значение больше исходного не допускается!")
-            elif 0 < new_count < current_count:
-                errors[user_id][error_key] = new_count
-                bot.send_message(user_id,
-                                 f"Количество для ошибки '{error_key}' обновлено: {new_count}.".replace('←', '/'))
-
-        # Сохраняем обновления
-        save_json("errors.json", errors)
-
-    except ValueError:
-        bot.send_message(user_id, "Некорректное значение. Введите число 0 или больше.")
-    finally:
-        # Удаляем контекст для этой команды
-        user_context[user_id].pop("clean_error", None)
-
-
 # ========== Обработка команды /change_word ==========
 @bot.message_handler(commands=['change_word'])
 def change_word(message):
@@ -1852,6 +3700,7 @@ def handle_search_word_change(call):
     # Обновляем контекст
     user_context[user_id].update({
         "action": "search_word_change",
+        "state": State.CHANGE_WORD_SEARCH,
         "current_category": category_name,
         "category_hash": category_hash,
         "current_page": 0
@@ -1862,9 +3711,7 @@ def handle_search_word_change(call):
 
 
 # ========== Поиск слов для изменения ==========
-@bot.message_handler(func=lambda message:
-str(message.chat.id) in user_context and
-user_context[str(message.chat.id)].get("action") == "search_word_change")
+@state_handler(State.CHANGE_WORD_SEARCH)
 def handle_search_word_change_input(message):
     user_id = str(message.chat.id)
     search_query = message.text.strip().lower()
@@ -1887,6 +3734,7 @@ def handle_search_word_change_input(message):
     # Сохраняем результаты поиска
     context.update({
         "action": "select_word_to_edit",
+        "state": None,
         "filtered_words": filtered_words,
         "total_pages": (len(filtered_words) - 1) // WORDS_PER_PAGE + 1
     })
@@ -1973,6 +3821,7 @@ def handle_edit_word_selection(call):
     # Сохраняем данные для редактирования
     user_context[user_id].update({
         "action": "edit_word_input",
+        "state": State.CHANGE_WORD_INPUT,
         "selected_word": selected_word,
         "original_question": selected_word["question"]
     })
@@ -1992,9 +3841,7 @@ def handle_edit_word_selection(call):
 
 
 # ========== Обработка ввода новых данных ==========
-@bot.message_handler(func=lambda message:
-str(message.chat.id) in user_context and
-user_context[str(message.chat.id)].get("action") == "edit_word_input")
+@state_handler(State.CHANGE_WORD_INPUT)
 def handle_edit_word_input(message):
     user_id = str(message.chat.id)
     context = user_context[user_id]
@@ -2005,16 +3852,16 @@ def handle_edit_word_input(message):
         correct = correct.strip()
 
         # Валидация
-        if not wrong or not correct:
-            raise ValueError("Пустые строки")
-        if len(wrong) > 50 or len(correct) > 50:
-            raise ValueError("Слишком длинные варианты (>50 символов)")
-        if "←" in wrong:
-            raise ValueError("Недопустимый символ ← в вариантах")
+        new_question = f"{wrong}←{correct}"
+        error = validate_word_pair(wrong, correct) or word_format_error({"question": new_question, "correct": correct})
+        if error:
+            raise ValueError(error)
 
         # Обновляем слово
         category_name = context["current_category"]
-        new_question = f"{wrong}←{correct}"
+        if (normalize_word_key(new_question) != normalize_word_key(context["original_question"])
+                and is_duplicate_word(user_id, category_name, new_question)):
+            raise ValueError("Такое слово уже есть в категории")
 
         # Находим и заменяем в user_categories
         for idx, word in enumerate(user_categories[user_id][category_name]):
@@ -2023,15 +3870,15 @@ def handle_edit_word_input(message):
                     "question": new_question,
                     "correct": correct
                 }
+                index_remove_word(user_id, category_name, context["original_question"])
+                index_add_word(user_id, category_name, new_question)
                 break
 
-        # Обновляем ошибки
-        if user_id in errors:
-            if context["original_question"] in errors[user_id]:
-                errors[user_id][new_question] = errors[user_id].pop(context["original_question"])
-
         save_json("user_categories.json", user_categories)
-        save_json("errors.json", errors)
+
+        # Обновляем ошибки
+        if rename_error(user_id, category_name, context["original_question"], new_question):
+            save_json("errors.json", errors)
 
         bot.send_message(user_id, "✅ Слово успешно обновлено!")
 
@@ -2080,13 +3927,12 @@ def ask_for_search_word_change(call):
         return change_word(call.message)
 
     user_context[user_id]["category_hash"] = category_hash
-    user_context[user_id]["search_mode"] = True
+    user_context[user_id]["state"] = State.CHANGE_LIST_SEARCH
 
     bot.send_message(user_id, f"🔎 Введите часть слова, которое хотите изменить в категории '{category_name}':")
 
 
-@bot.message_handler(
-    func=lambda message: str(message.chat.id) in user_context and user_context[str(message.chat.id)].get("search_mode"))
+@state_handler(State.CHANGE_LIST_SEARCH)
 def search_word_to_change(message):
     """Фильтруем слова в категории по введенному запросу перед изменением."""
     user_id = str(message.chat.id)
@@ -2111,7 +3957,7 @@ def search_word_to_change(message):
         return
 
     user_context[user_id]["word_list"] = filtered_words
-    user_context[user_id]["search_mode"] = False
+    user_context[user_id]["state"] = None
 
     send_change_word_list(user_id)
 
@@ -2236,17 +4082,13 @@ def handle_edit_word(call):
 
     user_context[user_id] = {
         "action": "edit_word",
+        "state": State.EDIT_WORD_INPUT,
         "category": category_name,
         "word_hash": word_hash
     }
 
 
-@bot.message_handler(
-    func=lambda message: (
-            str(message.chat.id) in user_context
-            and user_context[str(message.chat.id)].get("action") == "edit_word"
-    )
-)
+@state_handler(State.EDIT_WORD_INPUT)
 def handle_change_word_input(message):
     user_id = str(message.chat.id)
     context = user_context[user_id]
@@ -2275,14 +4117,27 @@ def handle_change_word_input(message):
 
         word = next((w for w in words if generate_id(w["question"]) == word_hash), None)
 
+        wrong, correct = new_word_data[0].strip(), new_word_data[1].strip()
+        new_question = f"{wrong}←{correct}"
+        error = validate_word_pair(wrong, correct) or word_format_error({"question": new_question, "correct": correct})
+        if error:
+            bot.send_message(user_id, f"❌ Слово не изменено: {error}.")
+            return
+
+        if (word and normalize_word_key(new_question) != normalize_word_key(word["question"])
+                and is_duplicate_word(user_id, category, new_question)):
+            bot.send_message(user_id, f"🔁 Такое слово уже есть в категории '{category}'.")
+            user_context.pop(user_id, None)
+            return
+
         if word:
             old_question = word["question"]
-            word["question"] = f"{new_word_data[0].strip()}←{new_word_data[1].strip()}"
-            word["correct"] = new_word_data[1].strip()
+            word["question"] = new_question
+            word["correct"] = correct
+            index_remove_word(user_id, category, old_question)
+            index_add_word(user_id, category, new_question)
 
-            if user_id in errors and old_question in errors[user_id]:
-                error_count = errors[user_id].pop(old_question)
-                errors[user_id][word["question"]] = error_count
+            if rename_error(user_id, category, old_question, new_question):
                 save_json("errors.json", errors)
 
             save_json("user_categories.json", user_categories)
@@ -2293,6 +4148,331 @@ def handle_change_word_input(message):
     user_context.pop(user_id, None)
 
 
+# ========== Экспорт данных ==========
+EXPORT_FIELDS = ["user_id", "type", "category", "wrong", "correct", "errors"]
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+def iter_user_export_rows(user_id, category=None):
+    """Построчно выдаёт слова и ошибки пользователя, не копируя его данные целиком."""
+    for category_name in list(user_categories.get(user_id, {})):
+        if category is not None and category_name != category:
+            continue
+        for word in user_categories.get(user_id, {}).get(category_name, []):
+            yield {
+                "user_id": user_id,
+                "type": "word",
+                "category": category_name,
+                "wrong": word["question"].split("←")[0],
+                "correct": word["correct"],
+                "errors": "",
+            }
+
+    for category_name in list(errors.get(user_id, {})):
+        if category is not None and category_name != category:
+            continue
+        for question, count in list(errors.get(user_id, {}).get(category_name, {}).items()):
+            yield {
+                "user_id": user_id,
+                "type": "error",
+                "category": category_name,
+                "wrong": question.split("←")[0],
+                "correct": question.split("←")[1] if "←" in question else question,
+                "errors": count,
+            }
+
+
+def iter_all_export_rows(category=None):
+    """Строки экспорта по всем пользователям."""
+    for user_id in list(user_categories.keys() | errors.keys()):
+        yield from iter_user_export_rows(user_id, category)
+
+
+def write_export(rows, file, export_format):
+    """Записывает строки в файл в формате CSV или JSONL, возвращает их количество."""
+    count = 0
+    if export_format == "csv":
+        writer = csv.DictWriter(file, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def parse_export_args(text):
+    """Разбирает аргументы вида '/export [csv|jsonl] [категория]'."""
+    parts = text.split(maxsplit=2)[1:]
+    export_format = "csv"
+    if parts and parts[0].lower() in EXPORT_FORMATS:
+        export_format = parts.pop(0).lower()
+    category = " ".join(parts).strip() or None
+    return export_format, category
+
+
+def send_export(user_id, rows, export_format, file_name):
+    """Пишет строки во временный файл и отправляет его документом."""
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="", suffix=f".{export_format}",
+                                     delete=False) as file:
+        count = write_export(rows, file, export_format)
+        path = file.name
+    try:
+        if not count:
+            bot.send_message(user_id, "Нет данных для экспорта.")
+            return
+        with open(path, "rb") as file:
+            bot.send_document(user_id, file, visible_file_name=f"{file_name}.{export_format}",
+                              caption=f"Экспортировано строк: {count}")
+    finally:
+        os.remove(path)
+
+
+@bot.message_handler(commands=['export'])
+def export_user_data(message):
+    """Экспорт слов и ошибок пользователя: /export [csv|jsonl] [категория]."""
+    user_id = str(message.chat.id)
+    export_format, category = parse_export_args(message.text)
+    if category and category not in user_categories.get(user_id, {}) and category not in errors.get(user_id, {}):
+        bot.send_message(user_id, f"Категория '{category}' не найдена.")
+        return
+    send_export(user_id, iter_user_export_rows(user_id, category), export_format, f"export_{user_id}")
+
+
+@bot.message_handler(commands=['export_all'])
+def export_all_data(message):
+    """Экспорт данных всех пользователей (только для администраторов)."""
+    user_id = str(message.chat.id)
+    if not is_admin(user_id):
+        bot.send_message(user_id, "Команда доступна только администраторам.")
+        return
+    export_format, category = parse_export_args(message.text)
+    send_export(user_id, iter_all_export_rows(category), export_format, "export_all")
+
+
+# ========== Prometheus ==========
+def _prometheus_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_prometheus_metrics():
+    """Формирует метрики процесса в текстовом формате Prometheus."""
+    lines = []
+
+    def metric(name, metric_type, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_prometheus_label(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    def summary(name, help_text, prefix, label):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} summary")
+        with metrics_lock:
+            for metric_name, histogram in metrics.items():
+                if not metric_name.startswith(prefix):
+                    continue
+                label_text = f'{label}="{_prometheus_label(metric_name[len(prefix):])}"'
+                for quantile in (0.5, 0.95, 0.99):
+                    lines.append(f'{name}{{{label_text},quantile="{quantile}"}} '
+                                 f'{histogram.percentile(quantile * 100)}')
+                lines.append(f"{name}_sum{{{label_text}}} {histogram.total}")
+                lines.append(f"{name}_count{{{label_text}}} {histogram.count}")
+
+    with metrics_lock:
+        api_samples = [(name[len("api:"):], h.count, h.errors) for name, h in metrics.items()
+                       if name.startswith("api:")]
+        total_updates = updates_total
+
+    metric("bot_updates_total", "counter", "Обработано обновлений Telegram.", [({}, total_updates)])
+    metric("bot_updates_per_second", "gauge", "Обновлений в секунду (среднее за минуту).",
+           [({}, updates_per_second())])
+    metric("bot_user_context_size", "gauge", "Активные сессии в user_context.", [({}, len(user_context))])
+    metric("bot_add_word_context_size", "gauge", "Активные сессии в add_word_context.",
+           [({}, len(add_word_context))])
+    metric("bot_api_requests_total", "counter", "Запросы к Telegram API.",
+           [({"method": method}, count) for method, count, _ in api_samples])
+    metric("bot_api_request_failures_total", "counter", "Неудачные запросы к Telegram API.",
+           [({"method": method}, failures) for method, _, failures in api_samples])
+    summary("bot_api_request_seconds", "Длительность запросов к Telegram API.", "api:", "method")
+    summary("bot_persistence_flush_seconds", "Длительность записи файлов данных.", "save_json:", "file")
+    summary("bot_handler_seconds", "Длительность обработчиков.", "handler:", "handler")
+    summary("bot_scheduler_tick_seconds", "Длительность задач планировщика.", "scheduler:", "job")
+    metric("bot_scheduler_lag_seconds", "gauge", "Опоздание тика send_scheduled_quizzes относительно начала минуты.",
+           [({}, scheduler_lag)])
+    metric("process_resident_memory_bytes", "gauge", "Резидентная память процесса.", [({}, process_rss_bytes())])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Не засоряем вывод запросами Prometheus
+
+
+def start_metrics_server():
+    """Поднимает HTTP-сервер с /metrics в фоновом потоке, если задан METRICS_PORT."""
+    if not METRICS_PORT:
+        return None
+    server = ThreadingHTTPServer((METRICS_HOST, int(METRICS_PORT)), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ========== Статистика обработчиков ==========
+@bot.message_handler(commands=['stats'])
+def show_stats(message):
+    """Перцентили задержек обработчиков, запросов к API и записи на диск (только для администраторов)."""
+    user_id = str(message.chat.id)
+    if not is_admin(user_id):
+        bot.send_message(user_id, "Команда доступна только администраторам.")
+        return
+
+    with metrics_lock:
+        rows = [
+            (name, h.count, h.errors, h.total, h.percentile(50), h.percentile(95), h.percentile(99))
+            for name, h in metrics.items()
+        ]
+    if not rows:
+        bot.send_message(user_id, "Метрик пока нет.")
+        return
+
+    # Сначала самые "дорогие" по суммарному времени
+    rows.sort(key=lambda row: -row[3])
+    lines = [f"{'метрика':<40} {'вызовы':>7} {'ошибки':>6} {'p50':>8} {'p95':>8} {'p99':>8}"]
+    for name, count, error_count, _, p50, p95, p99 in rows:
+        lines.append(f"{name[:40]:<40} {count:>7} {error_count:>6} "
+                     f"{p50 * 1000:>6.1f}мс {p95 * 1000:>6.1f}мс {p99 * 1000:>6.1f}мс")
+
+    text = "\n".join(lines)
+    if len(text) > 4000:
+        text = text[:4000] + "\n…"
+    bot.send_message(user_id, f"<pre>{text}</pre>", parse_mode="HTML")
+
+
+# ========== Профилировщик ==========
+PROFILE_DEFAULT_HZ = 100
+PROFILE_MAX_HZ = 250  # Ограничение частоты выборок, чтобы профилирование было безопасно под нагрузкой
+PROFILE_DEFAULT_SECONDS = 60
+PROFILE_MAX_SECONDS = 300
+
+profiler = {}  # Состояние текущего сеанса профилирования
+profiler_lock = threading.Lock()
+
+
+def _collapse_stack(thread_name, frame):
+    """Стек потока в формате collapsed stacks (flamegraph.pl, speedscope)."""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    parts.append(thread_name)
+    return ";".join(reversed(parts))
+
+
+def _profiler_loop(owner_id, stop_event, interval, duration):
+    """Снимает стеки всех потоков по таймеру, по окончании отправляет результат владельцу."""
+    sampler_id = threading.get_ident()
+    samples = {}
+    sample_count = 0
+    started = time.monotonic()
+    deadline = started + duration
+    thread_names = {}
+
+    while not stop_event.wait(interval) and time.monotonic() < deadline:
+        frames = sys._current_frames()
+        if len(thread_names) != len(frames):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in frames.items():
+            if thread_id == sampler_id:
+                continue
+            stack = _collapse_stack(thread_names.get(thread_id, str(thread_id)), frame)
+            samples[stack] = samples.get(stack, 0) + 1
+        sample_count += 1
+
+    with profiler_lock:
+        profiler.clear()
+
+    elapsed = time.monotonic() - started
+    if not samples:
+        bot.send_message(owner_id, f"Профилирование завершено за {elapsed:.1f} с, выборок нет — файл не отправлен.")
+        return
+
+    file_name = time.strftime("profile-%Y%m%d-%H%M%S.folded")
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".folded", delete=False) as file:
+        for stack, count in sorted(samples.items(), key=lambda item: -item[1]):
+            file.write(f"{stack} {count}\n")
+        path = file.name
+    try:
+        with open(path, "rb") as file:
+            bot.send_document(owner_id, file, visible_file_name=file_name,
+                              caption=f"Профиль: {sample_count} выборок за {elapsed:.1f} с")
+    except Exception as e:
+        try:
+            bot.send_message(owner_id, f"❌ Не удалось отправить профиль: {e}")
+        except Exception as send_error:
+            print(f"Ошибка при отправке профиля: {e}; сообщение об ошибке не отправлено: {send_error}")
+    finally:
+        os.remove(path)
+
+
+@bot.message_handler(commands=['profile'])
+def profile_command(message):
+    """/profile start [частота, Гц] [длительность, с] | /profile stop (только для администраторов)."""
+    user_id = str(message.chat.id)
+    if not is_admin(user_id):
+        bot.send_message(user_id, "Команда доступна только администраторам.")
+        return
+
+    args = message.text.split()[1:]
+    action = args[0].lower() if args else ""
+
+    if action == "start":
+        try:
+            hz = int(args[1]) if len(args) > 1 else PROFILE_DEFAULT_HZ
+            duration = int(args[2]) if len(args) > 2 else PROFILE_DEFAULT_SECONDS
+        except ValueError:
+            bot.send_message(user_id, "Использование: /profile start [частота, Гц] [длительность, с]")
+            return
+        hz = min(max(hz, 1), PROFILE_MAX_HZ)
+        duration = min(max(duration, 1), PROFILE_MAX_SECONDS)
+
+        with profiler_lock:
+            if profiler:
+                bot.send_message(user_id, "Профилирование уже запущено. Остановите его: /profile stop")
+                return
+            stop_event = threading.Event()
+            profiler.update({"stop_event": stop_event, "owner": user_id})
+        threading.Thread(target=_profiler_loop, args=(user_id, stop_event, 1 / hz, duration),
+                         name="profiler", daemon=True).start()
+        bot.send_message(user_id, f"▶ Профилирование запущено: {hz} Гц, не дольше {duration} с.")
+    elif action == "stop":
+        with profiler_lock:
+            stop_event = profiler.get("stop_event")
+        if not stop_event:
+            bot.send_message(user_id, "Профилирование не запущено.")
+            return
+        stop_event.set()
+        bot.send_message(user_id, "⏹ Профилирование остановлено, файл скоро будет отправлен.")
+    else:
+        bot.send_message(user_id, "Использование: /profile start [частота, Гц] [длительность, с] или /profile stop")
+
+
 @bot.callback_query_handler(func=lambda call: True)
 def handle_stale_callbacks(call):
     user_id = str(call.message.chat.id)
@@ -2320,12 +4500,104 @@ def context_cleaner():
         cleanup_context()
         time.sleep(60)
 
-while True:
-     try:
-         bot.polling(none_stop=True, timeout=60)
-     except Exception as e:
-         # print(f"Ошибка polling: {e}. Перезапуск через 5 секунд...")
-         time.sleep(5)
 
-# Запуск бота
-bot.polling()
+instrument_handlers()
+
+# ========== Очередь обновлений после простоя ==========
+DRAIN_BACKLOG = os.getenv("DRAIN_BACKLOG", "1") == "1"  # Разобрать накопившиеся обновления перед polling
+DRAIN_BATCH_SIZE = 100  # Больше getUpdates за раз не отдаёт
+
+
+def collapse_backlog(updates):
+    """Оставляет из накопившихся обновлений только те, на которые есть смысл отвечать.
+
+    Контексты диалогов живут в памяти, поэтому ответы на вопросы и нажатия кнопок из прошлого
+    запуска отвечать некому. По каждому чату остаётся последняя команда: всё до неё она
+    заменяет, а всё после неё пользователь писал, не видя ответа бота. Если команд не было,
+    остаётся первое сообщение, и только для диалога, который ещё жив или сохранён (см. sessions.py).
+    """
+    chats = {}  # chat_id -> обновления чата по порядку
+    other = []
+    for update in updates:
+        message = update.message or (update.callback_query.message if update.callback_query else None)
+        if message is None:
+            other.append(update)
+            continue
+        chats.setdefault(str(message.chat.id), []).append(update)
+
+    kept = other
+    for user_id, chat_updates in chats.items():
+        commands = [update for update in chat_updates
+                    if update.message and (update.message.text or "").startswith("/")]
+        if commands:
+            kept.append(commands[-1])
+        elif user_id in user_context or user_id in add_word_context or user_id in saved_sessions:
+            # Ответ на вопрос, который пользователь видел; следующие он писал, не видя вердикта
+            kept.append(chat_updates[0])
+    return sorted(kept, key=lambda update: update.update_id)
+
+
+def drain_backlog():
+    """Забирает обновления, накопившиеся за время простоя, и обрабатывает их сжатыми.
+
+    Обновления разных чатов обрабатываются параллельно пулом потоков бота, а polling
+    продолжает со следующего после последнего забранного.
+    """
+    started = time.perf_counter()
+    updates = []
+    try:
+        while True:
+            # Короче секунды ожидание не задать: telebot заменяет 0 на таймаут по умолчанию
+            batch = bot.get_updates(offset=bot.last_update_id + 1, limit=DRAIN_BATCH_SIZE,
+                                    long_polling_timeout=1)
+            if batch:
+                updates.extend(batch)
+                bot.last_update_id = batch[-1].update_id
+            if len(batch) < DRAIN_BATCH_SIZE:
+                break
+    except Exception as e:
+        print(f"Не удалось забрать накопившиеся обновления: {e}")
+    if not updates:
+        return
+
+    kept = collapse_backlog(updates)
+    if kept:
+        bot.process_new_updates(kept)
+    record_metric("startup:drain_backlog", time.perf_counter() - started)
+    print(f"Накопившиеся обновления: {len(updates)}, обработано {len(kept)}, "
+          f"отброшено {len(updates) - len(kept)}")
+
+
+def finish_startup():
+    """Фоновая часть запуска: дождаться данных, запустить планировщик и построить индексы."""
+    started = time.perf_counter()
+    wait_for_data()
+    record_metric("startup:load_data", time.perf_counter() - started)
+    current_shared_deck()
+    get_reminder_slots()
+    plan_upcoming_reminders()
+    get_hardest_words()
+    get_streak_leaderboard()
+    threading.Thread(target=resume_broadcasts, name="broadcast", daemon=True).start()
+    threading.Thread(target=session_checkpointer, name="sessions", daemon=True).start()
+    threading.Thread(target=schedule_quiz, daemon=True).start()
+    if PREBUILD_INDEXES:
+        started = time.perf_counter()
+        build_word_indexes()
+        record_metric("startup:build_indexes", time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    start_metrics_server()
+    if DRAIN_BACKLOG:
+        drain_backlog()
+
+    # Polling начинается сразу, данные и индексы догружаются в фоне
+    threading.Thread(target=finish_startup, name="startup", daemon=True).start()
+
+    while True:
+        try:
+            bot.polling(none_stop=True, timeout=60)
+        except Exception as e:
+            # print(f"Ошибка polling: {e}. Перезапуск через 5 секунд...")
+            time.sleep(5)
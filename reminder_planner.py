@@ -0,0 +1,66 @@
+"""Напоминания-викторины, подготовленные заранее.
+
+Для пользователей ближайшего слота расписания бот заранее берёт из очереди повторения
+несколько самых срочных карточек и готовит по ним текст и клавиатуру в потоке
+планировщика, а в назначенную минуту остаётся взять готовый план и отправить.
+Разбор вопроса и клавиатуру отсюда использует и сам бот, так что заранее подготовленное
+сообщение не отличается от собранного на месте.
+"""
+import random
+
+from telebot.types import ReplyKeyboardMarkup, KeyboardButton
+
+REMINDER_TEXT = "🕰️ Время викторины!\nКатегория: {category}\nВыберите правильный ответ:"
+
+
+def parse_options(question):
+    """Варианты ответа (неверный, верный) из строки «неверный←верный» или None, если строка испорчена."""
+    parts = question.split("←")
+    if len(parts) != 2:
+        return None
+    wrong, correct = parts[0].strip(), parts[1].strip()
+    if not wrong or not correct:
+        return None
+    return wrong, correct
+
+
+def keyboard_json(first, second, one_row=True):
+    """Клавиатура с двумя вариантами, сериализованная в JSON (telebot передаёт строку как есть)."""
+    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    if one_row:
+        markup.add(KeyboardButton(first), KeyboardButton(second))
+    else:
+        markup.add(KeyboardButton(first))
+        markup.add(KeyboardButton(second))
+    return markup.to_json()
+
+
+def render(category, question, rng):
+    """Готовое напоминание по карточке или None, если вопрос испорчен."""
+    options = parse_options(question)
+    if not options:
+        return None
+    first, second = options if rng.random() < 0.5 else options[::-1]
+    return {
+        "category": category,
+        "question": question,
+        "correct": options[1],
+        "text": REMINDER_TEXT.format(category=category),
+        "keyboard": keyboard_json(first, second),
+    }
+
+
+def plan_batch(batch):
+    """Готовит напоминания для пользователей слота.
+
+    batch — список (пользователь, версия, seed, кандидаты), кандидаты — [(категория, вопрос), ...]
+    в порядке срочности. Возвращает список (пользователь, версия, [план, ...]) в том же порядке
+    кандидатов: если слово первого успеют удалить, бот возьмёт следующий.
+    """
+    result = []
+    for user_id, version, seed, candidates in batch:
+        rng = random.Random(seed)
+        plans = [plan for plan in (render(category, question, rng) for category, question in candidates) if plan]
+        if plans:
+            result.append((user_id, version, plans))
+    return result
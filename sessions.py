@@ -0,0 +1,107 @@
+"""Компактные снимки игровых сессий, чтобы викторина переживала перезапуск бота.
+
+Сессия викторины хранит не вопросы, а один байт на слово категории: число верных ответов
+подряд, входит ли слово в текущий круг, была ли по нему ошибка и задано ли оно сейчас.
+Слова берутся из категории при восстановлении; контрольная сумма вопросов гарантирует,
+что категория с тех пор не менялась. Глобальной игре достаточно seed и позиции
+перестановки (см. shared_deck.permute) и версии колоды.
+
+Формат файла (числа little-endian):
+    заголовок  b"BOTSESS1" и u32 число сессий
+    сессия     u16 длина id пользователя, id в UTF-8, u32 длина записи, запись
+    викторина  <BHdI: вид, номер круга, время начала, контрольная сумма вопросов;
+               u16 длина названия категории и название; u32 число слов и байт на слово
+    игра       <BQIBQQQ: вид, seed, позиция, задан ли вопрос, версия колоды
+"""
+import os
+import struct
+import tempfile
+import zlib
+
+MAGIC = b"BOTSESS1"
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+QUIZ_HEADER = struct.Struct("<BHdI")
+GLOBAL_RECORD = struct.Struct("<BQIBQQQ")
+
+QUIZ, GLOBAL_GAME = 1, 2
+
+# Байт слова в сессии викторины
+CORRECT_MASK = 0b11  # Верных ответов подряд (слово освоено на 2)
+IN_ROUND = 1 << 2  # Ещё не задано в текущем круге
+SESSION_ERROR = 1 << 3  # Была ошибка в этой сессии
+CURRENT = 1 << 4  # Задано сейчас и ждёт ответа
+
+
+def fingerprint(questions):
+    """Контрольная сумма вопросов категории в порядке сессии."""
+    checksum = 0
+    for question in questions:
+        checksum = zlib.crc32(question["question"].encode("utf-8") + b"\0", checksum)
+    return checksum
+
+
+def encode_quiz(category, round_number, start_time, checksum, flags):
+    name = category.encode("utf-8")
+    return b"".join((QUIZ_HEADER.pack(QUIZ, round_number, start_time, checksum),
+                     U16.pack(len(name)), name, U32.pack(len(flags)), bytes(flags)))
+
+
+def encode_global(seed, position, has_current, deck_version):
+    return GLOBAL_RECORD.pack(GLOBAL_GAME, seed, position, has_current, *deck_version)
+
+
+def decode(record):
+    """Словарь с полями сессии; вид сессии — в "kind"."""
+    if record[0] == GLOBAL_GAME:
+        _, seed, position, has_current, *deck_version = GLOBAL_RECORD.unpack(record)
+        return {"kind": GLOBAL_GAME, "seed": seed, "position": position, "has_current": bool(has_current),
+                "deck_version": tuple(deck_version)}
+    _, round_number, start_time, checksum = QUIZ_HEADER.unpack_from(record)
+    position = QUIZ_HEADER.size
+    (length,) = U16.unpack_from(record, position)
+    position += U16.size
+    category = record[position:position + length].decode("utf-8")
+    position += length
+    (count,) = U32.unpack_from(record, position)
+    position += U32.size
+    return {"kind": QUIZ, "category": category, "round_number": round_number, "start_time": start_time,
+            "checksum": checksum, "flags": record[position:position + count]}
+
+
+def load(path):
+    """Сессии из файла: {id пользователя: запись}. Записи декодируются при восстановлении."""
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return {}
+    if data[:len(MAGIC)] != MAGIC:
+        print(f"{path}: неизвестный формат, сессии не восстановлены")
+        return {}
+    position = len(MAGIC)
+    (count,) = U32.unpack_from(data, position)
+    position += U32.size
+    records = {}
+    for _ in range(count):
+        (length,) = U16.unpack_from(data, position)
+        position += U16.size
+        user_id = data[position:position + length].decode("utf-8")
+        position += length
+        (length,) = U32.unpack_from(data, position)
+        position += U32.size
+        records[user_id] = data[position:position + length]
+        position += length
+    return records
+
+
+def save(path, records):
+    """Атомарно записывает {id пользователя: запись}."""
+    parts = [MAGIC, U32.pack(len(records))]
+    for user_id, record in records.items():
+        key = user_id.encode("utf-8")
+        parts += (U16.pack(len(key)), key, U32.pack(len(record)), record)
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False, suffix=".tmp") as file:
+        file.write(b"".join(parts))
+    os.replace(file.name, path)
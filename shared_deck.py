@@ -0,0 +1,114 @@
+"""Общая колода (categories_for_all_users) в виде неизменяемого файла для mmap.
+
+Колода компилируется из categories_for_all_users.json в файл с таблицей смещений и пулом
+строк UTF-8. Каждый процесс бота отображает файл в память без копирования, а игровые
+сессии хранят только номера вопросов. При добавлении слов файл собирается заново во
+временный и атомарно подменяется (os.replace); уже открытые отображения продолжают
+видеть старую версию, поэтому номера в идущих сессиях остаются верными.
+
+Порядок вопросов в игре задаёт permute(): сессии достаточно хранить seed и позицию.
+
+Формат (числа little-endian):
+    заголовок  b"BOTDECK1" и <Q: число вопросов
+    границы    (2 × число вопросов + 1) × u64 — границы строк в пуле: вопрос, ответ, вопрос, ...
+    пул        строки UTF-8 подряд
+"""
+import mmap
+import os
+import struct
+import tempfile
+
+MAGIC = b"BOTDECK1"
+HEADER = struct.Struct("<Q")
+BOUNDS = struct.Struct("<QQQ")
+DATA_POS = len(MAGIC) + HEADER.size
+
+
+def compile_deck(path, categories):
+    """Атомарно записывает колоду из словаря {категория: [{"question", "correct"}, ...]}."""
+    pool = bytearray()
+    bounds = [0]
+    for questions in categories.values():
+        for question in questions:
+            for text in (question["question"], question["correct"]):
+                pool += text.encode("utf-8")
+                bounds.append(len(pool))
+    count = (len(bounds) - 1) // 2
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False, suffix=".tmp") as file:
+        try:
+            file.write(MAGIC + HEADER.pack(count))
+            file.write(struct.pack(f"<{len(bounds)}Q", *bounds))
+            file.write(pool)
+        except BaseException:
+            file.close()
+            os.unlink(file.name)
+            raise
+    os.replace(file.name, path)
+
+
+class SharedDeck:
+    """Отображённая в память версия колоды. Вопрос доступен по номеру."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self.version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: не файл колоды")
+        (self.count,) = HEADER.unpack_from(self.buffer, len(MAGIC))
+        self.pool_pos = DATA_POS + (2 * self.count + 1) * 8
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """Вопрос в том же виде, что и в categories_for_all_users: {"question", "correct"}."""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start, middle, end = BOUNDS.unpack_from(self.buffer, DATA_POS + 2 * index * 8)
+        pool = self.pool_pos
+        return {
+            "question": str(self.buffer[pool + start:pool + middle], "utf-8"),
+            "correct": str(self.buffer[pool + middle:pool + end], "utf-8"),
+        }
+
+
+PERMUTATION_ROUNDS = 4
+_MIX = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+def _round_keys(seed):
+    keys = []
+    for _ in range(PERMUTATION_ROUNDS):
+        seed = (seed + _MIX) & _MASK64
+        value = (seed ^ (seed >> 30)) * 0xBF58476D1CE4E5B9 & _MASK64
+        keys.append(value ^ (value >> 31))
+    return keys
+
+
+def permute(position, size, seed):
+    """Элемент номер position случайной перестановки чисел 0..size-1, заданной seed.
+
+    Сеть Фейстеля переставляет числа в диапазоне 0..4^h (ближайшая степень сверху),
+    а значения вне 0..size-1 пропускаются повторным применением (cycle walking).
+    Ни перестановка, ни её часть в памяти не хранятся.
+    """
+    if not 0 <= position < size:
+        raise IndexError(position)
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    keys = _round_keys(seed)
+    value = position
+    while True:
+        left, right = value >> half_bits, value & mask
+        for key in keys:
+            mixed = (right ^ key) * _MIX & _MASK64
+            left, right = right, left ^ ((mixed ^ (mixed >> 29)) & mask)
+        value = (left << half_bits) | right
+        if value < size:
+            return value
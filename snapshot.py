@@ -0,0 +1,375 @@
+"""Компактный двоичный снимок состояния бота (user_categories, errors).
+
+Файл отображается в память (mmap), при открытии читаются только заголовок и индекс,
+а данные пользователя декодируются при первом обращении к его ключу. Все строки
+(ключи, категории, вопросы) хранятся один раз в общей таблице. Таблица только
+дополняется, поэтому при сохранении нетронутые записи копируются байтами без декодирования.
+
+Формат (числа little-endian):
+    заголовок  b"BOTSNAP1" и <QQQQQ: число строк, смещения таблицы границ строк, пула строк,
+               индекса и число записей верхнего уровня
+    границы    (число строк + 1) × u64 — границы строк в пуле
+    пул        строки в UTF-8 подряд
+    индекс     на каждую запись: u32 номер строки-ключа, u64 смещение значения, u32 его длина
+    значения   тег (1 байт) и данные: None, bool, int64, float64, строка (u32 номер),
+               список (u32 длина + элементы), словарь (u32 длина + пары «номер ключа, значение»)
+
+Конвертация:
+    python snapshot.py to-snap user_categories.json   # → user_categories.snap
+    python snapshot.py to-json user_categories.snap   # → user_categories.json
+    python snapshot.py compact user_categories.snap   # убрать неиспользуемые строки
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections.abc import ItemsView, KeysView, ValuesView
+
+MAGIC = b"BOTSNAP1"
+HEADER = struct.Struct("<QQQQQ")
+INDEX_ENTRY = struct.Struct("<IQI")
+U32 = struct.Struct("<I")
+U64 = struct.Struct("<Q")
+INT64 = struct.Struct("<q")
+FLOAT64 = struct.Struct("<d")
+
+TAG_NONE, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_FLOAT, TAG_STR, TAG_LIST, TAG_DICT, TAG_BIGINT = range(9)
+STR_PREFIX, LIST_PREFIX, DICT_PREFIX = bytes((TAG_STR,)), bytes((TAG_LIST,)), bytes((TAG_DICT,))
+
+
+def snapshot_path(json_path):
+    """Путь к снимку рядом с JSON-файлом: user_categories.json → user_categories.snap."""
+    return os.path.splitext(json_path)[0] + ".snap"
+
+
+class StringTable:
+    """Таблица строк снимка: декодирует строки по требованию и выдаёт номера новым."""
+
+    def __init__(self, buffer=None, offsets_pos=0, pool_pos=0, count=0):
+        self.buffer = buffer
+        self.offsets_pos = offsets_pos
+        self.pool_pos = pool_pos
+        self.count = count  # Строк в файле
+        self.cache = [None] * count
+        # Строка -> номер для уже декодированных строк. Декодированные записи при сохранении
+        # получают прежние номера; строку, которую ещё не читали, допишем заново (уберёт compact)
+        self.ids = {}
+        self.added = []  # Строки, появившиеся после открытия файла
+
+    def rebind(self, buffer, offsets_pos, pool_pos, count):
+        """Переключает таблицу на новый файл, в который дописаны строки из added."""
+        self.buffer, self.offsets_pos, self.pool_pos = buffer, offsets_pos, pool_pos
+        self.cache += self.added
+        self.count = count
+        self.added = []
+
+    def __getitem__(self, index):
+        value = self.cache[index] if index < self.count else self.added[index - self.count]
+        if value is None:
+            start, end = struct.unpack_from("<QQ", self.buffer, self.offsets_pos + index * 8)
+            value = self.cache[index] = str(self.buffer[self.pool_pos + start:self.pool_pos + end], "utf-8")
+            self.ids[value] = index
+        return value
+
+    def id_of(self, text):
+        index = self.ids.get(text)
+        if index is None:
+            index = self.ids[text] = self.count + len(self.added)
+            self.added.append(text)
+        return index
+
+
+class Snapshot:
+    """Открытый файл снимка."""
+
+    def __init__(self, path, strings=None):
+        self.path = path
+        with open(path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: не файл снимка")
+        count, offsets_pos, pool_pos, index_pos, entries = HEADER.unpack_from(self.buffer, len(MAGIC))
+        self.offsets_pos, self.pool_pos, self.string_count = offsets_pos, pool_pos, count
+        if strings is None:
+            strings = StringTable(self.buffer, offsets_pos, pool_pos, count)
+        else:
+            strings.rebind(self.buffer, offsets_pos, pool_pos, count)
+        self.strings = strings
+        self.entries = {}  # Ключ -> (смещение, длина) закодированного значения
+        for position in range(index_pos, index_pos + entries * INDEX_ENTRY.size, INDEX_ENTRY.size):
+            key_id, offset, length = INDEX_ENTRY.unpack_from(self.buffer, position)
+            self.entries[strings[key_id]] = (offset, length)
+
+    def decode(self, key):
+        offset, _ = self.entries[key]
+        return _decode(self.buffer, offset, self.strings)[0]
+
+    def raw(self, key):
+        offset, length = self.entries[key]
+        return self.buffer[offset:offset + length]
+
+
+def _decode(buffer, position, strings):
+    tag = buffer[position]
+    position += 1
+    if tag == TAG_STR:
+        return strings[U32.unpack_from(buffer, position)[0]], position + 4
+    if tag == TAG_DICT:
+        (size,) = U32.unpack_from(buffer, position)
+        position += 4
+        result = {}
+        for _ in range(size):
+            key = strings[U32.unpack_from(buffer, position)[0]]
+            result[key], position = _decode(buffer, position + 4, strings)
+        return result, position
+    if tag == TAG_LIST:
+        (size,) = U32.unpack_from(buffer, position)
+        position += 4
+        result = []
+        for _ in range(size):
+            item, position = _decode(buffer, position, strings)
+            result.append(item)
+        return result, position
+    if tag == TAG_INT:
+        return INT64.unpack_from(buffer, position)[0], position + 8
+    if tag == TAG_FLOAT:
+        return FLOAT64.unpack_from(buffer, position)[0], position + 8
+    if tag == TAG_NONE:
+        return None, position
+    if tag == TAG_FALSE:
+        return False, position
+    if tag == TAG_TRUE:
+        return True, position
+    if tag == TAG_BIGINT:
+        return int(strings[U32.unpack_from(buffer, position)[0]]), position + 4
+    raise ValueError(f"Неизвестный тег {tag} в позиции {position - 1}")
+
+
+def _encode(value, out, strings):
+    if isinstance(value, str):
+        out += STR_PREFIX + U32.pack(strings.id_of(value))
+    elif isinstance(value, dict):
+        out += DICT_PREFIX + U32.pack(len(value))
+        for key, item in value.items():
+            out += U32.pack(strings.id_of(str(key)))
+            _encode(item, out, strings)
+    elif isinstance(value, (list, tuple)):
+        out += LIST_PREFIX + U32.pack(len(value))
+        for item in value:
+            _encode(item, out, strings)
+    elif value is None:
+        out.append(TAG_NONE)
+    elif value is True or value is False:
+        out.append(TAG_TRUE if value else TAG_FALSE)
+    elif isinstance(value, int):
+        if -2 ** 63 <= value < 2 ** 63:
+            out += bytes((TAG_INT,)) + INT64.pack(value)
+        else:
+            out += bytes((TAG_BIGINT,)) + U32.pack(strings.id_of(str(value)))
+    elif isinstance(value, float):
+        out += bytes((TAG_FLOAT,)) + FLOAT64.pack(value)
+    else:
+        raise TypeError(f"Тип {type(value).__name__} нельзя сохранить в снимок")
+
+
+class SnapshotDict(dict):
+    """Словарь верхнего уровня, значения которого декодируются из снимка при первом обращении."""
+
+    def __init__(self, snapshot):
+        super().__init__()
+        self.snapshot = snapshot
+        self.pending = dict.fromkeys(snapshot.entries)  # Ключи, которые ещё не декодированы
+        self.lock = threading.Lock()
+
+    def _decode(self, key):
+        with self.lock:
+            if key in self.pending:
+                dict.__setitem__(self, key, self.snapshot.decode(key))
+                del self.pending[key]
+
+    def __getitem__(self, key):
+        if key in self.pending:
+            self._decode(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self.pending:
+            self._decode(key)
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.pending
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.pending.pop(key, None)
+            dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        with self.lock:
+            if key in self.pending:
+                del self.pending[key]
+            else:
+                dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if key in self.pending:
+            self._decode(key)
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+            dict.clear(self)
+
+    def popitem(self):
+        for key in self.pending:
+            self._decode(key)
+            break
+        return dict.popitem(self)
+
+    def __len__(self):
+        return dict.__len__(self) + len(self.pending)
+
+    def __iter__(self):
+        # Ключи без декодирования значений; копия — словарь может меняться при обходе
+        return iter(list(dict.keys(self)) + list(self.pending))
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def copy(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        return dict(self.items()) == other
+
+    def __repr__(self):
+        return f"SnapshotDict({self.snapshot.path!r}, {len(self)} записей, {len(self.pending)} не декодировано)"
+
+
+def load(path):
+    """Открывает снимок и возвращает SnapshotDict."""
+    return SnapshotDict(Snapshot(path))
+
+
+def save(path, data):
+    """Атомарно записывает словарь data в снимок path.
+
+    Если data — SnapshotDict, записи, которые ещё не декодированы, копируются из старого
+    файла байтами, а таблица строк дополняется новыми. После сохранения data переключается
+    на новый файл.
+    """
+    if isinstance(data, SnapshotDict):
+        # Файл и таблицу строк берём под блокировкой: параллельное сохранение их заменяет
+        with data.lock:
+            data.snapshot = _write(path, list(dict.items(data)), list(data.pending), data.snapshot)
+    else:
+        _write(path, list(data.items()), [], None)
+
+
+def _write(path, decoded, pending, base):
+    strings = base.strings if base else StringTable()
+    blobs = []
+    for key in pending:
+        blobs.append((strings.id_of(key), base.raw(key)))
+    for key, value in decoded:
+        out = bytearray()
+        _encode(value, out, strings)
+        blobs.append((strings.id_of(str(key)), out))
+
+    # Пул и границы старой таблицы копируются как есть, новые строки дописываются в конец
+    if base:
+        old_offsets = base.buffer[base.offsets_pos:base.offsets_pos + (base.string_count + 1) * 8]
+        old_pool_end = U64.unpack_from(old_offsets, base.string_count * 8)[0]
+        old_pool = base.buffer[base.pool_pos:base.pool_pos + old_pool_end]
+    else:
+        old_offsets, old_pool_end, old_pool = U64.pack(0), 0, b""
+    new_strings = [text.encode("utf-8") for text in strings.added]
+    boundaries = bytearray()
+    end = old_pool_end
+    for encoded in new_strings:
+        end += len(encoded)
+        boundaries += U64.pack(end)
+
+    count = strings.count + len(new_strings)
+    offsets_pos = len(MAGIC) + HEADER.size
+    pool_pos = offsets_pos + (count + 1) * 8
+    index_pos = pool_pos + end
+    data_pos = index_pos + len(blobs) * INDEX_ENTRY.size
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False, suffix=".tmp") as file:
+        try:
+            file.write(MAGIC + HEADER.pack(count, offsets_pos, pool_pos, index_pos, len(blobs)))
+            file.write(old_offsets)
+            file.write(boundaries)
+            file.write(old_pool)
+            for encoded in new_strings:
+                file.write(encoded)
+            position = data_pos
+            for key_id, blob in blobs:
+                file.write(INDEX_ENTRY.pack(key_id, position, len(blob)))
+                position += len(blob)
+            for _, blob in blobs:
+                file.write(blob)
+        except BaseException:
+            file.close()
+            os.unlink(file.name)
+            raise
+    os.replace(file.name, path)
+
+    # Номера строк сохраняются: таблица нового файла начинается со старой
+    return Snapshot(path, strings) if base else None
+
+
+def convert_to_snapshot(json_path, snap_path=None):
+    with open(json_path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    if not isinstance(data, dict):
+        raise ValueError(f"{json_path}: снимок хранит только словари верхнего уровня")
+    save(snap_path or snapshot_path(json_path), data)
+
+
+def compact(snap_path):
+    """Переписывает снимок с нуля, убирая из таблицы строки, на которые больше нет ссылок."""
+    save(snap_path, dict(load(snap_path).items()))
+
+
+def convert_to_json(snap_path, json_path=None):
+    data = load(snap_path)
+    with open(json_path or os.path.splitext(snap_path)[0] + ".json", "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Конвертация файлов данных бота в снимки и обратно")
+    parser.add_argument("command", choices=("to-snap", "to-json", "compact"))
+    parser.add_argument("source")
+    parser.add_argument("target", nargs="?")
+    args = parser.parse_args()
+    if args.command == "to-snap":
+        convert_to_snapshot(args.source, args.target)
+    elif args.command == "to-json":
+        convert_to_json(args.source, args.target)
+    else:
+        compact(args.source)
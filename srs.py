@@ -0,0 +1,113 @@
+"""Интервальное повторение слов по алгоритму SM-2.
+
+Карточка — список [лёгкость, интервал в днях, число успешных повторений подряд, время
+следующего повторения (unix time)], так она компактно хранится в srs.json:
+
+    {пользователь: {категория: {вопрос: карточка}}}
+
+Очередь пользователя — мин-куча по времени повторения, поэтому следующая карточка
+находится за O(log n) без просмотра всех карточек. После ответа в кучу добавляется новая
+запись, а старая считается устаревшей и выбрасывается, когда оказывается наверху.
+"""
+import heapq
+
+EASE, INTERVAL, REPETITIONS, DUE = range(4)
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+DAY = 24 * 60 * 60
+RELEARN_DELAY = 10 * 60  # Ошибочный ответ: повторить в ближайшей сессии, а не через сутки
+
+QUALITY_CORRECT = 4  # Оценки ответа по шкале SM-2 (0–5); в боте ответ только верный или нет
+QUALITY_WRONG = 1
+
+
+def new_card(now):
+    """Карточка нового слова: её нужно повторить сразу."""
+    return [DEFAULT_EASE, 0, 0, int(now)]
+
+
+def review(card, quality, now):
+    """Пересчитывает карточку после ответа с оценкой quality (0–5)."""
+    ease, interval, repetitions = card[EASE], card[INTERVAL], card[REPETITIONS]
+    if quality < 3:
+        repetitions = 0
+        interval = 0
+        due = now + RELEARN_DELAY
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = round(interval * ease)
+        due = now + interval * DAY
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    card[:] = [round(ease, 2), interval, repetitions, int(due)]
+    return card
+
+
+class DueQueue:
+    """Карточки одного пользователя, упорядоченные по времени повторения."""
+
+    def __init__(self, cards):
+        self.cards = cards  # {категория: {вопрос: карточка}} — общий объект с srs.json
+        self.heap = [(card[DUE], category, question)
+                     for category, questions in cards.items() for question, card in questions.items()]
+        heapq.heapify(self.heap)
+        self.size = len(self.heap)  # Число карточек (записей в куче может быть больше)
+
+    def _card(self, category, question):
+        return self.cards.get(category, {}).get(question)
+
+    def push(self, category, question, new=False):
+        """Добавляет запись для новой или изменённой карточки."""
+        card = self._card(category, question)
+        if card is None:
+            return
+        if new:
+            self.size += 1
+        heapq.heappush(self.heap, (card[DUE], category, question))
+        if len(self.heap) > 2 * self.size + 16:
+            self._compact()
+
+    def _compact(self):
+        self.heap = [entry for entry in self.heap if not self._stale(entry)]
+        heapq.heapify(self.heap)
+
+    def _stale(self, entry):
+        card = self._card(entry[1], entry[2])
+        return card is None or card[DUE] != entry[0]
+
+    def peek(self):
+        """Карточка с самым ранним временем повторения: (время, категория, вопрос) или None."""
+        while self.heap and self._stale(self.heap[0]):
+            heapq.heappop(self.heap)
+        return self.heap[0] if self.heap else None
+
+    def next_due(self, now):
+        """Ближайшая карточка, время которой уже наступило, или None."""
+        entry = self.peek()
+        return entry if entry and entry[0] <= now else None
+
+    def upcoming(self, count):
+        """До count ближайших карточек по времени повторения, без удаления из очереди."""
+        entries = []
+        seen = set()
+        while len(entries) < count and self.peek():
+            entry = heapq.heappop(self.heap)
+            if entry[1:] not in seen:  # После быстрых повторных ответов у карточки бывают две одинаковые записи
+                seen.add(entry[1:])
+                entries.append(entry)
+        for entry in entries:
+            heapq.heappush(self.heap, entry)
+        return entries
+
+    def discard(self, category, question):
+        """Удаляет карточку (например, слово удалили из категории)."""
+        questions = self.cards.get(category)
+        if questions and questions.pop(question, None) is not None:
+            self.size -= 1
+            if not questions:
+                del self.cards[category]
@@ -0,0 +1,73 @@
+"""Статистика ответов пользователя, которая обновляется при каждом ответе.
+
+Сводка хранится списком, так она компактно лежит в user_stats.json:
+
+    [ответов, верных, лучшая серия в глобальной игре, номер последнего дня,
+     [ответов, верных] × WINDOW дней подряд по кругу, {категория: [ответов, верных]}]
+
+Дни — кольцевой буфер: ячейка дня — его номер по модулю WINDOW, при переходе на новый
+день ячейки пропущенных дней обнуляются. Поэтому отчёт строится за O(категорий) без
+просмотра истории ответов.
+"""
+import datetime
+
+ANSWERS, CORRECT, BEST_STREAK, LAST_DAY, DAYS, CATEGORIES = range(6)
+
+WINDOW = 30  # Дней в кольцевом буфере
+
+
+def day_number(now):
+    """Номер дня по местному времени."""
+    return datetime.date.fromtimestamp(now).toordinal()
+
+
+def new_stats(now):
+    return [0, 0, 0, day_number(now), [0] * (2 * WINDOW), {}]
+
+
+def _advance(stats, today):
+    """Обнуляет ячейки дней, прошедших с последнего ответа."""
+    last = stats[LAST_DAY]
+    if today <= last:
+        return
+    days = stats[DAYS]
+    for day in range(max(last + 1, today - WINDOW + 1), today + 1):
+        slot = 2 * (day % WINDOW)
+        days[slot] = days[slot + 1] = 0
+    stats[LAST_DAY] = today
+
+
+def record_answer(stats, category, correct, now):
+    """Учитывает ответ; category None — ответ вне категорий (глобальная игра)."""
+    _advance(stats, day_number(now))
+    stats[ANSWERS] += 1
+    slot = 2 * (stats[LAST_DAY] % WINDOW)
+    stats[DAYS][slot] += 1
+    if correct:
+        stats[CORRECT] += 1
+        stats[DAYS][slot + 1] += 1
+    if category is not None:
+        totals = stats[CATEGORIES].setdefault(category, [0, 0])
+        totals[0] += 1
+        totals[1] += bool(correct)
+
+
+def record_streak(stats, streak):
+    """Обновляет лучшую серию верных ответов в глобальной игре."""
+    if streak > stats[BEST_STREAK]:
+        stats[BEST_STREAK] = streak
+        return True
+    return False
+
+
+def recent(stats, now, days=WINDOW):
+    """Ответы и верные ответы по дням за последние days дней, от старых к новым."""
+    today = day_number(now)
+    result = []
+    for day in range(today - min(days, WINDOW) + 1, today + 1):
+        if day > stats[LAST_DAY] or day <= stats[LAST_DAY] - WINDOW:
+            result.append((0, 0))  # Ещё не было ответов или ячейка уже занята другим днём
+        else:
+            slot = 2 * (day % WINDOW)
+            result.append((stats[DAYS][slot], stats[DAYS][slot + 1]))
+    return result